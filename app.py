@@ -2,8 +2,19 @@
 淘宝/京东个性化定价模拟器 (垂直流式布局)
 """
 
+import os
+
 import streamlit as st
 
+import metrics
+import result_cache
+from pricing import (
+    PRODUCTS, USER_TYPE_MAP, SPENDING_RANGES, DEVICE_MAP, ACTIVITY_LEVELS, FREQ_MAP,
+    RETURN_OPTIONS, PURCHASE_PERIOD_MAP, CART_MAP, HISTORY_CATEGORY_MAP,
+    normalize_spending, map_activity_to_score, map_return_rate, get_spending_value,
+)
+from rules import get_rules
+
 # ==========================================
 # 1. 全局配置与状态管理
 # ==========================================
@@ -17,15 +28,6 @@ st.set_page_config(
 if 'is_revealed' not in st.session_state:
     st.session_state.is_revealed = False
 
-# 商品配置库
-PRODUCTS = {
-    "无线耳机": {"base": 599, "desc": "🎧 热门款真无线蓝牙耳机", "category": "数码"},
-    "运动鞋": {"base": 199, "desc": "👟 新款缓震运动跑鞋", "category": "服饰"},
-    "轻薄笔记本": {"base": 4999, "desc": "💻 最新款超薄笔记本电脑", "category": "数码"},
-    "智能手表": {"base": 1299, "desc": "⌚️ 多功能健康监测智能手表", "category": "数码"},
-    "美妆礼盒": {"base": 899, "desc": "💄 高端护肤品套装", "category": "美妆"}
-}
-
 # ==========================================
 # 2. 样式优化 (CSS)
 # ==========================================
@@ -126,173 +128,66 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ==========================================
-# 3. 核心算法逻辑
+# 3. 定价调用 (核心算法见 pricing.py)
 # ==========================================
 
-def calculate_price_logic(base_price, user_profile):
+# 预计算价格表开关：设置环境变量 USE_PRICE_TABLE=1 后启动时加载/构建穷举价格表，
+# 之后每次重跑只做 O(1) 查表
+USE_PRICE_TABLE = os.environ.get("USE_PRICE_TABLE", "0") == "1"
+
+@st.cache_resource(show_spinner="正在预计算价格表...", max_entries=4)
+def get_price_table(rules_digest):
+    # rules_digest 只用作缓存键 (函数体内有意不使用)：规则热加载后哈希变化，自动换用新表。
+    # 不能改成 _rules_digest，st.cache_* 不会对下划线开头的参数求哈希；下面几个缓存函数同理
+    import price_table
+    return price_table.load_or_build(PRODUCTS)
+
+def session_pricer():
+    """每个会话一个增量定价器：控件变化时只重算读取了该字段的规则 (规则集热加载后自动失效)"""
+    if "pricer" not in st.session_state:
+        from incremental import IncrementalPricer
+        st.session_state.pricer = IncrementalPricer()
+    return st.session_state.pricer
+
+# 商品目录：设置 PRICE_SIM_CATALOG 指向 catalog.py 构建的目录后，从内存映射的列式文件中选择商品，
+# 否则使用内置的 PRODUCTS
+CATALOG_PATH = os.environ.get("PRICE_SIM_CATALOG")
+CATALOG_PAGE_SIZE = 50
+# population.py --store 写入的模拟结果所在目录
+RUNS_DIR = os.environ.get("PRICE_SIM_RUNS", os.path.join(".cache", "runs"))
+
+@st.cache_resource(show_spinner=False)
+def get_catalog(path):
+    import catalog
+    return catalog.Catalog.open(path) if path else catalog.Catalog.from_products(PRODUCTS)
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def search_catalog(path, query, category):
+    """关键词 + 类别检索结果 (升序商品编号)，翻页时不重复检索"""
+    return get_catalog(path).search(query, category)
+
+def lookup_or_calculate(base_price, user_profile, product_name):
     """
-    高级定价算法
+    返回 (价格, 因素明细)。价格表开启且命中时只查表，因素明细为 None (第一次揭晓时再算)；
+    否则增量重算一次规则链，价格与因素明细一并得到
     """
-    # 因素分析数据容器
-    factors = []
-
-    current_price = base_price
-
-    # 1. 用户身份 (新客 vs 老用户)
-    if user_profile["user_type"] == "new":
-        change = -0.15 * base_price
-        factors.append({"name": "新客首单礼", "change": change, "type": "优惠"})
-    elif user_profile["user_type"] == "loyal":
-        change = 0.05 * base_price
-        factors.append({"name": "老客隐形溢价", "change": change, "type": "加价"})
-    else:
-        change = 0
-        factors.append({"name": "普通用户", "change": 0, "type": "中性"})
-
-    current_price += change
-
-    # 2. 设备与消费能力 (交互效应)
-    spending_score = user_profile["spending_level_norm"]
-    device = user_profile["device"]
-
-    device_markup = 0
-    # 苹果(iPhone)/鸿蒙统一处理
-    if device == "ios":
-        # iOS/鸿蒙基础溢价
-        markup_pct = 0.05
-        # 高消费 + iOS/鸿蒙 = 协同溢价
-        if spending_score > 80:
-            markup_pct = 0.12
-            factors.append({"name": "高端机型+高消费", "change": base_price * markup_pct, "type": "加价"})
-        else:
-            factors.append({"name": "苹果/鸿蒙设备差异", "change": base_price * markup_pct, "type": "加价"})
-        device_markup = base_price * markup_pct
-    else:
-        # 安卓低消费保护
-        if base_price > 500 and spending_score < 40:
-            device_markup = -base_price * 0.05
-            factors.append({"name": "价格敏感度保护", "change": device_markup, "type": "优惠"})
-        else:
-            factors.append({"name": "设备无差异", "change": 0, "type": "中性"})
-
-    current_price += device_markup
-
-    # 3. 活跃度 (粘性) - 修改：区分不同活跃度
-    activity_score = user_profile["activity_score"]
-    # act_change = 0
-
-    # 重新设计活跃度影响逻辑
-    if activity_score >= 75:
-        act_change = base_price * 0.02  # 高粘性溢价
-        factors.append({"name": "高粘性溢价", "change": act_change, "type": "加价"})
-    elif activity_score >= 25:
-        act_change = base_price * 0.00  # 维持
-        factors.append({"name": "固定查看意向溢价", "change": act_change, "type": "中性"})
-    else:
-        act_change = -base_price * 0.03  # 给予优惠以吸引购买
-        factors.append({"name": "促活优惠", "change": act_change, "type": "优惠"})
-
-    current_price += act_change
-
-    # 4. 浏览频率 - 修改：首次浏览提供30元折扣
-    freq_change = 0
-    if user_profile["frequency"] == "often":
-        freq_change = base_price * 0.08
-        factors.append({"name": "急需(高频浏览)", "change": freq_change, "type": "加价"})
-    elif user_profile["frequency"] == "rare":
-        freq_change = -30  # 首次浏览提供30元固定折扣
-        factors.append({"name": "首次浏览刺激消费", "change": freq_change, "type": "优惠"})
-    else:  # sometimes
-        factors.append({"name": "正常浏览频率", "change": 0, "type": "中性"})
-
-    current_price += freq_change
-
-    # 5. 退货量影响 - 修改：根据购买时期和退货率决定优惠
-    return_change = 0
-    purchase_period = user_profile["purchase_period"]  # 新增：平时 or 特殊时期
-    return_rate = user_profile["return_rate"]
-    
-    # 特殊时期购买逻辑
-    if purchase_period == "special":
-        if return_rate == "high":
-            # 频繁退货，不享受特殊时期优惠
-            factors.append({"name": "特殊时期但频繁退货", "change": 0, "type": "中性"})
-        else:
-            # 一般或不退货，享受10%折扣
-            return_change = -base_price * 0.10  # 改为10%折扣
-            factors.append({"name": "大促期间折扣(10%)", "change": return_change, "type": "优惠"})
-    else:
-        # 平时购买逻辑
-        if return_rate == "low":
-            # 从不退货额外5元优惠
-            return_change = -5
-            factors.append({"name": "从不退货额外优惠", "change": return_change, "type": "优惠"})
-        elif return_rate == "medium":
-            factors.append({"name": "一般退货率", "change": 0, "type": "中性"})
-        else:
-            # 高退货率在平时无影响
-            factors.append({"name": "高退货率", "change": 0, "type": "中性"})
+    if USE_PRICE_TABLE:
+        price = get_price_table(get_rules().digest).lookup(user_profile, product_name)
+        if price is not None:
+            return price, None
+    return session_pricer().evaluate(base_price, user_profile)
 
-    current_price += return_change
+def shared_result(base_price, user_profile, product_name):
+    """
+    进程级共享缓存中的定价结果 (价格、因素明细、因素卡片 HTML)，所有会话共用；
+    未命中时查表或增量重算后写入，规则集哈希是键的一部分
+    """
+    key = result_cache.profile_key(user_profile, product_name, base_price, get_rules().digest)
 
-    # 6. 历史购买类型与当前商品差异 (新增)
-    history_categories = user_profile["history_categories"]
-    current_category = user_profile["current_category"]
-    
-    if history_categories:  # 如果用户选择了历史购买类型
-        if current_category not in history_categories:
-            # 当前商品类型不在历史购买类型中，给予小幅度优惠
-            category_change = -20
-            factors.append({"name": "尝试新品类优惠", "change": category_change, "type": "优惠"})
-            current_price += category_change
-        else:
-            # 相同或相似，无影响
-            factors.append({"name": "历史购买同类商品", "change": 0, "type": "中性"})
-    else:
-        # 用户没有选择任何历史购买类型，视为无历史数据，无影响
-        factors.append({"name": "无历史购买记录", "change": 0, "type": "中性"})
-
-    # 7. 购物车中是否有相同/相似产品 (新增)
-    if user_profile.get("has_similar_in_cart", False):
-        cart_change = 5  # 如果有相似产品，价格+5元
-        current_price += cart_change
-        factors.append({"name": "购物车有相似产品", "change": cart_change, "type": "加价"})
-
-    return round(current_price, 2), factors
-
-def normalize_spending(amount):
-    if amount <= 100: return 10
-    if amount <= 500: return 30
-    if amount <= 1000: return 50
-    if amount <= 3000: return 75
-    return 90
-
-def map_activity_to_score(activity):
-    activity_map = {
-        "每天都会看看价格": 80,
-        "一周只看两三回": 50,
-        "必须购买时再使用": 20
-    }
-    return activity_map.get(activity, 50)
+    def compute():
+        return result_cache.PricedResult(*lookup_or_calculate(base_price, user_profile, product_name))
 
-def map_return_rate(return_option):
-    return_map = {
-        "没有/几乎不退货": "low",
-        "看商品质量偶尔退货": "medium",
-        "商品不合意或只留下合适的便退货": "high"
-    }
-    return return_map.get(return_option, "medium")
-
-def get_spending_value(spending_range):
-    """将消费区间转换为具体数值（用于用户选择）"""
-    spending_map = {
-        "0-100元": 50,
-        "100-500元": 300,
-        "500-1000元": 750,
-        "1000-3000元": 2000,
-        "3000元以上": 4000
-    }
-    return spending_map.get(spending_range, 1000)
+    return result_cache.RESULTS.get_or_compute(key, compute)
 
 # ==========================================
 # 4. 可视化组件
@@ -302,7 +197,7 @@ def create_factors_display(factors):
     """创建因素影响展示"""
     html = ""
     for factor in factors:
-        change = factor["change"]
+        change = factor.change
         factor_class = "positive-impact" if change < 0 else "negative-impact" if change > 0 else ""
 
         if change == 0:
@@ -317,8 +212,8 @@ def create_factors_display(factors):
         <div class="factor-card {factor_class}">
             <div style="display: flex; justify-content: space-between; align-items: center;">
                 <div>
-                    <strong>{factor['name']}</strong>
-                    <div style="font-size: 0.9em; color: #888; margin-top: 4px;">{factor['type']}</div>
+                    <strong>{factor.name}</strong>
+                    <div style="font-size: 0.9em; color: #888; margin-top: 4px;">{factor.type}</div>
                 </div>
                 <div style="font-size: 1.2em; font-weight: bold; color: {'#2ecc71' if change < 0 else '#FF6B6B' if change > 0 else '#888'}">
                     {change_display}
@@ -328,13 +223,479 @@ def create_factors_display(factors):
         """
     return html
 
+def population_config_widgets():
+    """群体构成配置：每个选项一个权重滑块，返回 simulate_population 所需的边际分布"""
+    def weights(title, labels, to_value, defaults, key):
+        st.markdown(f"**{title}**")
+        cols = st.columns(len(labels))
+        result = {}
+        for col, label, default in zip(cols, labels, defaults):
+            with col:
+                weight = st.slider(label, 0, 100, default, key=f"pop_{key}_{label}")
+            value = to_value(label)
+            result[value] = result.get(value, 0) + weight
+        return result
+
+    marginals = {
+        "user_type": weights("用户身份", list(USER_TYPE_MAP), USER_TYPE_MAP.get, [20, 60, 20], "user_type"),
+        "spending_level_norm": weights(
+            "月消费", SPENDING_RANGES, lambda r: normalize_spending(get_spending_value(r)),
+            [15, 30, 30, 15, 10], "spending"),
+        "device": weights("设备", list(DEVICE_MAP), DEVICE_MAP.get, [60, 40], "device"),
+        "activity_score": weights("活跃度", ACTIVITY_LEVELS, map_activity_to_score, [30, 40, 30], "activity"),
+        "frequency": weights("浏览频率", list(FREQ_MAP), FREQ_MAP.get, [30, 50, 20], "frequency"),
+        "return_rate": weights("退货习惯", RETURN_OPTIONS, map_return_rate, [30, 50, 20], "return"),
+        "purchase_period": weights("购买时期", list(PURCHASE_PERIOD_MAP), PURCHASE_PERIOD_MAP.get, [80, 20], "period"),
+        "has_similar_in_cart": weights("购物车有相似商品", list(CART_MAP), CART_MAP.get, [70, 30], "cart"),
+    }
+
+    st.markdown("**历史购买过各类商品的用户比例 (%)**")
+    history_probs = {}
+    cols = st.columns(len(HISTORY_CATEGORY_MAP))
+    defaults = [60, 50, 40, 30, 30, 10]
+    for col, (label, category), default in zip(cols, HISTORY_CATEGORY_MAP.items(), defaults):
+        with col:
+            history_probs[category] = st.slider(label, 0, 100, default, key=f"pop_history_{label}") / 100
+    return marginals, history_probs
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def population_figure(dataset_key, kind, field, _stats):
+    """
+    群体模拟的图表 (服务端分箱后的小图，按数据集与图表参数缓存)。
+    _stats 不参与缓存键，dataset_key 标识它。
+    """
+    import charts
+
+    labels = {
+        "user_type": {v: k for k, v in USER_TYPE_MAP.items()},
+        "device": {v: k for k, v in DEVICE_MAP.items()},
+    }
+    if kind == "histogram":
+        return charts.histogram_figure(*charts.population_histogram(_stats), "个性化价格相对基准价的差异分布")
+    if kind == "scatter":
+        return charts.binned_scatter_figure(*charts.population_price_points(_stats), "基准价与个性化价格")
+    groups = charts.population_groups(_stats, field, labels[field].get)
+    return charts.distribution_figure(groups, "各人群的价格差异分布", kind)
+
+@st.fragment
+def render_population_panel():
+    """群体价格分布模拟面板"""
+    st.markdown('<div class="step-header">📈 群体价格分布模拟</div>', unsafe_allow_html=True)
+    st.caption("按设定的人群构成随机生成大量用户，看看同一批商品在不同人群中的价格差异有多大。")
+
+    c_n, c_seed = st.columns(2)
+    with c_n:
+        n_users = st.number_input("模拟用户数", min_value=1_000, max_value=100_000_000,
+                                  value=100_000, step=10_000)
+    with c_seed:
+        seed = st.number_input("随机种子", min_value=0, value=2025, step=1)
+
+    with st.expander("⚙️ 自定义人群构成"):
+        marginals, history_probs = population_config_widgets()
+
+    if st.button("▶️ 开始模拟", width="stretch"):
+        # numpy / pandas / plotly 只在真正使用群体模拟时才加载
+        import population
+
+        try:
+            with st.spinner("正在模拟..."):
+                # 只对不同的 (商品, 画像) 组合定价并按人数加权，耗时与模拟人数基本无关
+                st.session_state.population_stats = population.simulate_weighted(
+                    int(n_users), PRODUCTS, seed=int(seed),
+                    marginals=marginals, history_probs=history_probs)
+            # 图表缓存的数据集标识：同样的参数与规则得到同样的统计量
+            st.session_state.population_key = repr((int(n_users), int(seed), marginals, history_probs,
+                                                    get_rules().digest))
+        except ValueError as e:
+            st.error(f"人群构成设置有误：{e}")
+
+    stats = st.session_state.get("population_stats")
+    if stats is None:
+        return
+
+    import pandas as pd
+
+    quantiles = stats.quantiles((0.1, 0.5, 0.9))
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("模拟人数", f"{stats.count:,}")
+    m2.metric("平均差异", f"{stats.diff_pct.mean @ stats.diff_pct.count / stats.count:+.2f}%")
+    m3.metric("差异中位数", f"{quantiles[0.5]:+.2f}%")
+    m4.metric("P10 ~ P90", f"{quantiles[0.1]:+.1f}% ~ {quantiles[0.9]:+.1f}%")
+
+    key = st.session_state.get("population_key")
+    # 没有基准价的统计量 (只按商品名构造) 无法换算成价格，不提供散点图
+    has_bases = stats.product_bases is not None
+    tabs = st.tabs(["差异分布", "按人群对比"] + (["基准价 vs 个性化价格"] if has_bases else []))
+    tab_hist, tab_groups = tabs[:2]
+    with tab_hist:
+        st.plotly_chart(population_figure(key, "histogram", None, stats), width="stretch")
+    with tab_groups:
+        c_field, c_kind = st.columns(2)
+        with c_field:
+            field = st.radio("分组", ["device", "user_type"], key="pop_chart_field", horizontal=True,
+                             format_func={"device": "设备", "user_type": "用户身份"}.get)
+        with c_kind:
+            kind = st.radio("图表", ["violin", "box"], key="pop_chart_kind", horizontal=True,
+                            format_func={"violin": "小提琴图", "box": "箱线图"}.get)
+        st.plotly_chart(population_figure(key, kind, field, stats), width="stretch")
+    if has_bases:
+        with tabs[2]:
+            st.plotly_chart(population_figure(key, "scatter", None, stats), width="stretch")
+
+    st.markdown("**各商品价格统计**")
+    st.dataframe(pd.DataFrame(stats.product_rows()).round(2), width="stretch", hide_index=True)
+
+    segment_labels = {"user_type": "用户身份", "device": "设备", "spending_level_norm": "消费水平"}
+    value_labels = {
+        "user_type": {v: k for k, v in USER_TYPE_MAP.items()},
+        "device": {v: k for k, v in DEVICE_MAP.items()},
+        "spending_level_norm": {normalize_spending(get_spending_value(r)): r for r in SPENDING_RANGES},
+    }
+    segment = st.radio("按人群分组", list(segment_labels), format_func=segment_labels.get, horizontal=True)
+    segment_df = pd.DataFrame(stats.segment_rows(segment))
+    segment_df["分组"] = segment_df["分组"].map(value_labels[segment])
+    st.dataframe(segment_df.round(2), width="stretch", hide_index=True)
+
+@st.cache_data(show_spinner="正在为整个目录定价...", max_entries=64)
+def catalog_profile_summary(catalog_path, profile, rules_digest):
+    """同一画像在整个目录上的定价汇总 (单次向量化求值，只缓存汇总结果；rules_digest 仅作缓存键)"""
+    return get_catalog(catalog_path).profile_summary(profile)
+
+def render_catalog_view(profile):
+    """全目录视图：当前画像在每个商品上会被加价还是优惠"""
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    # 当前商品的类别不影响全目录定价，去掉后切换商品时可以命中缓存
+    profile = {k: v for k, v in profile.items() if k != "current_category"}
+    summary = catalog_profile_summary(CATALOG_PATH, profile, get_rules().digest)
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("商品数", f"{summary['size']:,}")
+    m2.metric("平均差异", f"{summary['mean_pct']:+.2f}%")
+    m3.metric("被加价的商品", f"{summary['up_share']:.1%}")
+    m4.metric("获得优惠的商品", f"{summary['down_share']:.1%}")
+
+    counts, edges = summary["histogram"]
+    fig = go.Figure(go.Bar(x=[(a + b) / 2 for a, b in zip(edges, edges[1:])], y=counts,
+                           width=edges[1] - edges[0], marker_color="#4ECDC4"))
+    fig.update_layout(title="你的价格相对各商品基准价的差异分布", xaxis_title="差异 (%)",
+                      yaxis_title="商品数", height=320, margin=dict(t=50, b=40))
+    st.plotly_chart(fig, width="stretch")
+
+    c_up, c_down = st.columns(2)
+    with c_up:
+        st.markdown("**📈 对你加价最多的商品**")
+        st.dataframe(pd.DataFrame(summary["most_inflated"]).round(2), width="stretch", hide_index=True)
+    with c_down:
+        st.markdown("**📉 给你优惠最多的商品**")
+        st.dataframe(pd.DataFrame(summary["most_discounted"]).round(2), width="stretch", hide_index=True)
+
+    st.markdown("**各类别平均差异**")
+    st.dataframe(pd.DataFrame(summary["categories"]).round(2), width="stretch", hide_index=True)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def cached_counterfactuals(base_price, profile, rules_digest):
+    # rules_digest 仅作缓存键
+    import counterfactual
+    return counterfactual.explore(base_price, profile)
+
+def render_counterfactual_view(base_price, profile):
+    """反事实面板：一次批量定价得到全部单项 / 两项改动后的价格"""
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    from counterfactual import ATTRIBUTES, GRID_ATTRIBUTES
+
+    result = cached_counterfactuals(base_price, profile, get_rules().digest)
+    rows = result.rows()
+    cheapest, dearest = rows[0], rows[-1]
+    c_low, c_high = st.columns(2)
+    c_low.metric("改动后最低价", f"¥{cheapest['新价格']}", f"{cheapest['差价']:+.2f}", delta_color="inverse")
+    c_low.caption(cheapest["变化"])
+    c_high.metric("改动后最高价", f"¥{dearest['新价格']}", f"{dearest['差价']:+.2f}", delta_color="inverse")
+    c_high.caption(dearest["变化"])
+
+    st.markdown(f"**全部 {len(rows)} 种改动 (按差价从低到高)**")
+    st.dataframe(pd.DataFrame(rows).round(2), width="stretch", hide_index=True, height=320)
+
+    title = lambda key: ATTRIBUTES[key][0]
+    c_row, c_col = st.columns(2)
+    with c_row:
+        row_attribute = st.selectbox("热力图纵轴", GRID_ATTRIBUTES, index=GRID_ATTRIBUTES.index("spending"),
+                                     format_func=title, key="cf_row")
+    with c_col:
+        options = [a for a in GRID_ATTRIBUTES if a != row_attribute]
+        column_attribute = st.selectbox("热力图横轴", options, format_func=title, key="cf_col",
+                                        index=options.index("device") if "device" in options else 0)
+    row_labels, column_labels, matrix = result.grid(row_attribute, column_attribute)
+    fig = go.Figure(go.Heatmap(
+        z=matrix - result.prices[0], x=column_labels, y=row_labels, colorscale="RdYlGn_r", zmid=0,
+        text=[[f"¥{v:.2f}" for v in row] for row in matrix], texttemplate="%{text}",
+        colorbar=dict(title="差价"),
+    ))
+    fig.update_layout(title=f"{title(row_attribute)} × {title(column_attribute)} (其余选项不变)",
+                      height=360, margin=dict(t=50, b=40))
+    st.plotly_chart(fig, width="stretch")
+
+@st.fragment
+def render_regression_panel():
+    """逆向工程面板：外部观察者用增量最小二乘从模拟价格中还原定价规则"""
+    st.markdown('<div class="step-header">🧮 逆向工程：从价格还原算法</div>', unsafe_allow_html=True)
+    st.caption("假设你只能看到大量用户的画像和他们拿到的价格，能不能反推出平台的定价规则？"
+               "下面用逐块累加的最小二乘回归来试试：每个特征的效应分成「按基准价的百分比」与「固定金额」两部分。")
+
+    c_n, c_seed = st.columns(2)
+    with c_n:
+        n_users = st.number_input("观测数", min_value=10_000, max_value=50_000_000,
+                                  value=1_000_000, step=100_000, key="reg_users")
+    with c_seed:
+        seed = st.number_input("随机种子", min_value=0, value=7, step=1, key="reg_seed")
+
+    if st.button("🔍 开始还原", width="stretch"):
+        import regression
+
+        progress = st.progress(0.0, text="正在拟合...")
+        widths = []
+        for ols, y_sum in regression.fit_stream(int(n_users), PRODUCTS, seed=int(seed)):
+            rows = ols.summary()
+            widths.append((ols.n, max(row["上限"] - row["下限"] for row in rows) / 2))
+            progress.progress(ols.n / n_users, text=f"已拟合 {ols.n:,} 个观测")
+        progress.empty()
+        st.session_state.regression_result = {"rows": rows, "widths": widths, "r2": ols.r_squared(y_sum)}
+
+    result = st.session_state.get("regression_result")
+    if result is None:
+        return
+
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    m1, m2, m3 = st.columns(3)
+    m1.metric("观测数", f"{result['widths'][-1][0]:,}")
+    m2.metric("R²", f"{result['r2']:.5f}")
+    m3.metric("最大置信区间半宽", f"{result['widths'][-1][1]:.4f}")
+
+    df = pd.DataFrame(result["rows"])
+    # 只展示置信区间不含 0 的效应，即观察者可以确认存在的规则
+    found = df[(df["下限"] > 0) | (df["上限"] < 0)]
+    found = found[found["特征"] != "截距"]
+    fig = go.Figure()
+    for unit, name, color in (("%", "按基准价百分比", "#4ECDC4"), ("元", "固定金额", "#FF6B6B")):
+        part = found[found["单位"] == unit]
+        fig.add_trace(go.Bar(
+            y=part["特征"] + f" ({unit})", x=part["估计值"], orientation="h", name=name, marker_color=color,
+            error_x=dict(type="data", array=part["上限"] - part["估计值"], arrayminus=part["估计值"] - part["下限"]),
+        ))
+    fig.update_layout(title="还原出的定价效应 (95% 置信区间)", height=max(360, 26 * len(found)),
+                      margin=dict(t=50, b=40), yaxis=dict(autorange="reversed"))
+    st.plotly_chart(fig, width="stretch")
+
+    with st.expander("全部系数与收敛过程"):
+        st.dataframe(df.round(4), width="stretch", hide_index=True)
+        widths = pd.DataFrame(result["widths"], columns=["观测数", "最大置信区间半宽"])
+        st.line_chart(widths, x="观测数", y="最大置信区间半宽")
+
+@st.cache_data(show_spinner="正在搜索最优规则...", max_entries=16)
+def tune_rules(n_users, seed, objective, cost_ratio, sigma, rules_digest):
+    """商家视角的规则调优 (只缓存可序列化的结果；rules_digest 仅作缓存键)"""
+    import json
+
+    import tuning
+
+    market = tuning.build_market(n_users, PRODUCTS, seed=seed, demand={"sigma": sigma}, cost_ratio=cost_ratio)
+    result = tuning.optimize(market, objective, samples=512, rounds=3, seed=seed)
+    return {
+        "rows": result.rows(),
+        "summary": result.summary_rows(),
+        "loss_uniform": result.surplus_loss(),
+        "loss_current": result.surplus_loss("current"),
+        "groups": len(market),
+        "evaluations": result.evaluations,
+        "elapsed": result.elapsed,
+        "spec": json.dumps(tuning.tuned_spec(market.rules, market.params, result.best), ensure_ascii=False, indent=2),
+    }
+
+@st.fragment
+def render_merchant_panel():
+    """商家视角：在模拟的需求模型下，加价 / 优惠幅度取多少能让营收或利润最大？"""
+    st.markdown('<div class="step-header">🏪 商家视角：最优定价规则</div>', unsafe_allow_html=True)
+    st.caption("给每位用户一个随人群变化的支付意愿，搜索让商家期望营收或利润最大的规则参数，"
+               "再看看消费者为此少得了多少「消费者剩余」。")
+
+    c_obj, c_cost, c_sigma, c_n = st.columns(4)
+    with c_obj:
+        objective = st.radio("目标", ["profit", "revenue"], format_func={"profit": "利润", "revenue": "营收"}.get,
+                             horizontal=True, key="tune_objective")
+    with c_cost:
+        cost_ratio = st.slider("成本 / 基准价", 0.0, 0.9, 0.6, 0.05, key="tune_cost")
+    with c_sigma:
+        sigma = st.slider("支付意愿离散度", 0.1, 0.6, 0.25, 0.05, key="tune_sigma")
+    with c_n:
+        n_users = st.number_input("模拟用户数", min_value=10_000, max_value=100_000_000, value=1_000_000,
+                                  step=100_000, key="tune_users")
+
+    if st.button("🔎 搜索最优规则", width="stretch"):
+        st.session_state.tuning_args = (int(n_users), 0, objective, float(cost_ratio), float(sigma))
+    args = st.session_state.get("tuning_args")
+    if args is None:
+        return
+    result = tune_rules(*args, get_rules().digest)
+
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    summary = {row["情形"]: row for row in result["summary"]}
+    current, best = summary["当前规则"], summary["最优规则"]
+    key = "期望利润" if args[2] == "profit" else "期望营收"
+    m1, m2, m3 = st.columns(3)
+    m1.metric(f"最优规则{key}", f"¥{best[key]:,.0f}", f"{(best[key] / current[key] - 1) * 100:+.2f}% vs 当前")
+    m2.metric("消费者剩余损失 (vs 当前规则)", f"¥{result['loss_current']:,.0f}")
+    m3.metric("消费者剩余损失 (vs 统一定价)", f"¥{result['loss_uniform']:,.0f}")
+
+    df = pd.DataFrame(result["rows"])
+    fig = go.Figure([
+        go.Bar(y=df["因素"] + " (" + df["单位"] + ")", x=df["当前值"], orientation="h", name="当前", marker_color="#B2BEC3"),
+        go.Bar(y=df["因素"] + " (" + df["单位"] + ")", x=df["最优值"], orientation="h", name="最优", marker_color="#FF6B6B"),
+    ])
+    fig.update_layout(title="规则参数：当前 vs 最优", barmode="group", height=max(360, 34 * len(df)),
+                      margin=dict(t=50, b=40), yaxis=dict(autorange="reversed"))
+    st.plotly_chart(fig, width="stretch")
+    st.dataframe(pd.DataFrame(result["summary"]).round(2), width="stretch", hide_index=True)
+    st.caption(f"{args[0]:,} 名用户合并为 {result['groups']:,} 组，求值 {result['evaluations']:,} 组候选参数，"
+               f"用时 {result['elapsed']:.1f}s。")
+    st.download_button("下载最优规则 (pricing_rules.json 格式)", result["spec"], file_name="tuned_rules.json",
+                       mime="application/json")
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def open_run(path, mtime):
+    """内存映射打开一次保存的模拟结果 (mtime 参与缓存键，结果被覆盖后重新打开)"""
+    import results_store
+    return results_store.Run.open(path)
+
+@st.cache_data(show_spinner="正在汇总...", max_entries=64)
+def aggregate_run(path, mtime, by, filters):
+    return open_run(path, mtime).aggregate(by, dict(filters))
+
+@st.cache_data(show_spinner="正在绘图...", max_entries=64)
+def run_figure(path, mtime, kind, by, filters, labels):
+    """保存结果的图表：分组分布按块分箱、散点按点数预算抽样，只有聚合后的小图发往浏览器"""
+    import charts
+
+    run = open_run(path, mtime)
+    filters = dict(filters)
+    if kind == "scatter":
+        sample = run.sample(("base_price", "price"), charts.POINT_BUDGET, filters)
+        total = sum(row["人数"] for row in run.aggregate(by, filters))
+        return charts.scatter_figure(sample["base_price"], sample["price"], "基准价与个性化价格", total=total)
+    groups = charts.run_groups(run, by, filters, dict(labels).get)
+    return charts.distribution_figure(groups, "各分组的价格差异分布", kind)
+
+@st.fragment
+def render_saved_runs_panel():
+    """已保存的模拟结果：按人群筛选与分组，不重新模拟、不把结果读入内存"""
+    import results_store
+
+    runs = results_store.list_runs(RUNS_DIR)
+    if not runs:
+        return
+
+    st.markdown('<div class="step-header">🗂️ 已保存的模拟结果</div>', unsafe_allow_html=True)
+    st.caption(f"读取 {RUNS_DIR} 下由 population.py --store 写入的结果，按设备、用户身份、商品类别筛选与分组。")
+    path = st.selectbox("选择一次模拟", runs, format_func=os.path.basename, key="run_path")
+    mtime = os.path.getmtime(os.path.join(path, "run.json"))
+    run = open_run(path, mtime)
+    metadata = run.metadata
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("行数", f"{len(run):,}")
+    m2.metric("随机种子", str(metadata.get("seed")))
+    m3.metric("规则版本", f"{metadata.get('rules_version')} ({metadata.get('rules_digest')})")
+    m4.metric("商品库哈希", metadata.get("catalog_hash", ""))
+    if metadata.get("rules_digest") != get_rules().digest:
+        st.warning("这次模拟使用的定价规则与当前规则不同，结果反映的是当时的规则。")
+
+    labels = {
+        "device": {v: k for k, v in DEVICE_MAP.items()},
+        "user_type": {v: k for k, v in USER_TYPE_MAP.items()},
+        "category": {v: k for k, v in HISTORY_CATEGORY_MAP.items()} | {"": "其他类别"},
+    }
+    titles = {"device": "设备", "user_type": "用户身份", "category": "商品类别"}
+    filters = {}
+    for column, segment in zip(st.columns(len(titles)), titles):
+        with column:
+            filters[segment] = tuple(st.multiselect(
+                titles[segment], list(labels[segment]), format_func=labels[segment].get,
+                key=f"run_filter_{segment}"))
+    by = st.radio("分组", list(titles), format_func=titles.get, horizontal=True, key="run_group")
+
+    rows = aggregate_run(path, mtime, by, tuple(sorted(filters.items())))
+    if not rows:
+        st.info("没有符合筛选条件的行。")
+        return
+
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+    df["分组"] = df["分组"].map(labels[by])
+    st.dataframe(df.round(2), width="stretch", hide_index=True)
+
+    filter_key = tuple(sorted(filters.items()))
+    label_key = tuple(labels[by].items())
+    tab_groups, tab_scatter = st.tabs(["分组分布", "基准价 vs 个性化价格"])
+    with tab_groups:
+        kind = st.radio("图表", ["violin", "box"], key="run_chart_kind", horizontal=True,
+                        format_func={"violin": "小提琴图", "box": "箱线图"}.get)
+        st.plotly_chart(run_figure(path, mtime, kind, by, filter_key, label_key), width="stretch")
+    with tab_scatter:
+        st.plotly_chart(run_figure(path, mtime, "scatter", by, filter_key, label_key), width="stretch")
+
 # ==========================================
 # 5. 主程序 UI (上中下结构)
 # ==========================================
 
-def main():
-    st.markdown('<h1 style="text-align:center; margin-bottom: 2rem;">🕵️‍♂️让我们一起识破商家的小伎俩！</h1>', unsafe_allow_html=True)
-    st.caption("声明：本网页中涉及的算法纯属虚构，比不上正常电商平台的精妙算法，也无任何关联")
+def product_selector(catalog):
+    """商品选择器：商品数超过一页时提供关键词检索、类别筛选与翻页，返回选中的商品编号"""
+    if len(catalog) <= CATALOG_PAGE_SIZE:
+        ids = range(len(catalog))
+    else:
+        c_q, c_cat = st.columns([3, 1])
+        with c_q:
+            query = st.text_input("搜索商品", placeholder="输入名称或描述中的关键词，空格分隔",
+                                  label_visibility="collapsed")
+        with c_cat:
+            category = st.selectbox("类别", ("全部类别",) + catalog.categories, label_visibility="collapsed")
+        ids = search_catalog(CATALOG_PATH, query.strip(), None if category == "全部类别" else category)
+        if not len(ids):
+            st.warning("没有找到匹配的商品，请换个关键词")
+            ids = range(len(catalog))
+        pages = (len(ids) - 1) // CATALOG_PAGE_SIZE + 1
+        c_page, c_count = st.columns([1, 3])
+        with c_page:
+            page = st.number_input("页码", min_value=1, max_value=pages, value=1, step=1,
+                                   label_visibility="collapsed")
+        with c_count:
+            st.caption(f"共 {len(ids):,} 件商品，第 {page}/{pages} 页")
+        ids = ids[(page - 1) * CATALOG_PAGE_SIZE:page * CATALOG_PAGE_SIZE]
+
+    return st.selectbox(
+        "点击下拉框选择商品",
+        [int(i) for i in ids],
+        format_func=catalog.name,
+        label_visibility="collapsed"
+    )
+
+def set_revealed(value):
+    """揭晓/隐藏按钮的回调：在重跑前修改状态，点击一次只触发一次重跑"""
+    st.session_state.is_revealed = value
+    # 记录点击时刻，片段重跑结束时统计揭晓/隐藏的往返耗时
+    st.session_state.toggle_started = metrics.start()
+
+@st.fragment
+def pricing_section():
+    """第一步到第三步：控件变化时只重跑这个片段，页面其余部分保持不动"""
+    section_started = metrics.start()
+    widgets_started = metrics.start()
 
     # -------------------------------------------------------
     # 步骤 1: 设置用户特征 (Top)
@@ -349,17 +710,16 @@ def main():
         st.markdown("**1. 你的用户身份？**")
         user_type = st.selectbox(
             "label_1",
-            ["我是新用户！", "我是普通用户;)", "我是老用户☝🏼"],
+            list(USER_TYPE_MAP),
             index=1,
             label_visibility="collapsed"
         )
-        type_map = {"我是新用户！": "new", "我是普通用户;)": "regular", "我是老用户☝🏼": "loyal"}
 
     with row1_c2:
         st.markdown("**2. 你在淘宝APP 每月的消费？**")
         spending_range = st.selectbox(
             "label_2",
-            ["0-100元", "100-500元", "500-1000元", "1000-3000元", "3000元以上"],
+            SPENDING_RANGES,
             index=2,
             label_visibility="collapsed"
         )
@@ -370,11 +730,11 @@ def main():
         st.markdown("**3. 你使用的设备？**")
         device_display = st.radio(
             "label_3",
-            ["安卓(Android)", "苹果(iPhone)/鸿蒙"],
+            list(DEVICE_MAP),
             horizontal=True,
             label_visibility="collapsed"
         )
-        device_val = "ios" if "苹果" in device_display else "android"
+        device_val = DEVICE_MAP[device_display]
 
     # st.markdown("---") # 分割线
 
@@ -384,7 +744,7 @@ def main():
         st.markdown("**4. 你在淘宝的活跃度如何**")
         activity_level = st.selectbox(
             "label_4",
-            ["每天都会看看价格", "一周只看两三回", "必须购买时再使用"],
+            ACTIVITY_LEVELS,
             index=1,
             label_visibility="collapsed"
         )
@@ -395,17 +755,16 @@ def main():
         st.markdown("**5. 你浏览该商品频率多高**")
         view_freq = st.selectbox(
             "label_5",
-            ["第一次点开", "偶尔看看", "反复查看(急需)"],
+            list(FREQ_MAP),
             index=1,
             label_visibility="collapsed"
         )
-        freq_map = {"第一次点开": "rare", "偶尔看看": "sometimes", "反复查看(急需)": "often"}
 
     with row2_c3:
         st.markdown("**6. 你有退货的习惯吗**")
         return_option = st.selectbox(
             "label_6",
-            ["没有/几乎不退货", "看商品质量偶尔退货", "商品不合意或只留下合适的便退货"],
+            RETURN_OPTIONS,
             index=1,
             label_visibility="collapsed"
         )
@@ -419,48 +778,34 @@ def main():
         st.markdown("**7. 平时与特殊时期购买**")
         purchase_period = st.selectbox(
             "label_7",
-            ["平时购买", "双11/双12/618等大促期间购买"],
+            list(PURCHASE_PERIOD_MAP),
             index=0,
             label_visibility="collapsed"
         )
-        # 映射购买时期
-        purchase_period_map = {
-            "平时购买": "normal",
-            "双11/双12/618等大促期间购买": "special"
-        }
 
     with row3_c2:
         st.markdown("**8. 购物车中有相似商品吗**")
         has_similar = st.selectbox(
             "label_8",
-            ["否", "是"],
+            list(CART_MAP),
             index=0,
             help="购物车中是否有相同或相似产品",
             label_visibility="collapsed"
         )
-        has_similar_in_cart = (has_similar == "是")
+        has_similar_in_cart = CART_MAP[has_similar]
 
     with row3_c3:
         st.markdown("**9. 你之前购买过哪些类型的商品？**")
         # 使用多选组件，允许用户选择多个类型
         history_category_options = st.multiselect(
             "label_9",
-            ["服装服饰类", "食品（水果蔬菜等）", "电子产品（电脑、手机、耳机等）", "美妆护肤类", "家居日用类", "其他"],
+            list(HISTORY_CATEGORY_MAP),
             default=["服装服饰类"],  # 默认选中一项
             help="可多选，之前购买过的商品类型",
             label_visibility="collapsed"
         )
-        # 将选项映射为类别（与商品配置库的category对应）
-        history_category_map = {
-            "服装服饰类": "服饰",
-            "食品（水果蔬菜等）": "食品",
-            "电子产品（电脑、手机、耳机等）": "数码",
-            "美妆护肤类": "美妆",
-            "家居日用类": "家居",
-            "其他": "其他"
-        }
         # 将用户选择转换为对应的类别列表
-        history_categories = [history_category_map[opt] for opt in history_category_options]
+        history_categories = [HISTORY_CATEGORY_MAP[opt] for opt in history_category_options]
 
     # -------------------------------------------------------
     # 步骤 2: 选择商品 (Middle)
@@ -470,36 +815,37 @@ def main():
     # 使用列来限制选择框的宽度，不让它占满全屏
     c_p1, c_p2, c_p3 = st.columns([1, 2, 1])
     with c_p2:
-        selected_product_name = st.selectbox(
-            "点击下拉框选择商品",
-            list(PRODUCTS.keys()),
-            label_visibility="collapsed"
-        )
-        product_info = PRODUCTS[selected_product_name]
+        catalog = get_catalog(CATALOG_PATH)
+        selected_id = product_selector(catalog)
+        selected_product_name = catalog.name(selected_id)
+        product_info = catalog.item(selected_id)
 
     # -------------------------------------------------------
     # 步骤 3: 揭晓价格 (Bottom)
     # -------------------------------------------------------
     st.markdown('<div class="step-header">💰 第三步：查看你的专属价格</div>', unsafe_allow_html=True)
 
+    metrics.stop("widgets", widgets_started)
+
     # 无论是否揭晓，先在后台计算好价格
+    profile_started = metrics.start()
     profile = {
-        "user_type": type_map[user_type],
+        "user_type": USER_TYPE_MAP[user_type],
         "spending_level_norm": normalize_spending(monthly_spend),
         "device": device_val,
         "activity_score": activity_score,
-        "frequency": freq_map[view_freq],
+        "frequency": FREQ_MAP[view_freq],
         "return_rate": return_rate,
-        "purchase_period": purchase_period_map[purchase_period],
+        "purchase_period": PURCHASE_PERIOD_MAP[purchase_period],
         "history_categories": history_categories,  # 修改：改为列表
         "current_category": product_info['category'],
         "has_similar_in_cart": has_similar_in_cart
     }
     base_price = product_info['base']
-    final_price, factors = calculate_price_logic(base_price, profile)
-
-    # 过滤掉中性的因素（只保留对价格有影响的）
-    effective_factors = [f for f in factors if f["change"] != 0]
+    metrics.stop("profile", profile_started)
+    with metrics.section("pricing"):
+        result = shared_result(base_price, profile, selected_product_name)
+        final_price = result.price
 
     # 逻辑分支：显示按钮 还是 显示结果
     result_container = st.container()
@@ -518,18 +864,24 @@ def main():
             # 巨大的揭晓按钮
             col_b1, col_b2, col_b3 = st.columns([1, 2, 1])
             with col_b2:
-                if st.button("🚀 点击揭晓我的个性化价格", use_container_width=True, type="primary"):
-                    st.session_state.is_revealed = True
-                    st.rerun() # 立即刷新页面以显示结果
+                st.button("🚀 点击揭晓我的个性化价格", width="stretch", type="primary",
+                          on_click=set_revealed, args=(True,))
 
         else:
             # === 状态 B: 结果展示模式 (已揭晓) ===
             # 顶部操作栏：隐藏按钮
             c_hide_1, c_hide_2 = st.columns([8, 2])
             with c_hide_2:
-                if st.button("🔒 隐藏价格 (重置)", use_container_width=True):
-                    st.session_state.is_revealed = False
-                    st.rerun()
+                st.button("🔒 隐藏价格 (重置)", width="stretch",
+                          on_click=set_revealed, args=(False,))
+
+            # 因素明细只在揭晓后才构造
+            with metrics.section("factor_filter"):
+                # 价格来自价格表时因素明细尚未计算，算一次后回填到共享结果中
+                if result.factors is None:
+                    result.factors = session_pricer().evaluate(base_price, profile)[1]
+                # 过滤掉中性的因素（只保留对价格有影响的）
+                effective_factors = [f for f in result.factors if f.change != 0]
 
             # 价格核心展示区
             diff = final_price - base_price
@@ -573,8 +925,11 @@ def main():
 
             # 创建因素展示 - 只显示有效因素
             if effective_factors:
-                factors_html = create_factors_display(effective_factors)
-                st.markdown(factors_html, unsafe_allow_html=True)
+                with metrics.section("render"):
+                    # 卡片 HTML 只生成一次，之后所有会话直接复用
+                    if result.html is None:
+                        result.html = create_factors_display(effective_factors)
+                    st.markdown(result.html, unsafe_allow_html=True)
             else:
                 st.info("📊 **分析结果**：基于你的用户画像，算法判断无需进行价格调整，你看到的是基准价格。")
 
@@ -590,9 +945,21 @@ def main():
 
             st.success("💡 **提示**：保持此区域打开，现在去上方调整「月消费」或「设备」，价格会实时跳动！")
 
-    # -------------------------------------------------------
-    # 小科普：什么是价格歧视
-    # -------------------------------------------------------
+            if st.toggle("🔀 如果我改一两个选项，价格会怎样？", key="counterfactual_view"):
+                with metrics.section("counterfactual_view"):
+                    render_counterfactual_view(base_price, profile)
+
+            if st.toggle("🔭 用我的画像给整个商品目录定价", key="catalog_view"):
+                with metrics.section("catalog_view"):
+                    render_catalog_view(profile)
+
+    metrics.stop("pricing_section", section_started)
+    toggle_started = st.session_state.pop("toggle_started", None)
+    if toggle_started is not None:
+        metrics.stop("reveal_toggle", toggle_started)
+
+def render_explainer():
+    """小科普：什么是价格歧视 (静态内容，只在整页重跑时发送)"""
     st.markdown('<div class="step-header">📚小科普：什么是价格歧视？</div>', unsafe_allow_html=True)
 
     st.markdown("""
@@ -608,5 +975,28 @@ def main():
 
     # st.markdown('<div class="step-header">😗以本网页为例</div>', unsafe_allow_html=True)
 
+def main():
+    metrics.ensure_exporter()
+    st.markdown('<h1 style="text-align:center; margin-bottom: 2rem;">🕵️‍♂️让我们一起识破商家的小伎俩！</h1>', unsafe_allow_html=True)
+    st.caption("声明：本网页中涉及的算法纯属虚构，比不上正常电商平台的精妙算法，也无任何关联")
+
+    # 步骤 1-3：个性化定价 (独立片段)
+    pricing_section()
+
+    # 群体价格分布模拟 (独立片段)
+    render_population_panel()
+
+    # 逆向工程：从价格还原算法 (独立片段)
+    render_regression_panel()
+
+    # 商家视角：最优定价规则 (独立片段)
+    render_merchant_panel()
+
+    # 已保存的模拟结果 (独立片段，没有结果时不显示)
+    render_saved_runs_panel()
+
+    # 小科普：什么是价格歧视
+    render_explainer()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,210 @@
+"""
+批量定价引擎 (NumPy 向量化版 calculate_price_logic)
+
+输入为按列组织的数组，一次性计算整批用户的最终价格与每条规则的价格贡献。
+规则本身由 rules.py 从 pricing_rules.json 编译，
+结果与 app.py 中的 calculate_price_logic 逐元素完全一致 (含保留两位小数)。
+另提供把整份画像打包成一个整数的编码 (pack_columns / unpack_columns)，供按不同画像去重计数的群体模拟使用。
+"""
+
+import numpy as np
+
+# ==========================================
+# 1. 编码表 (列数组中使用的整数编码)
+# ==========================================
+
+USER_TYPES = ("new", "regular", "loyal")
+# normalize_spending / map_activity_to_score 的全部取值
+SPENDING_LEVELS = (10, 30, 50, 75, 90)
+DEVICES = ("android", "ios")
+ACTIVITY_SCORES = (20, 50, 80)
+FREQUENCIES = ("rare", "sometimes", "often")
+RETURN_RATES = ("low", "medium", "high")
+PURCHASE_PERIODS = ("normal", "special")
+CART_STATES = (False, True)
+# 历史购买类别的位序 (与 main() 中 history_category_map 的取值顺序一致)
+HISTORY_CATEGORIES = ("服饰", "食品", "数码", "美妆", "家居", "其他")
+
+def category_code(category):
+    """商品类别 -> 位序，未知类别返回 -1 (视为不在任何历史类别中)"""
+    try:
+        return HISTORY_CATEGORIES.index(category)
+    except ValueError:
+        return -1
+
+
+def history_mask(history_categories):
+    """历史类别列表 -> 位掩码"""
+    mask = 0
+    for category in history_categories:
+        code = category_code(category)
+        if code >= 0:
+            mask |= 1 << code
+    return mask
+
+
+def encode_profiles(profiles, base_prices):
+    """将 main() 构造的 profile 字典列表转换为 price_batch 所需的列数组"""
+    n = len(profiles)
+    columns = {
+        "user_type": np.empty(n, dtype=np.int8),
+        "spending_level_norm": np.empty(n, dtype=np.float64),
+        "device": np.empty(n, dtype=np.int8),
+        "activity_score": np.empty(n, dtype=np.float64),
+        "frequency": np.empty(n, dtype=np.int8),
+        "return_rate": np.empty(n, dtype=np.int8),
+        "purchase_period": np.empty(n, dtype=np.int8),
+        "history_mask": np.empty(n, dtype=np.int16),
+        "current_category": np.empty(n, dtype=np.int8),
+        "has_similar_in_cart": np.empty(n, dtype=bool),
+        "base_price": np.asarray(base_prices, dtype=np.float64),
+    }
+    for i, profile in enumerate(profiles):
+        columns["user_type"][i] = USER_TYPES.index(profile["user_type"])
+        columns["spending_level_norm"][i] = profile["spending_level_norm"]
+        columns["device"][i] = DEVICES.index(profile["device"])
+        columns["activity_score"][i] = profile["activity_score"]
+        columns["frequency"][i] = FREQUENCIES.index(profile["frequency"])
+        columns["return_rate"][i] = RETURN_RATES.index(profile["return_rate"])
+        columns["purchase_period"][i] = PURCHASE_PERIODS.index(profile["purchase_period"])
+        columns["history_mask"][i] = history_mask(profile["history_categories"])
+        columns["current_category"][i] = category_code(profile["current_category"])
+        columns["has_similar_in_cart"][i] = bool(profile.get("has_similar_in_cart", False))
+    return columns
+
+
+# ==========================================
+# 2. 向量化定价
+# ==========================================
+
+def round_price(prices):
+    """
+    与 Python 内置 round(x, 2) 逐元素一致的舍入。
+    np.round 先乘 100 再取整，在 .xx5 附近会与 round() 结果不同，
+    这些接近平局的元素单独交给 round() 处理。
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    scaled = prices * 100
+    rounded = np.rint(scaled) / 100
+    frac = np.abs(scaled - np.floor(scaled) - 0.5)
+    near_tie = np.flatnonzero(frac < 1e-6)
+    for i in near_tie:
+        rounded.flat[i] = round(float(prices.flat[i]), 2)
+    return rounded
+
+
+def price_batch(user_type, spending_level_norm, device, activity_score, frequency,
+                return_rate, purchase_period, history_mask, current_category,
+                has_similar_in_cart, base_price, with_contributions=True):
+    """
+    批量定价
+
+    各参数为等长数组 (或可广播的标量)，编码见模块顶部的编码表。
+    返回 (final_prices, contributions)，contributions 形状为 (n, 规则数)，
+    列顺序见 rules.get_rules().rule_ids；只需要价格时传 with_contributions=False，
+    contributions 返回 None。
+    """
+    from rules import get_rules
+
+    columns = {
+        "user_type": user_type,
+        "spending_level_norm": np.asarray(spending_level_norm, dtype=np.float64),
+        "device": device,
+        "activity_score": np.asarray(activity_score, dtype=np.float64),
+        "frequency": frequency,
+        "return_rate": return_rate,
+        "purchase_period": purchase_period,
+        "history_mask": history_mask,
+        "current_category": current_category,
+        "has_similar_in_cart": np.asarray(has_similar_in_cart, dtype=bool),
+        "base_price": np.asarray(base_price, dtype=np.float64),
+    }
+    return get_rules().evaluate_batch(columns, with_contributions)
+
+
+def price_columns(columns):
+    """以 encode_profiles 返回的列字典调用 price_batch"""
+    return price_batch(**columns)
+
+
+# ==========================================
+# 3. 画像编码 (整份画像打包成一个整数)
+# ==========================================
+
+# (字段, 位宽)，从低位到高位依次排列。画像的全部字段都是类别型 (历史类别为 6 位集合)，
+# 因此一份画像可以无损地压缩成 CODE_BITS 位整数；current_category 存 位序 + 1 (0 表示未知类别)
+CODE_FIELDS = (
+    ("user_type", 2),
+    ("spending_level_norm", 3),
+    ("device", 1),
+    ("activity_score", 2),
+    ("frequency", 2),
+    ("return_rate", 2),
+    ("purchase_period", 1),
+    ("has_similar_in_cart", 1),
+    ("history_mask", len(HISTORY_CATEGORIES)),
+    ("current_category", 3),
+)
+CODE_BITS = sum(bits for _, bits in CODE_FIELDS)
+
+# 列数组中直接存取值 (而非下标) 的字段
+_VALUE_FIELDS = {"spending_level_norm": SPENDING_LEVELS, "activity_score": ACTIVITY_SCORES}
+_CODE_DTYPES = {"history_mask": np.int16, "current_category": np.int8, "has_similar_in_cart": bool}
+
+
+def pack_columns(columns):
+    """price_batch 的列数组 (base_price 除外) -> 每行一个画像编码 (int64)"""
+    codes = np.zeros(len(columns["user_type"]), dtype=np.int64)
+    shift = 0
+    for field, bits in CODE_FIELDS:
+        value = np.asarray(columns[field])
+        if field in _VALUE_FIELDS:
+            value = np.searchsorted(_VALUE_FIELDS[field], value)
+        elif field == "current_category":
+            value = value + 1
+        codes |= value.astype(np.int64) << shift
+        shift += bits
+    return codes
+
+
+def unpack_columns(codes, base_price=None):
+    """画像编码 -> price_batch 的列数组 (dtype 与 encode_profiles 一致)；给出 base_price 时一并放入"""
+    codes = np.asarray(codes, dtype=np.int64)
+    columns = {}
+    shift = 0
+    for field, bits in CODE_FIELDS:
+        value = (codes >> shift) & ((1 << bits) - 1)
+        shift += bits
+        if field in _VALUE_FIELDS:
+            columns[field] = np.asarray(_VALUE_FIELDS[field], dtype=np.float64)[value]
+        elif field == "current_category":
+            columns[field] = (value - 1).astype(np.int8)
+        else:
+            columns[field] = value.astype(_CODE_DTYPES.get(field, np.int8))
+    if base_price is not None:
+        columns["base_price"] = np.broadcast_to(np.asarray(base_price, dtype=np.float64), codes.shape)
+    return columns
+
+
+def encode_profile_code(profile):
+    """main() 构造的 profile 字典 -> 画像编码"""
+    return int(pack_columns(encode_profiles([profile], [0.0]))[0])
+
+
+def decode_profile_code(code):
+    """画像编码 -> profile 字典 (结构与 main() 一致；未知商品类别还原为 "")"""
+    columns = unpack_columns([code])
+    mask = int(columns["history_mask"][0])
+    category = int(columns["current_category"][0])
+    return {
+        "user_type": USER_TYPES[columns["user_type"][0]],
+        "spending_level_norm": int(columns["spending_level_norm"][0]),
+        "device": DEVICES[columns["device"][0]],
+        "activity_score": int(columns["activity_score"][0]),
+        "frequency": FREQUENCIES[columns["frequency"][0]],
+        "return_rate": RETURN_RATES[columns["return_rate"][0]],
+        "purchase_period": PURCHASE_PERIODS[columns["purchase_period"][0]],
+        "history_categories": [c for i, c in enumerate(HISTORY_CATEGORIES) if mask >> i & 1],
+        "current_category": HISTORY_CATEGORIES[category] if category >= 0 else "",
+        "has_similar_in_cart": bool(columns["has_similar_in_cart"][0]),
+    }
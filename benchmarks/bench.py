@@ -0,0 +1,301 @@
+"""
+定价 / 渲染 / 整页重跑基准测试
+
+    python benchmarks/bench.py                          # 运行并写入 benchmarks/results.json
+    python benchmarks/bench.py --save-baseline          # 同时保存为基线 benchmarks/baseline.json
+    python benchmarks/bench.py --compare                # 与基线比较，退步超过阈值时返回非零
+
+每项基准多次重复取最小值与中位数 (单位：每次操作的微秒数)，画像语料使用固定种子生成，结果可复现。
+同一份代码在不同进程中的耗时可能整体相差数成 (内存布局、CPU 调度)，因此默认在 3 个独立子进程中各测一遍再合并。
+定价与映射函数的基准只依赖 pricing 等核心模块；app.py 只在渲染与整页重跑两组中按需导入。
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pricing  # noqa: E402
+from incremental import IncrementalPricer  # noqa: E402
+from pricing import PRODUCTS, calculate_price, calculate_price_logic  # noqa: E402
+from batch_pricing import (  # noqa: E402
+    USER_TYPES, SPENDING_LEVELS, DEVICES, ACTIVITY_SCORES, FREQUENCIES, RETURN_RATES,
+    PURCHASE_PERIODS, HISTORY_CATEGORIES, encode_profiles, price_columns,
+)
+
+DEFAULT_RESULTS = os.path.join(ROOT, "benchmarks", "results.json")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+# 每个样本的最短时长 (秒)：单次 fn() 过短时在一个样本内重复多次，避免计时噪声主导结果
+MIN_SAMPLE_SECONDS = 0.05
+
+
+def make_corpus(size, seed=0):
+    """固定种子生成 (商品名, 画像) 语料"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        name = rng.choice(list(PRODUCTS))
+        profile = {
+            "user_type": rng.choice(USER_TYPES),
+            "spending_level_norm": rng.choice(SPENDING_LEVELS),
+            "device": rng.choice(DEVICES),
+            "activity_score": rng.choice(ACTIVITY_SCORES),
+            "frequency": rng.choice(FREQUENCIES),
+            "return_rate": rng.choice(RETURN_RATES),
+            "purchase_period": rng.choice(PURCHASE_PERIODS),
+            "history_categories": [c for c in HISTORY_CATEGORIES if rng.random() < 0.4],
+            "current_category": PRODUCTS[name]["category"],
+            "has_similar_in_cart": rng.random() < 0.3,
+        }
+        corpus.append((name, profile))
+    return corpus
+
+
+def measure(fn, ops, repeat):
+    """
+    采集 repeat 个样本 (每次 fn() 完成 ops 个操作)，返回每操作微秒数的最小值/中位数。
+    每个样本连续调用 fn() loops 次，loops 由预热时的耗时估出，使样本不短于 MIN_SAMPLE_SECONDS。
+    """
+    start = time.perf_counter()
+    fn()  # 预热，同时估计单次耗时
+    loops = max(1, math.ceil(MIN_SAMPLE_SECONDS / max(time.perf_counter() - start, 1e-9)))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / (ops * loops) * 1e6)
+    return {"min_us": min(samples), "median_us": statistics.median(samples), "ops": ops, "repeat": repeat,
+            "loops": loops}
+
+
+# ==========================================
+# 各项基准
+# ==========================================
+
+def bench_pricing(corpus, repeat):
+    items = [(PRODUCTS[name]["base"], profile) for name, profile in corpus]
+    columns = encode_profiles([p for _, p in items], [b for b, _ in items])
+
+    def scalar():
+        for base, profile in items:
+            calculate_price_logic(base, profile)
+
+    def price_only():
+        for base, profile in items:
+            calculate_price(base, profile)
+
+    # 控件式变化：每一步只把一个字段换成语料中下一个画像的取值
+    rng = random.Random(len(corpus))
+    walk, current = [], dict(corpus[0][1])
+    for _, profile in corpus:
+        field = rng.choice(list(profile))
+        current = {**current, field: profile[field]}
+        walk.append(current)
+    pricer = IncrementalPricer()
+
+    def walk_full():
+        for profile in walk:
+            calculate_price_logic(599, profile)
+
+    def walk_incremental():
+        for profile in walk:
+            pricer.evaluate(599, profile)
+
+    return {
+        "pricing.calculate_price_logic": measure(scalar, len(items), repeat),
+        "pricing.price_only": measure(price_only, len(items), repeat),
+        "pricing.batch": measure(lambda: price_columns(columns), len(items), repeat),
+        "pricing.walk_full": measure(walk_full, len(walk), repeat),
+        "pricing.walk_incremental": measure(walk_incremental, len(walk), repeat),
+    }
+
+
+def bench_render(corpus, repeat):
+    import app  # 导入 Streamlit 页面脚本 (裸模式下执行页面配置)，只在需要渲染函数时才导入
+
+    factor_lists = [
+        [f for f in calculate_price_logic(PRODUCTS[name]["base"], profile)[1] if f.change != 0]
+        for name, profile in corpus[:1000]
+    ]
+
+    def render():
+        for factors in factor_lists:
+            app.create_factors_display(factors)
+
+    return {"render.create_factors_display": measure(render, len(factor_lists), repeat)}
+
+
+def bench_helpers(repeat):
+    spending = pricing.SPENDING_RANGES * 200
+    activity = pricing.ACTIVITY_LEVELS * 300
+    returns = pricing.RETURN_OPTIONS * 300
+
+    def helpers():
+        for r in spending:
+            pricing.normalize_spending(pricing.get_spending_value(r))
+        for a in activity:
+            pricing.map_activity_to_score(a)
+        for r in returns:
+            pricing.map_return_rate(r)
+
+    return {"helpers.label_maps": measure(helpers, len(spending) + len(activity) + len(returns), repeat)}
+
+
+def bench_rerun(repeat):
+    """用 Streamlit 的 AppTest 无界面驱动 app.py，测量整页重跑与控件变化重跑的延迟"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.run()
+    results = {"rerun.initial": measure(lambda: at.run(), 1, repeat)}
+
+    at.button[0].click().run()  # 揭晓价格
+    options = pricing.SPENDING_RANGES
+    state = {"i": 0}
+
+    def change_widget():
+        state["i"] += 1
+        at.selectbox[1].set_value(options[state["i"] % len(options)]).run()
+
+    results["rerun.revealed_widget_change"] = measure(change_widget, 1, repeat)
+    return results
+
+
+# ==========================================
+# 结果与比较
+# ==========================================
+
+def compare(results, baseline, threshold):
+    """
+    返回退步项列表：最小值与中位数都比基线慢 threshold 以上。
+    只看中位数时，一次偶然的调度抖动就可能误报；最小值反映无干扰时的耗时，两者同时变慢才算退步。
+    """
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None:
+            continue
+        min_ratio = current["min_us"] / base["min_us"]
+        median_ratio = current["median_us"] / base["median_us"]
+        flag = "REGRESSION" if min(min_ratio, median_ratio) > 1 + threshold else "ok"
+        print(f"{name:40s} min {base['min_us']:12.3f} -> {current['min_us']:12.3f} us  x{min_ratio:5.2f}   "
+              f"median x{median_ratio:5.2f}  {flag}")
+        if flag != "ok":
+            regressions.append(name)
+    return regressions
+
+
+def run_groups(groups, corpus_size, seed, repeat):
+    """在当前进程中运行指定分组，返回 {基准名: 结果}"""
+    corpus = make_corpus(corpus_size, seed)
+    benchmarks = {}
+    if "pricing" in groups:
+        benchmarks.update(bench_pricing(corpus, repeat))
+    if "render" in groups:
+        benchmarks.update(bench_render(corpus, repeat))
+    if "helpers" in groups:
+        benchmarks.update(bench_helpers(repeat))
+    if "rerun" in groups:
+        benchmarks.update(bench_rerun(repeat))
+    return benchmarks
+
+
+def run_processes(groups, corpus_size, seed, repeat, processes):
+    """
+    依次启动 processes 个子进程各运行一遍，合并结果：最小值取各进程最小值中的最小者，
+    中位数取各进程中位数的中位数。单个进程偶然落在慢的状态时不会左右比较结果。
+    """
+    parts = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(processes):
+            path = os.path.join(tmp, f"part{i}.json")
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", "--only", *groups,
+                            "--corpus", str(corpus_size), "--seed", str(seed), "--repeat", str(repeat),
+                            "--output", path], check=True, stdout=subprocess.DEVNULL)
+            with open(path, encoding="utf-8") as f:
+                parts.append(json.load(f))
+    merged = {}
+    for name in parts[0]:
+        runs = [part[name] for part in parts]
+        merged[name] = {
+            "min_us": min(r["min_us"] for r in runs),
+            "median_us": statistics.median(r["median_us"] for r in runs),
+            "ops": runs[0]["ops"],
+            "repeat": sum(r["repeat"] for r in runs),
+            "loops": runs[0]["loops"],
+            "processes": processes,
+        }
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="定价模拟器基准测试")
+    parser.add_argument("--corpus", type=int, default=20_000, help="画像语料大小")
+    parser.add_argument("--repeat", type=int, default=15, help="每个进程中每项基准的重复次数")
+    parser.add_argument("--processes", type=int, default=3, help="独立子进程数，1 表示在当前进程中运行")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", choices=["pricing", "render", "helpers", "rerun"],
+                        help="只运行指定分组")
+    parser.add_argument("--output", default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果另存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线比较")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定退步的相对阈值 (最小值与中位数都超过才算退步)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)  # 子进程：只把结果写入 --output
+    args = parser.parse_args(argv)
+
+    groups = args.only or ["pricing", "render", "helpers", "rerun"]
+    if args.worker or args.processes <= 1:
+        benchmarks = run_groups(groups, args.corpus, args.seed, args.repeat)
+    else:
+        benchmarks = run_processes(groups, args.corpus, args.seed, args.repeat, args.processes)
+    if args.worker:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(benchmarks, f)
+        return 0
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": args.corpus,
+            "seed": args.seed,
+            "processes": max(args.processes, 1),
+        },
+        "benchmarks": benchmarks,
+    }
+    for name, r in benchmarks.items():
+        print(f"{name:40s} min {r['min_us']:12.3f} us   median {r['median_us']:12.3f} us")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"基线文件不存在: {args.baseline}", file=sys.stderr)
+            return 2
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} 项退步: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
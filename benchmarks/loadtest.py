@@ -0,0 +1,370 @@
+"""
+多会话压测：本地启动 app.py，模拟许多浏览器会话并发操作，逐级加压
+
+    python benchmarks/loadtest.py                                      # 1 → 50 个会话逐级加压
+    python benchmarks/loadtest.py --levels 1,10,50,100 --duration 30 --think 0.5
+    python benchmarks/loadtest.py --url http://127.0.0.1:8501 --pid 12345   # 压测已在运行的实例
+
+每个会话通过 Streamlit 的 websocket 协议 (与浏览器相同的 protobuf 消息) 连接服务器，
+像真实用户一样随机修改九个画像控件、切换商品、点击「点击揭晓」/「隐藏价格」，
+测量从发出操作到服务器报告重跑结束的延迟。每个并发级别输出重跑延迟 p50/p95/p99、吞吐、
+服务器 CPU 占用、常驻内存与平均每会话内存。
+
+服务器的 CPU 与内存从 /proc 读取 (仅 Linux，其他平台显示为 "-")。
+压测客户端与服务器在同一台机器上会争用 CPU，精确的容量数字应在另一台机器上运行客户端 (配合 --url / --pid)。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# pricing_section 中的九个画像控件、商品选择器与揭晓/隐藏按钮 (按标签识别)
+PROFILE_LABELS = tuple(f"label_{i}" for i in range(1, 10))
+PRODUCT_LABEL = "点击下拉框选择商品"
+TOGGLE_LABELS = ("点击揭晓", "隐藏价格")
+# 每次操作的类型与权重
+ACTIONS = {"profile": 0.7, "product": 0.15, "toggle": 0.15}
+
+DEFAULT_LEVELS = (1, 2, 5, 10, 20, 50)
+
+
+# ==========================================
+# 1. 模拟会话
+# ==========================================
+
+class Session:
+    """
+    一个模拟的浏览器会话。和前端一样，记住改动过的控件取值并随每次重跑请求一起发送；
+    画像控件都在 pricing_section 片段内，操作时只请求重跑该片段。
+    """
+
+    def __init__(self, url, rng, timeout=30.0):
+        self.url = url
+        self.rng = rng
+        self.timeout = timeout
+        self.ws = None
+        self.widgets = {}      # 标签 -> (控件 id, 类型, 选项)
+        self.buttons = []      # 当前显示的揭晓 / 隐藏按钮 id
+        self.states = {}       # 控件 id -> WidgetState (只含改动过的控件)
+        self.fragment_id = ""
+
+    async def connect(self):
+        """建立连接并完成首屏整页运行，返回 (延迟, 字节数, 异常数)"""
+        self.ws = await connect(self.url, subprotocols=["streamlit"], max_size=None, open_timeout=self.timeout)
+        return await self.rerun()
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, trigger=None, fragment_id=""):
+        """发送一次重跑请求，等待 script_finished"""
+        msg = BackMsg()
+        states = msg.rerun_script.widget_states.widgets
+        states.extend(self.states.values())
+        if trigger is not None:
+            states.add(id=trigger, trigger_value=True)
+        msg.rerun_script.fragment_id = fragment_id
+
+        started = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        self.buttons = []
+        received = errors = 0
+        while True:
+            data = await asyncio.wait_for(self.ws.recv(), self.timeout)
+            received += len(data)
+            fwd = ForwardMsg()
+            fwd.ParseFromString(data)
+            kind = fwd.WhichOneof("type")
+            if kind == "delta":
+                errors += self._observe(fwd.delta)
+            elif kind == "script_finished" and fwd.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return time.perf_counter() - started, received, errors
+
+    def _observe(self, delta):
+        """记录本次运行渲染出的控件；返回是否为异常元素"""
+        if delta.WhichOneof("type") != "new_element":
+            return 0
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            return 1
+        if kind in ("selectbox", "radio", "multiselect"):
+            widget = getattr(element, kind)
+            if widget.label in PROFILE_LABELS or widget.label == PRODUCT_LABEL:
+                self.widgets[widget.label] = (widget.id, kind, list(widget.options))
+                self.fragment_id = delta.fragment_id
+        elif kind == "button" and any(label in element.button.label for label in TOGGLE_LABELS):
+            self.buttons.append(element.button.id)
+        return 0
+
+    async def act(self):
+        """随机执行一次用户操作，返回 (延迟, 字节数, 异常数)"""
+        action = self.rng.choices(tuple(ACTIONS), weights=tuple(ACTIONS.values()))[0]
+        if action == "toggle" and self.buttons:
+            return await self.rerun(trigger=self.rng.choice(self.buttons), fragment_id=self.fragment_id)
+
+        label = PRODUCT_LABEL if action == "product" else self.rng.choice(PROFILE_LABELS)
+        widget_id, kind, options = self.widgets[label]
+        state = WidgetState(id=widget_id)
+        if kind == "multiselect":
+            state.string_array_value.data.extend(self.rng.sample(options, self.rng.randint(0, len(options))))
+        else:
+            state.string_value = self.rng.choice(options)
+        self.states[widget_id] = state
+        return await self.rerun(fragment_id=self.fragment_id)
+
+
+class Recorder:
+    """收集当前并发级别的延迟样本"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.bytes = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def record(self, latency, received, errors):
+        self.latencies.append(latency)
+        self.bytes += received
+        self.errors += errors
+
+
+async def drive(session, recorder, think, stop):
+    """会话主循环：思考 (指数分布间隔) → 操作 → 记录，直到 stop 被设置或连接断开"""
+    while not stop.is_set():
+        if think > 0:
+            await asyncio.sleep(session.rng.expovariate(1.0 / think))
+        try:
+            recorder.record(*await session.act())
+        except (asyncio.TimeoutError, ConnectionClosed, OSError):
+            recorder.dropped += 1
+            return
+
+
+# ==========================================
+# 2. 被测服务器
+# ==========================================
+
+class ServerProcess:
+    """被压测的 Streamlit 进程：累计 CPU 时间与常驻内存从 /proc 读取"""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # 进程名可能含空格，从最后一个 ")" 之后开始数字段：utime / stime 为第 14 / 15 个字段
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, TypeError):
+            return None
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_bytes(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, TypeError):
+            pass
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def launch_server(app_path, port, log=None):
+    """在本机后台启动 streamlit run，返回 Popen"""
+    return subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app_path,
+         "--server.headless", "true", "--server.port", str(port), "--server.address", "127.0.0.1",
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, stdout=log or subprocess.DEVNULL, stderr=subprocess.STDOUT,
+    )
+
+
+def wait_healthy(base_url, timeout=60.0, process=None):
+    """轮询 /_stcore/health 直到服务器就绪"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"streamlit 进程提前退出 (返回码 {process.returncode})")
+        try:
+            with urllib.request.urlopen(f"{base_url}/_stcore/health", timeout=2) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{timeout:.0f}s 内服务器未就绪: {base_url}")
+
+
+def stream_url(base_url):
+    return base_url.replace("http://", "ws://", 1).replace("https://", "wss://", 1).rstrip("/") + "/_stcore/stream"
+
+
+# ==========================================
+# 3. 逐级加压
+# ==========================================
+
+def _ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 1) if len(values) else None
+
+
+async def warm_up(url, server, timeout):
+    """用一个会话走一遍揭晓 / 改画像，填好各级缓存；断开后的常驻内存作为每会话内存的基线"""
+    session = Session(url, random.Random(-1), timeout)
+    await session.connect()
+    for _ in range(5):
+        await session.act()
+    await session.close()
+    await asyncio.sleep(1.0)
+    return server.rss_bytes() if server else None
+
+
+async def run_levels(url, levels, duration, think, seed, server=None, timeout=30.0, report=print):
+    """按 levels 逐级增加会话数 (已有会话保持运行)，每级测量 duration 秒，返回每级汇总"""
+    baseline = await warm_up(url, server, timeout)
+    recorder, stop = Recorder(), asyncio.Event()
+    sessions, tasks, rows = [], [], []
+    try:
+        for level in levels:
+            new = [Session(url, random.Random(seed * 1_000_003 + len(sessions) + k), timeout)
+                   for k in range(max(level - len(sessions), 0))]
+            loads = await asyncio.gather(*(s.connect() for s in new), return_exceptions=True)
+            connected = [s for s, load in zip(new, loads) if not isinstance(load, BaseException)]
+            first_loads = [load[0] for load in loads if not isinstance(load, BaseException)]
+            sessions.extend(connected)
+            tasks.extend(asyncio.create_task(drive(s, recorder, think, stop)) for s in connected)
+
+            recorder.reset()
+            cpu_before = server.cpu_seconds() if server else None
+            started = time.perf_counter()
+            await asyncio.sleep(duration)
+            elapsed = time.perf_counter() - started
+            cpu_after = server.cpu_seconds() if server else None
+            rss = server.rss_bytes() if server else None
+
+            latencies = recorder.latencies
+            active = len(sessions) - sum(t.done() for t in tasks)
+            row = {
+                "并发": level,
+                "活跃会话": active,
+                "重跑次数": len(latencies),
+                "吞吐(次/秒)": round(len(latencies) / elapsed, 2),
+                "p50(ms)": _ms(latencies, 50),
+                "p95(ms)": _ms(latencies, 95),
+                "p99(ms)": _ms(latencies, 99),
+                "首屏p50(ms)": _ms(first_loads, 50),
+                "平均KB/次": round(recorder.bytes / len(latencies) / 1024, 1) if latencies else None,
+                "异常": recorder.errors,
+                "掉线": recorder.dropped + len(new) - len(connected),
+                "CPU%": (round((cpu_after - cpu_before) / elapsed * 100, 1)
+                         if cpu_before is not None and cpu_after is not None else None),
+                "内存MB": round(rss / 2 ** 20, 1) if rss is not None else None,
+                "每会话内存MB": (round((rss - baseline) / active / 2 ** 20, 2)
+                              if rss is not None and baseline is not None and active else None),
+            }
+            rows.append(row)
+            report(row)
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+    return rows
+
+
+COLUMNS = ("并发", "重跑次数", "吞吐(次/秒)", "p50(ms)", "p95(ms)", "p99(ms)", "首屏p50(ms)",
+           "平均KB/次", "异常", "掉线", "CPU%", "内存MB", "每会话内存MB")
+
+
+def format_row(row):
+    return "  ".join(f"{'-' if row[c] is None else row[c]:>10}" for c in COLUMNS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streamlit 多会话压测")
+    parser.add_argument("--levels", default=",".join(map(str, DEFAULT_LEVELS)),
+                        help="逗号分隔的并发会话数，逐级加压")
+    parser.add_argument("--duration", type=float, default=20.0, help="每级测量秒数")
+    parser.add_argument("--think", type=float, default=1.0, help="两次操作之间的平均思考时间 (秒)，0 表示不停操作")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="单次重跑的超时秒数，超时的会话记为掉线")
+    parser.add_argument("--url", help="压测已在运行的实例 (如 http://127.0.0.1:8501)，默认在本机启动 app.py")
+    parser.add_argument("--pid", type=int, help="配合 --url：被测进程的 pid，用于读取 CPU 与内存")
+    parser.add_argument("--app", default=os.path.join(ROOT, "app.py"))
+    parser.add_argument("--server-log", help="把本机启动的 streamlit 输出写入该文件")
+    parser.add_argument("--output", help="把每级结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+    levels = sorted({int(v) for v in args.levels.split(",") if v.strip()})
+
+    process = log = None
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log = open(args.server_log, "w") if args.server_log else None
+        process = launch_server(args.app, port, log)
+        pid = process.pid
+    try:
+        wait_healthy(base_url, process=process)
+        print("  ".join(f"{c:>10}" for c in COLUMNS))
+        rows = asyncio.run(run_levels(
+            stream_url(base_url), levels, args.duration, args.think, args.seed,
+            server=ServerProcess(pid) if pid else None, timeout=args.timeout,
+            report=lambda row: print(format_row(row), flush=True),
+        ))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if log is not None:
+            log.close()
+
+    if args.output:
+        results = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "url": args.url or "local",
+                "duration": args.duration,
+                "think": args.think,
+                "seed": args.seed,
+            },
+            "levels": rows,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
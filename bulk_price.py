@@ -0,0 +1,313 @@
+"""
+命令行批量定价：读取 CSV / JSONL 画像文件，流式写出定价结果
+
+    python bulk_price.py profiles.csv --output priced.jsonl --workers 4
+    cat profiles.jsonl | python bulk_price.py - --input-format jsonl > priced.jsonl
+
+每行一个画像，字段既可以是 main() 中控件的中文选项，也可以是映射后的取值：
+
+    product              商品名 (取自商品库，决定基准价与类别)；或给出 base_price 与 current_category
+    user_type            "我是新用户！" / "new"
+    spending             "100-500元"，或月消费金额 (如 300)；也可直接给 spending_level_norm
+    device               "苹果(iPhone)/鸿蒙" / "ios"
+    activity             "每天都会看看价格"；也可直接给 activity_score
+    frequency            "反复查看(急需)" / "often"
+    return_rate          "没有/几乎不退货" / "low"
+    purchase_period      "平时购买" / "normal"
+    history_categories   JSONL 中为数组，CSV 中用 | 分隔；"服装服饰类" / "服饰"
+    has_similar_in_cart  "是" / "否" / true / false (可省略，默认否)
+
+输入按块读取、按块定价、按块写出，内存只取决于块大小与并行块数，与文件大小无关。
+输出每行包含最终价格、差额、差异百分比与有效因素 (对价格有影响的因素)；无法解析的行写到标准错误并跳过。
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pricing import (
+    USER_TYPE_MAP, DEVICE_MAP, FREQ_MAP, RETURN_OPTIONS, PURCHASE_PERIOD_MAP, CART_MAP,
+    HISTORY_CATEGORY_MAP, SPENDING_RANGES, ACTIVITY_LEVELS, normalize_spending, get_spending_value,
+    map_activity_to_score, map_return_rate,
+)
+from service import BadRequest, price_item, validate_value
+
+DEFAULT_CHUNK_SIZE = 10_000
+# 进度报告的间隔 (秒)
+PROGRESS_INTERVAL = 2.0
+
+OUTPUT_FIELDS = ("line", "product", "base_price", "final_price", "diff", "diff_pct", "factors")
+
+
+# ==========================================
+# 1. 解析：中文选项或取值 -> profile
+# ==========================================
+
+def _choice(record, field, label_map):
+    """中文选项或取值都接受，返回取值"""
+    value = record.get(field)
+    if value is None or value == "":
+        raise BadRequest(f"缺少字段 {field}")
+    if not isinstance(value, str):
+        raise BadRequest(f"{field} 应为字符串: {value}")
+    if value in label_map:
+        return label_map[value]
+    if value in label_map.values():
+        return value
+    raise BadRequest(f"{field} 的取值无法识别: {value}")
+
+
+def _number(value, field):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{field} 应为数值: {value}") from None
+
+
+def _spending(record):
+    # spending_level_norm 已是编码表中的取值，不再归一化；只有月消费金额 spending 需要 normalize_spending
+    if record.get("spending_level_norm") not in (None, ""):
+        return validate_value("spending_level_norm", _number(record["spending_level_norm"], "spending_level_norm"))
+    value = record.get("spending")
+    if value in SPENDING_RANGES:
+        return normalize_spending(get_spending_value(value))
+    if value in (None, ""):
+        raise BadRequest("缺少字段 spending")
+    return normalize_spending(_number(value, "spending"))
+
+
+def _activity(record):
+    if record.get("activity_score") not in (None, ""):
+        return validate_value("activity_score", _number(record["activity_score"], "activity_score"))
+    value = record.get("activity")
+    if value in (None, ""):
+        raise BadRequest("缺少字段 activity")
+    if value not in ACTIVITY_LEVELS:
+        raise BadRequest(f"activity 的取值无法识别: {value}")
+    return map_activity_to_score(value)
+
+
+_RETURN_MAP = {option: map_return_rate(option) for option in RETURN_OPTIONS}
+
+
+def _history(record):
+    value = record.get("history_categories", [])
+    if isinstance(value, str):
+        value = [v.strip() for v in value.split("|") if v.strip()]
+    elif not isinstance(value, list):
+        raise BadRequest(f"history_categories 应为数组或以 | 分隔的字符串: {value}")
+    categories = []
+    for category in value:
+        if not isinstance(category, str):
+            raise BadRequest(f"history_categories 的取值无法识别: {category}")
+        if category in HISTORY_CATEGORY_MAP:
+            categories.append(HISTORY_CATEGORY_MAP[category])
+        elif category in HISTORY_CATEGORY_MAP.values():
+            categories.append(category)
+        else:
+            raise BadRequest(f"history_categories 的取值无法识别: {category}")
+    return categories
+
+
+def _cart(record):
+    value = record.get("has_similar_in_cart", False)
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in CART_MAP:
+        return CART_MAP[text]
+    if text in ("", "false", "0", "no"):
+        return False
+    if text in ("true", "1", "yes"):
+        return True
+    raise BadRequest(f"has_similar_in_cart 的取值无法识别: {value}")
+
+
+def parse_record(record):
+    """一条输入记录 -> service.price_item 接受的请求项 {"product"/"base_price", "profile"}"""
+    profile = {
+        "user_type": _choice(record, "user_type", USER_TYPE_MAP),
+        "spending_level_norm": _spending(record),
+        "device": _choice(record, "device", DEVICE_MAP),
+        "activity_score": _activity(record),
+        "frequency": _choice(record, "frequency", FREQ_MAP),
+        "return_rate": _choice(record, "return_rate", _RETURN_MAP),
+        "purchase_period": _choice(record, "purchase_period", PURCHASE_PERIOD_MAP),
+        "history_categories": _history(record),
+        "has_similar_in_cart": _cart(record),
+    }
+    item = {"profile": profile}
+    if record.get("product") not in (None, ""):
+        item["product"] = record["product"]
+    if record.get("base_price") not in (None, ""):
+        item["base_price"] = _number(record["base_price"], "base_price")
+    category = record.get("current_category")
+    if category not in (None, ""):
+        if not isinstance(category, str):
+            raise BadRequest(f"current_category 应为字符串: {category}")
+        profile["current_category"] = HISTORY_CATEGORY_MAP.get(category, category)
+    return item
+
+
+def price_record(record):
+    """一条输入记录 -> 输出记录 (只保留有效因素)"""
+    result = price_item(parse_record(record))
+    result["factors"] = [factor for factor in result["factors"] if factor["change"] != 0]
+    return result
+
+
+# ==========================================
+# 2. 流式读写
+# ==========================================
+
+def read_records(stream, input_format):
+    """逐条产出 (行号, 记录)；CSV 的行号从表头之后的第一行记为 1"""
+    if input_format == "csv":
+        for line, record in enumerate(csv.DictReader(stream), start=1):
+            yield line, record
+        return
+    for line, text in enumerate(stream, start=1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            record = None
+        yield line, record if isinstance(record, dict) else {"_invalid": text}
+
+
+def chunked(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _format_csv_row(result):
+    factors = "; ".join(f"{f['name']}({f['change']:+.2f})" for f in result["factors"])
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(
+        [result[field] if field != "factors" else factors for field in OUTPUT_FIELDS])
+    return buffer.getvalue()
+
+
+def price_chunk(task):
+    """
+    对一块记录定价，返回 (输出文本, 错误列表, 成功行数)。
+    在工作进程中执行，结果已序列化为文本，主进程只负责按顺序写出。
+    """
+    chunk, output_format = task
+    lines, errors = [], []
+    for line, record in chunk:
+        try:
+            if "_invalid" in record:
+                raise BadRequest("不是合法的 JSON 对象")
+            result = price_record(record)
+        except BadRequest as e:
+            errors.append(f"第 {line} 行: {e}")
+            continue
+        except Exception as e:  # 单行出错只跳过该行，不中断整个文件
+            errors.append(f"第 {line} 行: 处理失败 ({type(e).__name__}: {e})")
+            continue
+        result = {"line": line, **result}
+        if output_format == "csv":
+            lines.append(_format_csv_row(result))
+        else:
+            lines.append(json.dumps(result, ensure_ascii=False) + "\n")
+    return "".join(lines), errors, len(lines)
+
+
+def price_stream(records, output_format="jsonl", workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    按块定价，按输入顺序逐块产出 price_chunk 的结果。
+    并行时最多 2 × workers 个块在途，读取速度不会超前于写出太多，内存保持有界。
+    """
+    tasks = ((chunk, output_format) for chunk in chunked(records, chunk_size))
+    if workers <= 1:
+        yield from map(price_chunk, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(price_chunk, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _open_input(path, input_format):
+    """返回 (文本流, 是否为标准输入)；标准输入用新的文本包装器按 UTF-8 读取，用完需 detach 而不是 close"""
+    newline = "" if input_format == "csv" else None
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline=newline), True
+    return open(path, encoding="utf-8-sig", newline=newline), False
+
+
+def _detect_format(path, explicit):
+    if explicit:
+        return explicit
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量定价 CSV / JSONL 画像文件")
+    parser.add_argument("input", help="输入文件，- 表示标准输入")
+    parser.add_argument("--input-format", choices=("csv", "jsonl"), help="默认按扩展名判断 (.csv 以外视为 JSONL)")
+    parser.add_argument("--output", help="输出文件，默认写到标准输出")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="输出格式，默认按输出文件扩展名判断")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数，0 表示等于 CPU 核数")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块记录数")
+    parser.add_argument("--quiet", action="store_true", help="不输出进度")
+    args = parser.parse_args(argv)
+
+    input_format = _detect_format(args.input, args.input_format)
+    output_format = _detect_format(args.output or "", args.format)
+    workers = args.workers or os.cpu_count() or 1
+
+    source, from_stdin = _open_input(args.input, input_format)
+    sink = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    start = last_report = time.perf_counter()
+    priced = failed = 0
+    try:
+        if output_format == "csv":
+            sink.write(",".join(OUTPUT_FIELDS) + "\n")
+        for text, errors, count in price_stream(read_records(source, input_format), output_format,
+                                                workers, args.chunk_size):
+            sink.write(text)
+            priced += count
+            failed += len(errors)
+            for error in errors:
+                print(error, file=sys.stderr)
+            now = time.perf_counter()
+            if not args.quiet and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                print(f"已处理 {priced + failed:,} 行，{(priced + failed) / (now - start):,.0f} 行/秒",
+                      file=sys.stderr)
+    finally:
+        if from_stdin:
+            source.detach()  # 关闭包装器会连带关闭 sys.stdin.buffer
+        else:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"定价 {priced:,} 行，失败 {failed:,} 行，用时 {elapsed:.2f}s ({(priced + failed) / max(elapsed, 1e-9):,.0f} 行/秒)",
+          file=sys.stderr)
+    return 1 if failed and not priced else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
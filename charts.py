@@ -0,0 +1,219 @@
+"""
+价格分布图表
+
+群体模拟动辄上百万个价格，原样发给浏览器会拖垮 Streamlit 的 websocket 与前端。
+这里的图表全部在服务端先聚合：直方图、小提琴图、箱线图只接收分箱计数 (分箱数有上限)，
+散点图按固定点数预算抽样，点数较多时使用 WebGL (Scattergl)。
+无论人数多少，一个图表发送的数据量都不超过固定上限。
+
+数据来源有两种：population.PopulationStats (流式统计量) 与 results_store.Run (磁盘上的逐行结果)，
+对应的适配函数见本模块末尾。
+"""
+
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+
+# 散点图最多发送的点数
+POINT_BUDGET = int(os.environ.get("PRICE_SIM_CHART_POINTS", "5000"))
+# 直方图 / 小提琴图每组的最大分箱数
+MAX_BINS = 400
+# 点数超过该值时使用 WebGL 绘制
+WEBGL_THRESHOLD = 1000
+
+COLORS = ("#4ECDC4", "#FF6B6B", "#FFD93D", "#6C5CE7", "#A8E6CF", "#FF8B94")
+
+
+# ==========================================
+# 1. 分箱工具
+# ==========================================
+
+def coarsen(edges, counts, max_bins=MAX_BINS):
+    """
+    去掉两端的空分箱，并把相邻分箱合并到不超过 max_bins 个。
+    返回 (左边界, 分箱宽度, 计数)；全部为 0 时返回空数组。
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    counts = np.asarray(counts)
+    width = float(edges[1] - edges[0]) if len(edges) > 1 else 1.0
+    nonzero = np.flatnonzero(counts)
+    if len(nonzero) == 0:
+        return edges[:0], width, counts[:0]
+    lo, hi = nonzero[0], nonzero[-1] + 1
+    edges, counts = edges[lo:hi], counts[lo:hi]
+    factor = -(-len(counts) // max_bins)
+    if factor > 1:
+        pad = (-len(counts)) % factor
+        counts = np.concatenate([counts, np.zeros(pad, dtype=counts.dtype)]).reshape(-1, factor).sum(axis=1)
+        edges = edges[::factor]
+        width *= factor
+    return edges, width, counts
+
+
+def binned_quantiles(edges, width, counts, qs):
+    """分箱计数上的分位数 (箱内线性插值)"""
+    total = counts.sum()
+    cumulative = np.cumsum(counts)
+    values = []
+    for q in qs:
+        target = q * total
+        i = min(int(np.searchsorted(cumulative, target, side="left")), len(counts) - 1)
+        before = cumulative[i - 1] if i else 0
+        frac = (target - before) / counts[i] if counts[i] else 0.0
+        values.append(float(edges[i] + frac * width))
+    return values
+
+
+# ==========================================
+# 2. 图表
+# ==========================================
+
+def histogram_figure(edges, counts, title, xaxis_title="差异 (%)", color=COLORS[0], max_bins=MAX_BINS):
+    """预先分箱的直方图"""
+    edges, width, counts = coarsen(edges, counts, max_bins)
+    fig = go.Figure(go.Bar(x=edges + width / 2, y=counts, width=width, marker_color=color))
+    fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title="人数", bargap=0,
+                      height=360, margin=dict(t=50, b=40))
+    return fig
+
+
+def distribution_figure(groups, title, kind="violin", yaxis_title="差异 (%)", max_bins=MAX_BINS):
+    """
+    分组分布图。groups 为 [(分组名, 左边界, 计数), ...]，kind 为 "violin" 或 "box"。
+    箱线图使用预先计算的分位数 (q1 / 中位数 / q3 / P1 与 P99 作为须)，
+    小提琴图由分箱密度直接画出轮廓，两者都不需要原始数据点。
+    """
+    fig = go.Figure()
+    names = []
+    for k, (name, edges, counts) in enumerate(groups):
+        edges, width, counts = coarsen(edges, counts, max_bins)
+        if not len(counts):
+            continue
+        names.append(name)
+        color = COLORS[k % len(COLORS)]
+        p1, q1, median, q3, p99 = binned_quantiles(edges, width, counts, (0.01, 0.25, 0.5, 0.75, 0.99))
+        centers = edges + width / 2
+        mean = float(centers @ counts / counts.sum())
+        if kind == "box":
+            fig.add_trace(go.Box(
+                name=name, x=[name], q1=[q1], median=[median], q3=[q3], lowerfence=[p1], upperfence=[p99],
+                mean=[mean], marker_color=color, boxpoints=False,
+            ))
+            continue
+        # 密度按组内最大值归一到半宽 0.4，左右对称画出轮廓
+        half = counts / counts.max() * 0.4
+        position = len(names) - 1
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([position - half, (position + half)[::-1]]),
+            y=np.concatenate([centers, centers[::-1]]),
+            fill="toself", mode="lines", line=dict(color=color, width=1), name=name,
+            hoverinfo="name",
+        ))
+        fig.add_trace(go.Scatter(
+            x=[position, position, position], y=[q1, median, q3], mode="markers",
+            marker=dict(color="#2D3436", symbol=["line-ew-open", "circle", "line-ew-open"], size=10),
+            showlegend=False, hovertext=["Q1", "中位数", "Q3"], hoverinfo="text+y",
+        ))
+    if kind != "box":
+        fig.update_xaxes(tickvals=list(range(len(names))), ticktext=names)
+    fig.update_layout(title=title, yaxis_title=yaxis_title, showlegend=False,
+                      height=400, margin=dict(t=50, b=40))
+    return fig
+
+
+def scatter_figure(x, y, title, xaxis_title="基准价 (元)", yaxis_title="个性化价格 (元)",
+                   budget=POINT_BUDGET, seed=0, total=None):
+    """
+    散点图：点数超过 budget 时均匀抽样，超过 WEBGL_THRESHOLD 时使用 Scattergl。
+    total 为抽样前的总点数 (调用方已经抽样时传入，用于标题说明)。
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    total = total or len(x)
+    if len(x) > budget:
+        keep = np.sort(np.random.default_rng(seed).choice(len(x), budget, replace=False))
+        x, y = x[keep], y[keep]
+    trace = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    fig = go.Figure(trace(x=x, y=y, mode="markers", marker=dict(size=3, color=COLORS[0], opacity=0.5),
+                          name="个性化价格"))
+    _add_diagonal(fig, x)
+    if len(x) < total:
+        title = f"{title} (抽样 {len(x):,} / {total:,})"
+    fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title=yaxis_title,
+                      height=400, margin=dict(t=50, b=40))
+    return fig
+
+
+def binned_scatter_figure(x, y, weights, title, xaxis_title="基准价 (元)", yaxis_title="个性化价格 (元)",
+                          budget=POINT_BUDGET):
+    """
+    预先分箱的散点图：每个点代表一个 (x, y) 分箱，点的大小与颜色表示人数。
+    点数超过 budget 时只保留人数最多的 budget 个分箱。
+    """
+    x, y, weights = (np.asarray(v) for v in (x, y, weights))
+    if len(x) > budget:
+        keep = np.sort(np.argpartition(weights, len(weights) - budget)[-budget:])
+        x, y, weights = x[keep], y[keep], weights[keep]
+    trace = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    size = 4 + 16 * np.sqrt(weights / weights.max()) if len(weights) else weights
+    fig = go.Figure(trace(
+        x=x, y=y, mode="markers", name="人数",
+        marker=dict(size=size, color=weights, colorscale="Teal", showscale=True, colorbar=dict(title="人数")),
+        text=[f"{int(w):,} 人" for w in weights], hoverinfo="x+y+text",
+    ))
+    _add_diagonal(fig, x)
+    fig.update_layout(title=title, xaxis_title=xaxis_title, yaxis_title=yaxis_title, showlegend=False,
+                      height=400, margin=dict(t=50, b=40))
+    return fig
+
+
+def _add_diagonal(fig, x):
+    """个性化价格等于基准价的参考线"""
+    if len(x):
+        lo, hi = float(np.min(x)), float(np.max(x))
+        fig.add_trace(go.Scatter(x=[lo, hi], y=[lo, hi], mode="lines", name="基准价",
+                                 line=dict(color="#B2BEC3", dash="dash")))
+
+
+# ==========================================
+# 3. 数据来源适配
+# ==========================================
+
+def population_histogram(stats):
+    """PopulationStats -> (左边界, 计数)，溢出箱并入两端"""
+    return stats.sketch.histogram(bin_width=stats.sketch.resolution)
+
+
+def population_groups(stats, field, label=str):
+    """PopulationStats 某个人群维度的分组分布 -> distribution_figure 的 groups"""
+    from population import FIELD_VALUES
+
+    sketch = stats.segment_sketches[field]
+    return [(label(value), *sketch.histogram(bin_width=sketch.resolution, group=i))
+            for i, value in enumerate(FIELD_VALUES[field])]
+
+
+def population_price_points(stats, max_bins=MAX_BINS):
+    """
+    PopulationStats -> 基准价 vs 个性化价格的分箱点 (x, y, 人数)。
+    每个商品的差异百分比分布换算成价格：价格 = 基准价 × (1 + 差异% / 100)。
+    只给了商品名 (没有基准价) 的统计量无法换算，返回空数组。
+    """
+    if stats.product_bases is None:
+        empty = np.zeros(0)
+        return empty, empty, empty.astype(np.int64)
+    sketch = stats.product_sketch
+    xs, ys, weights = [], [], []
+    for i, base in enumerate(stats.product_bases):
+        edges, width, counts = coarsen(*sketch.histogram(bin_width=sketch.resolution, group=i), max_bins)
+        nonzero = counts > 0
+        xs.append(np.full(nonzero.sum(), float(base)))
+        ys.append(base * (1 + (edges[nonzero] + width / 2) / 100))
+        weights.append(counts[nonzero])
+    return np.concatenate(xs), np.concatenate(ys), np.concatenate(weights)
+
+
+def run_groups(run, by, filters=None, label=str):
+    """results_store.Run -> distribution_figure 的 groups"""
+    edges, histograms = run.histogram(by, filters)
+    return [(label(value), edges, counts) for value, counts in histograms.items()]
@@ -0,0 +1,141 @@
+"""
+反事实探索：如果我换一个选项，价格会怎样？
+
+对当前画像枚举九个输入中每一个的全部其他取值 (单项变化)，以及任意两个不同输入的取值组合 (两项变化)，
+全部变体拼成列数组后只调用一次批量定价。历史购买类别是多选项，其 "取值" 为勾选 / 取消某一个类别。
+"""
+
+import itertools
+
+import numpy as np
+
+from batch_pricing import (
+    USER_TYPES, SPENDING_LEVELS, DEVICES, ACTIVITY_SCORES, FREQUENCIES, RETURN_RATES,
+    PURCHASE_PERIODS, CART_STATES, HISTORY_CATEGORIES, encode_profiles,
+)
+from pricing import (
+    USER_TYPE_MAP, SPENDING_RANGES, DEVICE_MAP, ACTIVITY_LEVELS, FREQ_MAP, RETURN_OPTIONS,
+    PURCHASE_PERIOD_MAP, CART_MAP, HISTORY_CATEGORY_MAP, normalize_spending, get_spending_value,
+    map_activity_to_score, map_return_rate,
+)
+from rules import get_rules
+
+
+def _inverse(mapping):
+    return {v: k for k, v in mapping.items()}
+
+
+# 输入 -> (控件标题, 列名, 列中的全部取值, 取值 -> 控件选项文字)
+ATTRIBUTES = {
+    "user_type": ("用户身份", "user_type", range(len(USER_TYPES)),
+                  lambda code: _inverse(USER_TYPE_MAP)[USER_TYPES[code]]),
+    "spending": ("月消费", "spending_level_norm", SPENDING_LEVELS,
+                 {normalize_spending(get_spending_value(r)): r for r in SPENDING_RANGES}.get),
+    "device": ("设备", "device", range(len(DEVICES)),
+               lambda code: _inverse(DEVICE_MAP)[DEVICES[code]]),
+    "activity": ("活跃度", "activity_score", ACTIVITY_SCORES,
+                 {map_activity_to_score(a): a for a in ACTIVITY_LEVELS}.get),
+    "frequency": ("浏览频率", "frequency", range(len(FREQUENCIES)),
+                  lambda code: _inverse(FREQ_MAP)[FREQUENCIES[code]]),
+    "return_rate": ("退货习惯", "return_rate", range(len(RETURN_RATES)),
+                    lambda code: {map_return_rate(o): o for o in RETURN_OPTIONS}[RETURN_RATES[code]]),
+    "purchase_period": ("购买时期", "purchase_period", range(len(PURCHASE_PERIODS)),
+                        lambda code: _inverse(PURCHASE_PERIOD_MAP)[PURCHASE_PERIODS[code]]),
+    "cart": ("购物车相似商品", "has_similar_in_cart", CART_STATES,
+             lambda value: _inverse(CART_MAP)[value]),
+    # 取值为要翻转的类别位序
+    "history": ("历史购买类别", "history_mask", range(len(HISTORY_CATEGORIES)), None),
+}
+
+_ORDER = {attribute: i for i, attribute in enumerate(ATTRIBUTES)}
+
+
+def _variant(changes):
+    """一组 (输入, 取值) 变化 -> 按控件顺序排列的元组，作为变体的唯一键"""
+    return tuple(sorted(changes, key=lambda change: _ORDER[change[0]]))
+
+
+# 热力图可选的坐标轴 (历史类别是多选项，不适合作为单一坐标轴)
+GRID_ATTRIBUTES = tuple(key for key in ATTRIBUTES if key != "history")
+
+
+class Counterfactuals:
+    """
+    一次探索的结果。variants[i] 为一组 (输入, 取值) 变化，prices[i] 为对应价格；
+    第 0 个变体是不做任何变化的当前画像。
+    """
+
+    def __init__(self, base_price, current, variants, prices):
+        self.base_price = base_price
+        self.current = current
+        self.variants = variants
+        self.prices = prices
+        self._index = {variant: i for i, variant in enumerate(variants)}
+
+    def describe(self, attribute, value):
+        title, _, _, label = ATTRIBUTES[attribute]
+        if attribute == "history":
+            category = HISTORY_CATEGORIES[value]
+            checked = self.current["history_mask"] >> value & 1
+            return f"{title}: {'取消' if checked else '勾选'}「{_inverse(HISTORY_CATEGORY_MAP)[category]}」"
+        return f"{title}: {label(value)}"
+
+    def rows(self):
+        """除当前画像外的全部变体，按差价从低到高排列 (最省钱的变化在前)"""
+        price = float(self.prices[0])
+        order = np.argsort(self.prices[1:], kind="stable") + 1
+        return [{
+            "变化": " + ".join(self.describe(a, v) for a, v in self.variants[i]),
+            "改动项数": len(self.variants[i]),
+            "新价格": float(self.prices[i]),
+            "差价": round(float(self.prices[i]) - price, 2),
+            "差价%": (float(self.prices[i]) - price) / price * 100 if price else 0.0,
+        } for i in order]
+
+    def grid(self, row_attribute, column_attribute):
+        """两个输入全部取值组合下的价格矩阵，返回 (行标签, 列标签, 价格矩阵)"""
+        rows, columns = (ATTRIBUTES[a] for a in (row_attribute, column_attribute))
+        current = {a: self.current[ATTRIBUTES[a][1]] for a in (row_attribute, column_attribute)}
+        matrix = np.empty((len(rows[2]), len(columns[2])))
+        for i, row_value in enumerate(rows[2]):
+            for j, column_value in enumerate(columns[2]):
+                changes = [(a, v) for a, v in ((row_attribute, row_value), (column_attribute, column_value))
+                           if v != current[a]]
+                matrix[i, j] = self.prices[self._index[_variant(changes)]]
+        return [rows[3](v) for v in rows[2]], [columns[3](v) for v in columns[2]], matrix
+
+
+def _alternatives(attribute, current):
+    """某个输入除当前取值外的全部取值"""
+    _, column, values, _ = ATTRIBUTES[attribute]
+    if attribute == "history":
+        return list(values)
+    return [v for v in values if v != current[column]]
+
+
+def explore(base_price, profile, rules=None):
+    """
+    对 main() 构造的画像枚举全部单项与两项变化，一次批量定价。
+    九个输入在默认选项下约 200 个变体，批量求值耗时在毫秒级。
+    """
+    encoded = encode_profiles([profile], [base_price])
+    current = {name: column[0].item() for name, column in encoded.items()}
+
+    singles = [(a, v) for a in ATTRIBUTES for v in _alternatives(a, current)]
+    variants = [()] + [(change,) for change in singles]
+    for (a, va), (b, vb) in itertools.combinations(singles, 2):
+        if a != b:
+            variants.append(_variant(((a, va), (b, vb))))
+
+    n = len(variants)
+    columns = {name: np.repeat(column, n) for name, column in encoded.items()}
+    for i, variant in enumerate(variants):
+        for attribute, value in variant:
+            column = ATTRIBUTES[attribute][1]
+            if attribute == "history":
+                columns[column][i] ^= 1 << value
+            else:
+                columns[column][i] = value
+
+    prices, _ = (rules or get_rules()).evaluate_batch(columns, with_contributions=False)
+    return Counterfactuals(base_price, current, variants, prices)
@@ -0,0 +1,84 @@
+"""
+增量定价
+
+每条规则只读取少数几个字段 (设备规则读 device / spending_level_norm / base_price，
+退货规则读 purchase_period / return_rate / base_price ...)。IncrementalPricer 记住每条规则上一次的
+依赖字段取值与结果，画像变化时只重算依赖字段发生变化的规则，其余规则直接复用结果，再按规则顺序重新累加。
+累加顺序与 calculate_price_logic 相同，价格与因素明细完全一致。
+
+    pricer = IncrementalPricer()
+    price, factors = pricer.evaluate(base_price, profile)     # 控件变化后再次调用即可
+    pricer.sweep(base_price, profile, "spending_level_norm", SPENDING_LEVELS)
+    pricer.stats()
+"""
+
+from rules import get_rules
+
+_UNSET = object()
+
+
+class IncrementalPricer:
+    """
+    按规则缓存的增量求值器。未指定 rules 时跟随 get_rules()，规则集热加载后自动清空缓存。
+    实例内部有可变状态，不是线程安全的：每个会话 / 线程各用一个。
+    """
+
+    def __init__(self, rules=None):
+        self._pinned = rules
+        self._rules = None
+        self.rule_fields = ()
+        self.reset_stats()
+
+    def _sync(self):
+        rules = self._pinned or get_rules()
+        if rules is not self._rules:
+            self._rules = rules
+            self.rule_fields, fields, self._evaluate = rules.incremental_evaluator()
+            # 哨兵与任何取值都不相等，第一次求值时全部规则都会计算
+            self._last = [_UNSET] * len(fields)
+            self._items = [None] * (len(self.rule_fields) + 1)
+            self.reset_stats()
+        return rules
+
+    def reset_stats(self):
+        self.evaluations = 0
+        self._misses = [0] * len(self.rule_fields) if self._rules is not None else []
+
+    def evaluate(self, base_price, profile):
+        """与 calculate_price_logic 相同的 (价格, 因素明细)"""
+        self._sync()
+        self.evaluations += 1
+        return self._evaluate(base_price, profile, self._last, self._items, self._misses)
+
+    def sweep(self, base_price, profile, field, values):
+        """
+        只改变一个字段的扫描 (field 为画像键或 "base_price")，返回每个取值下的价格列表。
+        不依赖该字段的规则在整个扫描中只计算一次。
+        """
+        prices = []
+        if field == "base_price":
+            for value in values:
+                prices.append(self.evaluate(value, profile)[0])
+            return prices
+        profile = dict(profile)
+        for value in values:
+            profile[field] = value
+            prices.append(self.evaluate(base_price, profile)[0])
+        return prices
+
+    def stats(self):
+        """命中 / 未命中次数 (按规则与合计)；命中表示该规则直接复用了上次的结果"""
+        if self._rules is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0.0, "rules": {}}
+        rules = {
+            rule_id: {"fields": fields, "hits": self.evaluations - misses, "misses": misses}
+            for rule_id, fields, misses in zip(self._rules.rule_ids, self.rule_fields, self._misses)
+        }
+        misses = sum(self._misses)
+        total = self.evaluations * len(self.rule_fields)
+        return {
+            "hits": total - misses,
+            "misses": misses,
+            "hit_rate": (total - misses) / total if total else 0.0,
+            "rules": rules,
+        }
@@ -0,0 +1,369 @@
+"""
+用户旅程模拟：同一个人的价格如何随时间变化？
+
+    python journey.py --users 1000000 --days 365 --seed 0 --output journey.json
+
+静态模型里画像是固定的；现实中画像会随行为演变 —— 第一次点开享受 "首次浏览" 优惠，
+反复查看后变成 "急需" 加价，下单后从新客变成普通用户、再变成老用户，大促期间进入特殊时期。
+这里把一整个用户群体的状态保存为列数组，按日历逐日推进：
+
+    报价 (当天若来访会看到的价格) -> 浏览 -> 加购 -> 下单 -> 到期退货 -> 更新画像
+
+每天对全体用户调用一次批量定价 (与 calculate_price_logic 逐元素一致)，事件全部是向量化的伯努利抽样，
+一百万用户 × 365 天在单机上几分钟内完成。每天只保留可序列化的汇总，
+另可跟踪少量用户的完整轨迹，或把全体用户的逐日价格写入内存映射的 .npy 文件。
+"""
+
+import argparse
+import datetime
+import json
+import sys
+import time
+
+import numpy as np
+
+from batch_pricing import (
+    USER_TYPES, DEVICES, ACTIVITY_SCORES, FREQUENCIES, RETURN_RATES, PURCHASE_PERIODS,
+    HISTORY_CATEGORIES, category_code,
+)
+from population import DEFAULT_MARGINALS, _weight, sample_chunks
+from pricing import PRODUCTS
+from rules import get_rules
+
+# ==========================================
+# 1. 日历与行为参数
+# ==========================================
+
+# 大促窗口：(名称, 开始 "月-日", 结束 "月-日")，首尾两天都算在内
+DEFAULT_PROMOS = (
+    ("618", "06-01", "06-18"),
+    ("双11", "11-01", "11-11"),
+    ("双12", "12-12", "12-12"),
+)
+
+# 新注册的一批用户：全部是新客、没有历史购买、第一次看到目标商品
+COHORT_MARGINALS = {
+    **DEFAULT_MARGINALS,
+    "user_type": {"new": 1},
+    "frequency": {"rare": 1},
+    "return_rate": {"medium": 1},
+    "has_similar_in_cart": {False: 1},
+}
+COHORT_HISTORY_PROBS = {}
+
+# 行为参数 (概率均按 "每天" 或 "每次来访" 计)
+DEFAULT_BEHAVIOR = {
+    # 按活跃度得分的每日来访概率
+    "visit": {20: 0.08, 50: 0.25, 80: 0.6},
+    # 来访时把相似商品加入购物车的概率
+    "cart": 0.1,
+    # 来访时下单的基础概率；大促期间与购物车中已有相似商品时分别乘以对应倍数
+    "buy": 0.05,
+    "promo_boost": 2.5,
+    "cart_boost": 1.5,
+    # 价格弹性：报价每比基准价高 1%，下单概率下降 elasticity%
+    "elasticity": 2.0,
+    # 按初始退货习惯的退货概率，以及下单到退货的天数
+    "return": {"low": 0.03, "medium": 0.12, "high": 0.35},
+    "return_delay": 7,
+    # 对同一商品的浏览次数达到该值后视为 "反复查看"
+    "often_views": 4,
+    # 累计下单达到该次数后成为老用户 (第一次下单后即为普通用户)
+    "loyal_purchases": 5,
+    # 下单满该次数后，按实际退货比例重新判定退货习惯：(低于该比例为 "几乎不退货", 低于该比例为 "偶尔退货")
+    "return_observed_after": 3,
+    "return_thresholds": (0.1, 0.3),
+}
+
+
+class Calendar:
+    """从 start 开始的连续 days 天，special[d] 表示第 d 天是否处于大促窗口"""
+
+    def __init__(self, days=365, start=datetime.date(2025, 1, 1), promos=DEFAULT_PROMOS):
+        self.start = start
+        self.days = days
+        self.dates = [start + datetime.timedelta(days=d) for d in range(days)]
+        self.labels = [""] * days
+        for name, first, last in promos:
+            for d, date in enumerate(self.dates):
+                day = date.strftime("%m-%d")
+                if first <= day <= last:
+                    self.labels[d] = name
+        self.special = np.array([bool(label) for label in self.labels])
+
+
+# ==========================================
+# 2. 群体状态
+# ==========================================
+
+_PRICE_ARGS = (
+    "user_type", "spending_level_norm", "device", "activity_score", "frequency", "return_rate",
+    "purchase_period", "history_mask", "current_category", "has_similar_in_cart", "base_price",
+)
+
+
+class Cohort:
+    """
+    一批用户的状态，每个字段一个长度为 n 的数组。
+    columns 与批量定价的列一一对应 (frequency 由浏览次数推出)，其余数组为行为状态。
+    """
+
+    def __init__(self, columns, product, products, behavior):
+        self.products = list(products)
+        self.bases = np.array([products[name]["base"] for name in self.products], dtype=np.float64)
+        self.categories = np.array([category_code(products[name]["category"]) for name in self.products])
+        self.behavior = behavior
+        self.n = len(product)
+
+        self.columns = {name: np.array(columns[name]) for name in _PRICE_ARGS}
+        self.columns["user_type"] = self.columns["user_type"].astype(np.int8)
+        self.product = product.astype(np.int16)
+
+        # 与初始画像一致的行为计数
+        often, rare = FREQUENCIES.index("often"), FREQUENCIES.index("rare")
+        frequency = self.columns["frequency"]
+        self.views = np.where(frequency == rare, 0, np.where(frequency == often, behavior["often_views"], 1)).astype(np.int16)
+        user_type = self.columns["user_type"]
+        self.purchases = np.select(
+            [user_type == USER_TYPES.index("new"), user_type == USER_TYPES.index("loyal")],
+            [0, behavior["loyal_purchases"]], 1,
+        ).astype(np.int16)
+        self.returns = np.zeros(self.n, dtype=np.int16)
+        # 退货倾向由初始退货习惯决定，之后观察到的退货习惯按实际退货比例更新
+        return_p = np.array([_weight(behavior["return"], code) for code in RETURN_RATES])
+        self.return_p = return_p[self.columns["return_rate"]]
+        self.return_due = np.full(self.n, -1, dtype=np.int32)
+        self.return_amount = np.zeros(self.n)
+        visit_p = np.array([_weight(behavior["visit"], score) for score in ACTIVITY_SCORES])
+        self.visit_p = visit_p[np.searchsorted(ACTIVITY_SCORES, self.columns["activity_score"])]
+
+    def quote(self, special):
+        """当天的报价：每个用户若来访，看到的目标商品价格"""
+        self.columns["purchase_period"][:] = PURCHASE_PERIODS.index("special" if special else "normal")
+        often_views = self.behavior["often_views"]
+        self.columns["frequency"] = np.select(
+            [self.views == 0, self.views >= often_views],
+            [FREQUENCIES.index("rare"), FREQUENCIES.index("often")], FREQUENCIES.index("sometimes"),
+        )
+        prices, _ = get_rules().evaluate_batch(self.columns, with_contributions=False)
+        return prices
+
+    def step(self, day, special, prices, rng):
+        """推进一天，返回当天的事件计数与营收"""
+        b = self.behavior
+        columns = self.columns
+        n = self.n
+
+        # 到期退货 (退款按下单时的成交价)
+        returning = self.return_due == day
+        refunds = float(self.return_amount[returning].sum())
+        self.returns += returning
+        self.return_due[returning] = -1
+
+        visit = rng.random(n) < self.visit_p
+        cart = visit & ~columns["has_similar_in_cart"] & (rng.random(n) < b["cart"])
+
+        base = columns["base_price"]
+        buy_p = b["buy"] * np.clip(1 - b["elasticity"] * (prices - base) / base, 0.0, None)
+        buy_p *= np.where(columns["has_similar_in_cart"], b["cart_boost"], 1.0)
+        if special:
+            buy_p *= b["promo_boost"]
+        buy = visit & (rng.random(n) < buy_p)
+        columns["has_similar_in_cart"] |= cart
+        self.views += visit & ~buy
+
+        # 下单：记入历史类别、清空购物车、可能在若干天后退货，再换一个新的目标商品
+        bought = np.flatnonzero(buy)
+        revenue = float(prices[bought].sum())
+        self.purchases[bought] += 1
+        category = columns["current_category"][bought]
+        known = category >= 0
+        columns["history_mask"][bought[known]] |= (1 << category[known]).astype(columns["history_mask"].dtype)
+        columns["has_similar_in_cart"][bought] = False
+        will_return = bought[rng.random(len(bought)) < self.return_p[bought]]
+        # 每个用户同时只有一笔待退款：已有待退款时不再安排新的退货，以免覆盖先前的退款
+        will_return = will_return[self.return_due[will_return] == -1]
+        self.return_due[will_return] = day + b["return_delay"]
+        self.return_amount[will_return] = prices[will_return]
+
+        purchases = self.purchases[bought]
+        columns["user_type"][bought] = np.where(
+            purchases >= b["loyal_purchases"], USER_TYPES.index("loyal"), USER_TYPES.index("regular"))
+        observed = bought[purchases >= b["return_observed_after"]]
+        ratio = self.returns[observed] / self.purchases[observed]
+        columns["return_rate"][observed] = np.digitize(ratio, b["return_thresholds"])
+
+        next_product = rng.integers(len(self.products), size=len(bought))
+        self.product[bought] = next_product
+        columns["base_price"][bought] = self.bases[next_product]
+        columns["current_category"][bought] = self.categories[next_product]
+        self.views[bought] = 0
+
+        return {
+            "visits": int(visit.sum()),
+            "carts": int(cart.sum()),
+            "purchases": len(bought),
+            "returns": int(returning.sum()),
+            "revenue": revenue - refunds,
+        }
+
+    def profile(self, i):
+        """第 i 个用户当前的画像，与 main() 构造的 profile 结构相同 (用于核对与展示)"""
+        columns = self.columns
+        mask = int(columns["history_mask"][i])
+        category = int(columns["current_category"][i])
+        return {
+            "user_type": USER_TYPES[columns["user_type"][i]],
+            "spending_level_norm": columns["spending_level_norm"][i].item(),
+            "device": DEVICES[columns["device"][i]],
+            "activity_score": columns["activity_score"][i].item(),
+            "frequency": FREQUENCIES[columns["frequency"][i]],
+            "return_rate": RETURN_RATES[columns["return_rate"][i]],
+            "purchase_period": PURCHASE_PERIODS[columns["purchase_period"][i]],
+            "history_categories": [c for k, c in enumerate(HISTORY_CATEGORIES) if mask >> k & 1],
+            "current_category": HISTORY_CATEGORIES[category] if category >= 0 else "",
+            "has_similar_in_cart": bool(columns["has_similar_in_cart"][i]),
+        }
+
+
+def new_cohort(n_users, products=PRODUCTS, rng=None, marginals=None, history_probs=None,
+               product_weights=None, behavior=None):
+    """
+    按边际分布抽样一批用户 (默认为新注册的一批新客，见 COHORT_MARGINALS)。
+    marginals / history_probs 与 population.py 的格式相同。
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    behavior = {**DEFAULT_BEHAVIOR, **(behavior or {})}
+    marginals = {**COHORT_MARGINALS, **(marginals or {})}
+    # 未列出的类别不会被选中 (sample_chunks 会用默认概率补全，这里先补 0)
+    history_probs = {**{c: 0.0 for c in HISTORY_CATEGORIES}, **(history_probs or COHORT_HISTORY_PROBS)}
+    columns, product = next(sample_chunks(n_users, products, rng, marginals, history_probs,
+                                          product_weights, chunk_size=max(n_users, 1)))
+    return Cohort(columns, product, products, behavior)
+
+
+# ==========================================
+# 3. 逐日模拟
+# ==========================================
+
+class JourneyStats:
+    """逐日汇总 (均可序列化) 与被跟踪用户的完整轨迹"""
+
+    def __init__(self, calendar, tracked):
+        self.calendar = calendar
+        self.tracked = np.asarray(tracked, dtype=np.int64)
+        self.days = []
+        self.trajectories = np.empty((calendar.days, len(self.tracked)))
+        self.tracked_types = np.empty((calendar.days, len(self.tracked)), dtype=np.int8)
+
+    def observe(self, day, cohort, prices):
+        """记录当天的报价 (在事件作用到 cohort 之前调用，人群划分与报价对应同一时刻的画像)"""
+        base = cohort.columns["base_price"]
+        diff_pct = (prices - base) / base * 100
+        user_type = cohort.columns["user_type"]
+        counts = np.bincount(user_type, minlength=len(USER_TYPES))
+        by_type = np.bincount(user_type, weights=diff_pct, minlength=len(USER_TYPES))
+        self.days.append({
+            "日期": self.calendar.dates[day].isoformat(),
+            "大促": self.calendar.labels[day],
+            "平均报价": float(prices.mean()),
+            "平均差异%": float(diff_pct.mean()),
+            **{f"{t}人数": int(c) for t, c in zip(USER_TYPES, counts)},
+            **{f"{t}平均差异%": float(s / c) if c else None for t, s, c in zip(USER_TYPES, by_type, counts)},
+        })
+        self.trajectories[day] = prices[self.tracked]
+        self.tracked_types[day] = user_type[self.tracked]
+
+    def record(self, day, events):
+        """记录当天的事件计数与营收"""
+        self.days[day].update({
+            "来访": events["visits"],
+            "加购": events["carts"],
+            "下单": events["purchases"],
+            "退货": events["returns"],
+            "净营收": events["revenue"],
+        })
+
+    def tracked_rows(self, k):
+        """第 k 个被跟踪用户的逐日报价"""
+        return [
+            {"日期": date.isoformat(), "大促": label, "报价": float(price), "用户身份": USER_TYPES[t]}
+            for date, label, price, t in zip(self.calendar.dates, self.calendar.labels,
+                                             self.trajectories[:, k], self.tracked_types[:, k])
+        ]
+
+    def summary(self):
+        return {
+            "days": self.days,
+            "tracked": {int(i): self.tracked_rows(k) for k, i in enumerate(self.tracked)},
+        }
+
+
+def simulate_journey(n_users, days=365, products=PRODUCTS, seed=None, calendar=None, track=5,
+                     trajectories_path=None, marginals=None, history_probs=None,
+                     product_weights=None, behavior=None):
+    """
+    模拟一批用户在日历上的旅程，返回 JourneyStats。
+    trajectories_path 给出时把全体用户的逐日报价写入形状为 (days, n_users) 的 float32 .npy 文件 (内存映射，逐日写入)。
+    """
+    rng = np.random.default_rng(seed)
+    calendar = calendar or Calendar(days)
+    cohort = new_cohort(n_users, products, rng, marginals, history_probs, product_weights, behavior)
+    stats = JourneyStats(calendar, range(min(track, n_users)))
+    out = None
+    if trajectories_path:
+        out = np.lib.format.open_memmap(trajectories_path, mode="w+", dtype=np.float32,
+                                        shape=(calendar.days, n_users))
+    for day in range(calendar.days):
+        special = bool(calendar.special[day])
+        prices = cohort.quote(special)
+        stats.observe(day, cohort, prices)
+        if out is not None:
+            out[day] = prices
+        stats.record(day, cohort.step(day, special, prices, rng))
+    if out is not None:
+        out.flush()
+    return stats
+
+
+def main(argv=None):
+    """命令行入口：python journey.py --users 1000000 --days 365"""
+    parser = argparse.ArgumentParser(description="按日历逐日模拟用户旅程与价格轨迹")
+    parser.add_argument("--users", type=int, default=100_000, help="模拟用户数")
+    parser.add_argument("--days", type=int, default=365, help="模拟天数")
+    parser.add_argument("--start", default="2025-01-01", help="起始日期")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--track", type=int, default=5, help="在汇总中保留完整轨迹的用户数")
+    parser.add_argument("--config", help="JSON 配置，可含 marginals / history_probs / product_weights / behavior / promos")
+    parser.add_argument("--trajectories", help="把全体用户的逐日报价写入该 .npy 文件")
+    parser.add_argument("--output", help="把逐日汇总写入该 JSON 文件，默认打印到标准输出")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+    calendar = Calendar(args.days, datetime.date.fromisoformat(args.start),
+                        [tuple(p) for p in config.get("promos", DEFAULT_PROMOS)])
+
+    start = time.perf_counter()
+    stats = simulate_journey(
+        args.users, args.days, seed=args.seed, calendar=calendar, track=args.track,
+        trajectories_path=args.trajectories, marginals=config.get("marginals"),
+        history_probs=config.get("history_probs"), product_weights=config.get("product_weights"),
+        behavior=config.get("behavior"),
+    )
+    elapsed = time.perf_counter() - start
+
+    text = json.dumps(stats.summary(), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    steps = args.users * args.days
+    print(f"模拟 {args.users:,} 人 × {args.days} 天，用时 {elapsed:.2f}s ({steps / elapsed:,.0f} 人·天/秒)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+重跑耗时埋点 (可选开启)
+
+    PRICE_SIM_METRICS=1 streamlit run app.py
+
+开启后 main() 中各个命名区段的耗时记入进程内直方图 (以及其他模块注册的计数器)，并以 Prometheus 文本格式导出：
+  - PRICE_SIM_METRICS_PORT (默认 9108)：本地 HTTP 端点 http://127.0.0.1:9108/metrics
+  - PRICE_SIM_METRICS_FILE：设置后每 PRICE_SIM_METRICS_INTERVAL 秒 (默认 15) 写入该文件
+未开启时 start() / stop() / section() 只做一次布尔判断，可以常驻生产代码。
+"""
+
+import bisect
+import contextlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENABLED = os.environ.get("PRICE_SIM_METRICS", "0") == "1"
+
+# 直方图分桶上界 (秒)：100us ~ 10s 按 1-2.5-5 递增
+BUCKETS = tuple(round(m * 10.0 ** e, 6) for e in range(-4, 1) for m in (1, 2.5, 5)) + (10.0,)
+
+METRIC_NAME = "price_sim_section_seconds"
+
+
+class Histogram:
+    """固定分桶直方图，线程安全；分位数按桶内线性插值估计"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def quantile(self, q):
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return float("nan")
+        target = q * total
+        cumulative = 0
+        for i, c in enumerate(counts):
+            if cumulative + c >= target and c:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (target - cumulative) / c
+            cumulative += c
+        return BUCKETS[-1]
+
+
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+def observe(name, seconds):
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    histogram.observe(seconds)
+
+
+def start():
+    """开始计时，未开启埋点时返回 0"""
+    return time.perf_counter() if ENABLED else 0.0
+
+
+def stop(name, started):
+    """结束计时并记入名为 name 的区段"""
+    if ENABLED:
+        observe(name, time.perf_counter() - started)
+
+
+_NOOP = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def section(name):
+    """with metrics.section("pricing"): ...  未开启时返回共享的空上下文"""
+    return _timed(name) if ENABLED else _NOOP
+
+
+# 其他模块注册的计数器 / 仪表 (如共享结果缓存的命中率)，
+# 每个收集函数返回 [(指标名, "counter" 或 "gauge", 说明, 数值), ...]
+_collectors = []
+
+
+def register_collector(collect):
+    _collectors.append(collect)
+
+
+# ==========================================
+# 导出
+# ==========================================
+
+def render_prometheus():
+    """全部直方图的 Prometheus 文本格式"""
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in each named section of an app rerun.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    quantile_lines = [
+        f"# HELP {METRIC_NAME}_quantile Estimated p50/p99 per section.",
+        f"# TYPE {METRIC_NAME}_quantile gauge",
+    ]
+    for name in sorted(_histograms):
+        histogram = _histograms[name]
+        with histogram._lock:
+            counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+        cumulative = 0
+        for upper, c in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += c
+            le = "+Inf" if upper == float("inf") else repr(upper)
+            lines.append(f'{METRIC_NAME}_bucket{{section="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{section="{name}"}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{section="{name}"}} {count}')
+        for q in (0.5, 0.99):
+            quantile_lines.append(
+                f'{METRIC_NAME}_quantile{{section="{name}",quantile="{q}"}} {histogram.quantile(q)}')
+    collected = []
+    for collect in _collectors:
+        for name, kind, help_text, value in collect():
+            collected += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines + quantile_lines + collected) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _flush_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp_path, path)
+
+
+_exporter_started = False
+
+
+def ensure_exporter():
+    """开启埋点时启动一次导出线程 (HTTP 端点和/或定期写文件)，重复调用无副作用"""
+    global _exporter_started
+    if not ENABLED or _exporter_started:
+        return
+    with _registry_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+        path = os.environ.get("PRICE_SIM_METRICS_FILE")
+        if path:
+            interval = float(os.environ.get("PRICE_SIM_METRICS_INTERVAL", "15"))
+            threading.Thread(target=_flush_loop, args=(path, interval), daemon=True).start()
+        port = int(os.environ.get("PRICE_SIM_METRICS_PORT", "9108"))
+        if port:
+            try:
+                server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+            except OSError:
+                return  # 端口被占用 (如多个进程)，只保留文件导出
+            threading.Thread(target=server.serve_forever, daemon=True).start()
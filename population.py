@@ -0,0 +1,592 @@
+"""
+群体价格分布模拟 (流式、内存有界)
+
+按可配置的边际分布抽样用户，分块送入批量定价引擎，
+只保留可合并的流式统计量：直方图/分位数草图、按商品与人群分组的均值和方差。
+无论模拟一万还是一亿用户，内存占用只取决于 chunk_size。
+也可以按 (商品, 画像) 去重计数 (CodePopulation)，只对不同组合定价并按人数加权，耗时与人数基本无关。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_pricing import (
+    USER_TYPES, SPENDING_LEVELS, DEVICES, ACTIVITY_SCORES, FREQUENCIES, RETURN_RATES,
+    PURCHASE_PERIODS, CART_STATES, HISTORY_CATEGORIES, CODE_BITS, category_code, pack_columns,
+    price_batch, unpack_columns,
+)
+from pricing import PRODUCTS
+from rules import get_rules
+
+# ==========================================
+# 1. 人群配置 (边际分布)
+# ==========================================
+
+# 每个字段的取值空间，与 main() 中各控件映射后的取值一一对应
+FIELD_VALUES = {
+    "user_type": USER_TYPES,
+    "spending_level_norm": SPENDING_LEVELS,
+    "device": DEVICES,
+    "activity_score": ACTIVITY_SCORES,
+    "frequency": FREQUENCIES,
+    "return_rate": RETURN_RATES,
+    "purchase_period": PURCHASE_PERIODS,
+    "has_similar_in_cart": CART_STATES,
+}
+
+# 默认边际分布 (权重无需归一化，未列出的取值权重为 0)
+DEFAULT_MARGINALS = {
+    "user_type": {"new": 0.2, "regular": 0.6, "loyal": 0.2},
+    "spending_level_norm": {10: 0.15, 30: 0.3, 50: 0.3, 75: 0.15, 90: 0.1},
+    "device": {"android": 0.6, "ios": 0.4},
+    "activity_score": {80: 0.3, 50: 0.4, 20: 0.3},
+    "frequency": {"rare": 0.3, "sometimes": 0.5, "often": 0.2},
+    "return_rate": {"low": 0.3, "medium": 0.5, "high": 0.2},
+    "purchase_period": {"normal": 0.8, "special": 0.2},
+    "has_similar_in_cart": {False: 0.7, True: 0.3},
+}
+
+# 每个历史类别被选中的独立概率 (对应多选框)
+DEFAULT_HISTORY_PROBS = {"服饰": 0.6, "食品": 0.5, "数码": 0.4, "美妆": 0.3, "家居": 0.3, "其他": 0.1}
+
+# 分组统计的人群维度
+SEGMENTS = ("user_type", "device", "spending_level_norm")
+
+DEFAULT_CHUNK_SIZE = 100_000
+# 分片模式下每个分片用户数的上限；未指定分片大小时按进程数均分 (见 simulate_sharded)
+DEFAULT_SHARD_SIZE = 1_000_000
+
+
+def _weight(weights, value):
+    # 兼容从 JSON 读入的配置 (键为字符串，如 "10"、"true")
+    for key in (value, str(value), str(value).lower()):
+        if key in weights:
+            return float(weights[key])
+    return 0.0
+
+
+def _probabilities(field, weights):
+    values = FIELD_VALUES[field]
+    p = np.array([_weight(weights, v) for v in values])
+    if p.sum() <= 0:
+        raise ValueError(f"边际分布 {field} 的权重之和必须为正")
+    return p / p.sum()
+
+
+# ==========================================
+# 2. 流式统计量 (均可合并)
+# ==========================================
+
+class Moments:
+    """分组计数/均值/方差，分块更新与合并均使用 Chan 并行算法"""
+
+    def __init__(self, groups):
+        self.count = np.zeros(groups, dtype=np.int64)
+        self.mean = np.zeros(groups)
+        self.m2 = np.zeros(groups)
+
+    def update(self, group, values, weights=None):
+        """weights 为每个值代表的人数 (整数)，缺省时每个值计一人"""
+        groups = len(self.count)
+        if weights is None:
+            n = np.bincount(group, minlength=groups)
+            total = np.bincount(group, weights=values, minlength=groups)
+        else:
+            n = np.bincount(group, weights=weights, minlength=groups).astype(np.int64)
+            total = np.bincount(group, weights=values * weights, minlength=groups)
+        mean = np.divide(total, n, out=np.zeros(groups), where=n > 0)
+        squares = (values - mean[group]) ** 2
+        m2 = np.bincount(group, weights=squares if weights is None else squares * weights, minlength=groups)
+        self._combine(n, mean, m2)
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, n_b, mean_b, m2_b):
+        n_a = self.count
+        n = n_a + n_b
+        safe_n = np.maximum(n, 1)
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * n_b / safe_n
+        self.m2 = self.m2 + m2_b + delta ** 2 * n_a * n_b / safe_n
+        self.count = n
+
+    @property
+    def variance(self):
+        return np.divide(self.m2, self.count - 1, out=np.full(len(self.count), np.nan),
+                         where=self.count > 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class QuantileSketch:
+    """
+    固定分箱的分组分位数草图。
+    在 [lo, hi) 内按 resolution 分箱，两端各留一个溢出箱；
+    计数为整数，合并即相加，分位数误差不超过一个分箱宽度。
+    """
+
+    def __init__(self, lo, hi, resolution, groups=1):
+        self.lo = lo
+        self.hi = hi
+        self.resolution = resolution
+        self.bins = int(round((hi - lo) / resolution))
+        self.counts = np.zeros((groups, self.bins + 2), dtype=np.int64)
+
+    def update(self, values, group=None, weights=None):
+        index = np.floor((values - self.lo) / self.resolution).astype(np.int64) + 1
+        np.clip(index, 0, self.bins + 1, out=index)
+        width = self.bins + 2
+        if group is not None:
+            index += group * width
+        counts = np.bincount(index, weights=weights, minlength=self.counts.size)
+        if weights is not None:
+            counts = counts.astype(np.int64)
+        self.counts += counts.reshape(self.counts.shape)
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    def quantile(self, q, group=0):
+        counts = self.counts[group]
+        total = counts.sum()
+        if total == 0:
+            return float("nan")
+        target = q * total
+        cumulative = np.cumsum(counts)
+        i = int(np.searchsorted(cumulative, target, side="left"))
+        if i == 0:
+            return self.lo
+        if i >= self.bins + 1:
+            return self.hi
+        before = cumulative[i - 1]
+        frac = (target - before) / counts[i] if counts[i] else 0.0
+        return self.lo + (i - 1 + frac) * self.resolution
+
+    def histogram(self, bin_width, group=None):
+        """合并为较粗的分箱用于绘图，返回 (左边界, 计数)；溢出箱并入两端"""
+        counts = self.counts.sum(axis=0) if group is None else self.counts[group]
+        inner = counts[1:-1].copy()
+        inner[0] += counts[0]
+        inner[-1] += counts[-1]
+        factor = max(1, int(round(bin_width / self.resolution)))
+        pad = (-len(inner)) % factor
+        coarse = np.concatenate([inner, np.zeros(pad, dtype=inner.dtype)]).reshape(-1, factor).sum(axis=1)
+        edges = self.lo + np.arange(len(coarse)) * factor * self.resolution
+        return edges, coarse
+
+
+class PopulationStats:
+    """一次群体模拟的全部流式统计结果"""
+
+    def __init__(self, product_names):
+        self.product_names = list(product_names)
+        # 传入商品库字典时记录基准价 (用于把差异百分比换算回价格)
+        self.product_bases = [product_names[name]["base"] for name in self.product_names] \
+            if isinstance(product_names, dict) else None
+        n_products = len(self.product_names)
+        self.count = 0
+        self.price = Moments(n_products)
+        self.diff_pct = Moments(n_products)
+        self.segments = {field: Moments(len(FIELD_VALUES[field])) for field in SEGMENTS}
+        # 每个人群分组的差异百分比分布 (绘制小提琴图 / 箱线图)
+        self.segment_sketches = {field: QuantileSketch(-100.0, 100.0, 0.05, groups=len(FIELD_VALUES[field]))
+                                 for field in SEGMENTS}
+        # 价格差异百分比的分位数草图：整体一组 + 每个商品一组
+        self.sketch = QuantileSketch(-100.0, 100.0, 0.05)
+        self.product_sketch = QuantileSketch(-100.0, 100.0, 0.05, groups=n_products)
+        self.rule_ids = get_rules().rule_ids
+        self.rule_totals = np.zeros(len(self.rule_ids))
+
+    def update(self, columns, product, prices, contributions, weights=None):
+        """并入一块定价结果；weights 为每行代表的人数 (按画像去重计数时)，缺省时每行一人"""
+        base = columns["base_price"]
+        diff_pct = (prices - base) / base * 100
+        self.count += len(prices) if weights is None else int(weights.sum())
+        self.price.update(product, prices, weights)
+        self.diff_pct.update(product, diff_pct, weights)
+        for field in SEGMENTS:
+            self.segments[field].update(columns[f"{field}_code"], diff_pct, weights)
+            self.segment_sketches[field].update(diff_pct, group=columns[f"{field}_code"], weights=weights)
+        self.sketch.update(diff_pct, weights=weights)
+        self.product_sketch.update(diff_pct, group=product, weights=weights)
+        self.rule_totals += contributions.sum(axis=0) if weights is None else weights @ contributions
+
+    def merge(self, other):
+        self.count += other.count
+        self.price.merge(other.price)
+        self.diff_pct.merge(other.diff_pct)
+        for field in SEGMENTS:
+            self.segments[field].merge(other.segments[field])
+            self.segment_sketches[field].merge(other.segment_sketches[field])
+        self.sketch.merge(other.sketch)
+        self.product_sketch.merge(other.product_sketch)
+        self.rule_totals += other.rule_totals
+
+    def quantiles(self, qs=(0.1, 0.5, 0.9)):
+        return {q: self.sketch.quantile(q) for q in qs}
+
+    def product_rows(self):
+        """按商品汇总，供 UI 展示"""
+        rows = []
+        for i, name in enumerate(self.product_names):
+            rows.append({
+                "商品": name,
+                "人数": int(self.price.count[i]),
+                "平均价格": self.price.mean[i],
+                "价格标准差": self.price.std[i],
+                "平均差异%": self.diff_pct.mean[i],
+                "差异%中位数": self.product_sketch.quantile(0.5, group=i),
+            })
+        return rows
+
+    def summary(self):
+        """可序列化为 JSON 的汇总结果"""
+        return {
+            "count": self.count,
+            "diff_pct_quantiles": {str(q): v for q, v in self.quantiles((0.01, 0.1, 0.5, 0.9, 0.99)).items()},
+            "products": self.product_rows(),
+            "segments": {field: self.segment_rows(field) for field in SEGMENTS},
+            "rule_mean_change": dict(zip(self.rule_ids, (self.rule_totals / max(self.count, 1)).tolist())),
+        }
+
+    def segment_rows(self, field):
+        """按人群维度汇总价格差异百分比"""
+        moments = self.segments[field]
+        return [
+            {"分组": value, "人数": int(moments.count[i]),
+             "平均差异%": moments.mean[i], "差异%标准差": moments.std[i]}
+            for i, value in enumerate(FIELD_VALUES[field])
+        ]
+
+
+# ==========================================
+# 3. 生成器流水线: 抽样 -> 定价 -> 聚合
+# ==========================================
+
+def sample_chunks(n_users, products, rng, marginals=None, history_probs=None,
+                  product_weights=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """按边际分布分块抽样，逐块产出 (columns, product_index)"""
+    names = list(products)
+    probs, history_p, product_p = _distributions(products, marginals, history_probs, product_weights)
+    bases, categories = _product_arrays(products)
+    bit_values = 1 << np.arange(len(HISTORY_CATEGORIES))
+
+    remaining = n_users
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        remaining -= size
+        codes = {field: rng.choice(len(p), size=size, p=p) for field, p in probs.items()}
+        product = rng.choice(len(names), size=size, p=product_p)
+        history = (rng.random((size, len(HISTORY_CATEGORIES))) < history_p) @ bit_values
+        yield _columns(codes, history, product, bases, categories), product
+
+
+def _distributions(products, marginals=None, history_probs=None, product_weights=None):
+    """边际分布配置 -> (各字段取值概率, 各历史类别概率, 商品概率)"""
+    marginals = {**DEFAULT_MARGINALS, **(marginals or {})}
+    history_probs = {**DEFAULT_HISTORY_PROBS, **(history_probs or {})}
+    probs = {field: _probabilities(field, marginals[field]) for field in FIELD_VALUES}
+    history_p = np.array([history_probs.get(c, 0.0) for c in HISTORY_CATEGORIES])
+    product_p = np.array([(product_weights or {}).get(name, 1.0) for name in products], dtype=np.float64)
+    if not product_p.sum() > 0:
+        raise ValueError("商品权重 product_weights 之和必须为正")
+    return probs, history_p, product_p / product_p.sum()
+
+
+def _product_arrays(products):
+    names = list(products)
+    bases = np.array([products[name]["base"] for name in names], dtype=np.float64)
+    categories = np.array([category_code(products[name]["category"]) for name in names])
+    return bases, categories
+
+
+def _columns(codes, history, product, bases, categories):
+    """各字段取值下标 + 历史类别掩码 + 商品下标 -> price_batch 的列数组 (另含分组统计用的 *_code)"""
+    columns = {
+        "user_type": codes["user_type"],
+        "spending_level_norm": np.asarray(SPENDING_LEVELS, dtype=np.float64)[codes["spending_level_norm"]],
+        "device": codes["device"],
+        "activity_score": np.asarray(ACTIVITY_SCORES, dtype=np.float64)[codes["activity_score"]],
+        "frequency": codes["frequency"],
+        "return_rate": codes["return_rate"],
+        "purchase_period": codes["purchase_period"],
+        "history_mask": history,
+        "current_category": categories[product],
+        "has_similar_in_cart": codes["has_similar_in_cart"].astype(bool),
+        "base_price": bases[product],
+    }
+    # 分组统计使用的取值下标
+    for field in SEGMENTS:
+        columns[f"{field}_code"] = codes[field]
+    return columns
+
+
+_PRICE_ARGS = (
+    "user_type", "spending_level_norm", "device", "activity_score", "frequency", "return_rate",
+    "purchase_period", "history_mask", "current_category", "has_similar_in_cart", "base_price",
+)
+
+
+def price_chunks(chunks):
+    """对每个抽样块批量定价，产出 (columns, product_index, prices, contributions)"""
+    for columns, product in chunks:
+        prices, contributions = price_batch(**{k: columns[k] for k in _PRICE_ARGS})
+        yield columns, product, prices, contributions
+
+
+def aggregate(priced, stats, part=None):
+    """消费定价流，把每块结果并入 stats 后即丢弃；给出 part (results_store.PartWriter) 时逐块写入磁盘"""
+    for columns, product, prices, contributions in priced:
+        stats.update(columns, product, prices, contributions)
+        if part is not None:
+            part.append({**columns, "product": product, "price": prices})
+    return stats
+
+
+def simulate_population(n_users, products, seed=None, marginals=None, history_probs=None,
+                        product_weights=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """模拟 n_users 个用户的价格分布，返回 PopulationStats"""
+    rng = np.random.default_rng(seed)
+    chunks = sample_chunks(n_users, products, rng, marginals, history_probs, product_weights, chunk_size)
+    return aggregate(price_chunks(chunks), PopulationStats(products))
+
+
+# ==========================================
+# 4. 按画像去重计数的群体 (加权求值)
+# ==========================================
+
+# 一次多项抽样允许的最大 (商品, 画像) 组合数；超过时退回逐块抽样再合并计数
+MAX_MULTINOMIAL_CELLS = 4_000_000
+
+
+class CodePopulation:
+    """
+    按 (商品, 画像编码) 计数的群体：只保存出现过的组合及其人数，不保存逐行数据。
+    键为 商品下标 << CODE_BITS | 画像编码 (见 batch_pricing.pack_columns)。
+    画像字段都是类别型，不同组合最多 商品数 × 20 万左右；统计量与图表都在这些组合上
+    按人数加权求值，一亿用户与一百万用户的定价开销相同。
+    """
+
+    def __init__(self, products, keys=None, counts=None):
+        self.products = products
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else np.asarray(keys, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def add(self, columns, product):
+        """并入一块逐行抽样结果 (sample_chunks 的产出)"""
+        keys = (np.asarray(product, dtype=np.int64) << CODE_BITS) | pack_columns(columns)
+        self._accumulate(keys, np.ones(len(keys), dtype=np.int64))
+
+    def merge(self, other):
+        self._accumulate(other.keys, other.counts)
+
+    def _accumulate(self, keys, counts):
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts, minlength=len(self.keys)).astype(np.int64)
+
+    def chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """逐块产出 (columns, product_index, counts)；columns 与 sample_chunks 的格式相同，每行是一个不同组合"""
+        bases, _ = _product_arrays(self.products)
+        for start in range(0, len(self.keys), chunk_size):
+            keys = self.keys[start:start + chunk_size]
+            product = keys >> CODE_BITS
+            columns = unpack_columns(keys & ((1 << CODE_BITS) - 1), bases[product])
+            for field in SEGMENTS:
+                values = columns[field]
+                columns[f"{field}_code"] = (np.searchsorted(FIELD_VALUES[field], values)
+                                            if field == "spending_level_norm" else values.astype(np.int64))
+            yield columns, product, self.counts[start:start + chunk_size]
+
+    def stats(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """每个不同组合只定价一次，按人数加权汇总为 PopulationStats"""
+        stats = PopulationStats(self.products)
+        for columns, product, counts in self.chunks(chunk_size):
+            prices, contributions = price_batch(**{k: columns[k] for k in _PRICE_ARGS})
+            stats.update(columns, product, prices, contributions, weights=counts)
+        return stats
+
+
+def sample_population(n_users, products, rng, marginals=None, history_probs=None, product_weights=None,
+                      chunk_size=DEFAULT_CHUNK_SIZE, max_cells=MAX_MULTINOMIAL_CELLS):
+    """
+    抽样 n_users 个用户，直接得到 CodePopulation (与 sample_chunks 同分布)。
+    各字段与每个历史类别都独立抽样，因此每个 (商品, 画像) 组合的人数服从多项分布：
+    组合总数不超过 max_cells 时一次多项抽样得到全部计数，耗时与人数无关；
+    否则 (如超大商品目录) 退回逐块抽样再合并计数。
+    """
+    probs, history_p, product_p = _distributions(products, marginals, history_probs, product_weights)
+    shape = [len(p) for p in probs.values()] + [1 << len(HISTORY_CATEGORIES)]
+    cells = len(product_p) * int(np.prod(shape))
+    population = CodePopulation(products)
+    if cells > max_cells:
+        for columns, product in sample_chunks(n_users, products, rng, marginals, history_probs,
+                                              product_weights, chunk_size):
+            population.add(columns, product)
+        return population
+
+    # 画像网格：每个字段取值下标的笛卡尔积 × 全部历史类别掩码
+    index = np.indices(shape).reshape(len(shape), -1)
+    profile_p = np.ones(index.shape[1])
+    for k, p in enumerate(probs.values()):
+        profile_p *= p[index[k]]
+    bits = (np.arange(shape[-1])[:, None] >> np.arange(len(HISTORY_CATEGORIES))) & 1
+    profile_p *= np.where(bits, history_p, 1 - history_p).prod(axis=1)[index[-1]]
+
+    pvals = np.outer(product_p, profile_p).ravel()
+    counts = rng.multinomial(n_users, pvals / pvals.sum())
+    cell = np.flatnonzero(counts)
+    product, profile = np.divmod(cell, index.shape[1])
+    codes = dict(zip(probs, index[:-1, profile]))
+    bases, categories = _product_arrays(products)
+    columns = _columns(codes, index[-1, profile], product, bases, categories)
+    # 网格按 (商品, 各字段下标) 顺序排列，与键的顺序不同，合并时重新排序
+    population._accumulate((product.astype(np.int64) << CODE_BITS) | pack_columns(columns), counts[cell])
+    return population
+
+
+def simulate_weighted(n_users, products, seed=None, marginals=None, history_probs=None,
+                      product_weights=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """与 simulate_population 同分布的模拟，但只对不同的 (商品, 画像) 组合定价并按人数加权"""
+    rng = np.random.default_rng(seed)
+    population = sample_population(n_users, products, rng, marginals, history_probs, product_weights, chunk_size)
+    return population.stats(chunk_size)
+
+
+# ==========================================
+# 5. 多进程分片模拟
+# ==========================================
+
+def shard_sizes(n_users, shard_size=DEFAULT_SHARD_SIZE):
+    """把总人数切成固定大小的分片 (最后一片可能较小)"""
+    full, rest = divmod(n_users, shard_size)
+    return [shard_size] * full + ([rest] if rest else [])
+
+
+def default_shard_size(n_users, workers):
+    """未指定分片大小时按进程数均分，使每个进程都分到分片 (不超过 DEFAULT_SHARD_SIZE)"""
+    return min(DEFAULT_SHARD_SIZE, max(1, -(-n_users // workers)))
+
+
+def _run_shard(task):
+    size, seed_seq, products, options, part_path = task
+    rng = np.random.default_rng(seed_seq)
+    chunks = sample_chunks(size, products, rng, **options)
+    if part_path is None:
+        return aggregate(price_chunks(chunks), PopulationStats(products))
+    from results_store import PartWriter
+
+    with PartWriter(part_path) as part:
+        return aggregate(price_chunks(chunks), PopulationStats(products), part)
+
+
+def simulate_sharded(n_users, products, seed=0, workers=None, shard_size=None,
+                     marginals=None, history_probs=None, product_weights=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE, store=None):
+    """
+    多进程分片模拟。
+    每个分片从主种子派生独立的随机流 (SeedSequence.spawn)，分片结果是可合并的统计量，
+    并按分片顺序合并，因此同一分片划分下结果与 workers 数量无关，可完全复现。
+    shard_size 缺省时见 default_shard_size，分片划分随进程数变化；需要跨进程数复现结果时请显式给出 shard_size。
+    给出 store (results_store.RunWriter) 时，每个分片把逐行结果写入自己的 part 目录。
+    """
+    workers = workers or os.cpu_count() or 1
+    if shard_size is None:
+        shard_size = default_shard_size(n_users, workers)
+    sizes = shard_sizes(n_users, shard_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    options = {"marginals": marginals, "history_probs": history_probs,
+               "product_weights": product_weights, "chunk_size": chunk_size}
+    tasks = [(size, seed_seq, products, options, store.part_path(i) if store is not None else None)
+             for i, (size, seed_seq) in enumerate(zip(sizes, seeds))]
+
+    stats = PopulationStats(products)
+    if workers == 1 or len(tasks) <= 1:
+        for shard_stats in map(_run_shard, tasks):
+            stats.merge(shard_stats)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            # map 按提交顺序返回结果，保证合并顺序固定
+            for shard_stats in pool.map(_run_shard, tasks):
+                stats.merge(shard_stats)
+    return stats
+
+
+def main(argv=None):
+    """命令行入口：python population.py --users 100000000 --workers 32"""
+    parser = argparse.ArgumentParser(description="群体价格分布模拟 (多进程分片)")
+    parser.add_argument("--users", type=int, default=1_000_000, help="模拟用户数")
+    parser.add_argument("--seed", type=int, default=0, help="主随机种子")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认等于 CPU 核数")
+    parser.add_argument("--shard-size", type=int, default=None,
+                        help=f"每个分片的用户数，默认按进程数均分 (不超过 {DEFAULT_SHARD_SIZE:,})；"
+                             "显式给出时结果与进程数无关")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块抽样/定价的用户数")
+    parser.add_argument("--config", help="人群构成 JSON，可含 marginals / history_probs / product_weights")
+    parser.add_argument("--output", help="把汇总结果写入该 JSON 文件，默认打印到标准输出")
+    parser.add_argument("--store", help="把逐行定价结果写入该目录 (列式、可内存映射打开，见 results_store.py)")
+    parser.add_argument("--weighted", action="store_true",
+                        help="按不同 (商品, 画像) 组合计数、加权求值，耗时与人数无关 (不保存逐行结果)")
+    args = parser.parse_args(argv)
+    if args.weighted and args.store:
+        parser.error("--weighted 不产生逐行结果，不能与 --store 同时使用")
+
+    config = {}
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+
+    store = None
+    if args.store:
+        from results_store import RunWriter, run_metadata
+
+        store = RunWriter(args.store, run_metadata(
+            get_rules(), PRODUCTS, args.seed, kind="population", users=args.users, config=config))
+
+    options = {"marginals": config.get("marginals"), "history_probs": config.get("history_probs"),
+               "product_weights": config.get("product_weights"), "chunk_size": args.chunk_size}
+    start = time.perf_counter()
+    if args.weighted:
+        stats = simulate_weighted(args.users, PRODUCTS, seed=args.seed, **options)
+    else:
+        try:
+            stats = simulate_sharded(args.users, PRODUCTS, seed=args.seed, workers=args.workers,
+                                     shard_size=args.shard_size, store=store, **options)
+        except BaseException:
+            if store is not None:
+                store.abort()
+            raise
+        if store is not None:
+            store.close()
+    elapsed = time.perf_counter() - start
+
+    summary = stats.summary()
+    summary["seed"] = args.seed
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    print(f"模拟 {stats.count:,} 人，用时 {elapsed:.2f}s ({stats.count / elapsed:,.0f} 人/秒)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
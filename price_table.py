@@ -0,0 +1,106 @@
+"""
+穷举价格表
+
+calculate_price_logic 的所有输入都来自有限的选项集合，
+因此可以预先算出整张价格表，运行时用 O(1) 下标查表代替规则链。
+价格表按 "规则集 + 商品库 + 维度定义" 的哈希缓存到磁盘，启动时直接内存映射加载。
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from batch_pricing import (
+    USER_TYPES, SPENDING_LEVELS, DEVICES, ACTIVITY_SCORES, FREQUENCIES, RETURN_RATES,
+    PURCHASE_PERIODS, CART_STATES, category_code, history_mask,
+)
+from rules import get_rules
+
+HISTORY_MASKS = 64  # 6 个历史类别的全部子集
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+def table_key(products, rules):
+    """规则集 + 商品库 + 维度定义的哈希，任何一项变化都会使缓存失效"""
+    h = hashlib.sha256()
+    h.update(rules.digest.encode("utf-8"))
+    h.update(json.dumps(products, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    h.update(repr((USER_TYPES, SPENDING_LEVELS, DEVICES, ACTIVITY_SCORES, FREQUENCIES,
+                   RETURN_RATES, PURCHASE_PERIODS, CART_STATES, HISTORY_MASKS)).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def build_table(products, rules=None):
+    """用批量定价引擎一次性计算整张价格表"""
+    names = list(products)
+    shape = (len(USER_TYPES), len(SPENDING_LEVELS), len(DEVICES), len(ACTIVITY_SCORES),
+             len(FREQUENCIES), len(RETURN_RATES), len(PURCHASE_PERIODS), len(CART_STATES),
+             HISTORY_MASKS, len(names))
+    (ut, sp, dv, ac, fr, rr, pp, cart, mask, prod) = np.indices(shape, dtype=np.int16).reshape(len(shape), -1)
+
+    bases = np.array([products[name]["base"] for name in names], dtype=np.float64)
+    categories = np.array([category_code(products[name]["category"]) for name in names], dtype=np.int64)
+
+    prices, _ = (rules or get_rules()).evaluate_batch({
+        "user_type": ut,
+        "spending_level_norm": np.asarray(SPENDING_LEVELS, dtype=np.float64)[sp],
+        "device": dv,
+        "activity_score": np.asarray(ACTIVITY_SCORES, dtype=np.float64)[ac],
+        "frequency": fr,
+        "return_rate": rr,
+        "purchase_period": pp,
+        "history_mask": mask,
+        "current_category": categories[prod],
+        "has_similar_in_cart": cart.astype(bool),
+        "base_price": bases[prod],
+    }, with_contributions=False)
+    return prices.reshape(shape)
+
+
+class PriceTable:
+    """预计算价格表，lookup 为纯下标访问"""
+
+    def __init__(self, table, product_names):
+        self.table = table
+        self.product_index = {name: i for i, name in enumerate(product_names)}
+
+    def lookup(self, profile, product_name):
+        """
+        查询 main() 构造的 profile 在指定商品下的价格。
+        profile 超出穷举空间 (如非标准消费分档) 时返回 None，由调用方回退到规则链。
+        """
+        try:
+            index = (
+                USER_TYPES.index(profile["user_type"]),
+                SPENDING_LEVELS.index(profile["spending_level_norm"]),
+                DEVICES.index(profile["device"]),
+                ACTIVITY_SCORES.index(profile["activity_score"]),
+                FREQUENCIES.index(profile["frequency"]),
+                RETURN_RATES.index(profile["return_rate"]),
+                PURCHASE_PERIODS.index(profile["purchase_period"]),
+                int(bool(profile.get("has_similar_in_cart", False))),
+                history_mask(profile["history_categories"]),
+                self.product_index[product_name],
+            )
+        except (ValueError, KeyError):
+            return None
+        return float(self.table[index])
+
+
+def load_or_build(products, cache_dir=DEFAULT_CACHE_DIR, rules=None):
+    """优先从磁盘缓存内存映射加载价格表，缓存不存在时构建并写入"""
+    rules = rules or get_rules()
+    path = os.path.join(cache_dir, f"price_table_{table_key(products, rules)}.npy")
+    if os.path.exists(path):
+        table = np.load(path, mmap_mode="r")
+    else:
+        table = build_table(products, rules)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)  # 原子替换，避免并发进程读到半写文件
+    return PriceTable(table, list(products))
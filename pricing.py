@@ -0,0 +1,96 @@
+"""
+定价核心：商品库、控件选项映射与定价函数
+
+不依赖 Streamlit，也不在导入时产生任何界面副作用，
+可以被 app.py、服务进程、多进程 worker 和命令行工具直接导入。
+numpy 只在批量定价时才会被加载，标量定价的冷启动只涉及标准库。
+"""
+
+import functools
+
+from rules import get_rules
+
+# ==========================================
+# 1. 商品与选项
+# ==========================================
+
+# 商品配置库
+PRODUCTS = {
+    "无线耳机": {"base": 599, "desc": "🎧 热门款真无线蓝牙耳机", "category": "数码"},
+    "运动鞋": {"base": 199, "desc": "👟 新款缓震运动跑鞋", "category": "服饰"},
+    "轻薄笔记本": {"base": 4999, "desc": "💻 最新款超薄笔记本电脑", "category": "数码"},
+    "智能手表": {"base": 1299, "desc": "⌚️ 多功能健康监测智能手表", "category": "数码"},
+    "美妆礼盒": {"base": 899, "desc": "💄 高端护肤品套装", "category": "美妆"}
+}
+
+# 用户特征选项 (第一步的控件与群体模拟面板共用)
+USER_TYPE_MAP = {"我是新用户！": "new", "我是普通用户;)": "regular", "我是老用户☝🏼": "loyal"}
+SPENDING_RANGES = ["0-100元", "100-500元", "500-1000元", "1000-3000元", "3000元以上"]
+DEVICE_MAP = {"安卓(Android)": "android", "苹果(iPhone)/鸿蒙": "ios"}
+ACTIVITY_LEVELS = ["每天都会看看价格", "一周只看两三回", "必须购买时再使用"]
+FREQ_MAP = {"第一次点开": "rare", "偶尔看看": "sometimes", "反复查看(急需)": "often"}
+RETURN_OPTIONS = ["没有/几乎不退货", "看商品质量偶尔退货", "商品不合意或只留下合适的便退货"]
+PURCHASE_PERIOD_MAP = {
+    "平时购买": "normal",
+    "双11/双12/618等大促期间购买": "special"
+}
+CART_MAP = {"否": False, "是": True}
+# 将选项映射为类别（与商品配置库的category对应）
+HISTORY_CATEGORY_MAP = {
+    "服装服饰类": "服饰",
+    "食品（水果蔬菜等）": "食品",
+    "电子产品（电脑、手机、耳机等）": "数码",
+    "美妆护肤类": "美妆",
+    "家居日用类": "家居",
+    "其他": "其他"
+}
+
+# ==========================================
+# 2. 定价与映射函数
+# ==========================================
+
+def calculate_price_logic(base_price, user_profile):
+    """
+    高级定价算法
+    具体规则见 pricing_rules.json，由 rules.py 编译并在文件修改后自动热加载
+    """
+    return get_rules().evaluate(base_price, user_profile)
+
+def calculate_price(base_price, user_profile):
+    """只计算最终价格，不构造因素明细 (价格被隐藏时使用)"""
+    return get_rules().price_only(base_price, user_profile)
+
+def normalize_spending(amount):
+    if amount <= 100: return 10
+    if amount <= 500: return 30
+    if amount <= 1000: return 50
+    if amount <= 3000: return 75
+    return 90
+
+def map_activity_to_score(activity):
+    activity_map = {
+        "每天都会看看价格": 80,
+        "一周只看两三回": 50,
+        "必须购买时再使用": 20
+    }
+    return activity_map.get(activity, 50)
+
+def map_return_rate(return_option):
+    return_map = {
+        "没有/几乎不退货": "low",
+        "看商品质量偶尔退货": "medium",
+        "商品不合意或只留下合适的便退货": "high"
+    }
+    return return_map.get(return_option, "medium")
+
+@functools.lru_cache(maxsize=None)
+def get_spending_value(spending_range):
+    """将消费区间转换为具体数值（用于用户选择）"""
+    spending_map = {
+        "0-100元": 50,
+        "100-500元": 300,
+        "500-1000元": 750,
+        "1000-3000元": 2000,
+        "3000元以上": 4000
+    }
+    return spending_map.get(spending_range, 1000)
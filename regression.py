@@ -0,0 +1,197 @@
+"""
+逆向工程定价算法：外部观察者能否从观察到的价格还原隐藏规则？
+
+    python regression.py --users 5000000 --seed 0
+
+用 population.py 的流水线分块模拟 "用户画像 -> 最终价格"，对每块构造设计矩阵后
+只把 X'X、X'y、y'y 累加进 OnlineOLS，设计矩阵用完即丢，内存只取决于块大小。
+每块之后都可以求解一次，得到随样本增加而收敛的系数与置信区间。
+
+模型：被解释变量为价格差额 (元)；每个画像特征 (指示变量) 进入两次 ——
+乘以 基准价/100 的一列 (系数即 "按基准价百分比" 的效应) 与原样的一列 (系数即 "固定金额" 的效应)。
+定价规则恰好由这两类效应组成，因此大部分规则可以被精确还原；
+嵌套条件 (如只对安卓生效的价格敏感度保护) 不在特征里时会留在残差中。
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from batch_pricing import (
+    USER_TYPES, DEVICES, FREQUENCIES, RETURN_RATES, PURCHASE_PERIODS,
+)
+from population import DEFAULT_CHUNK_SIZE, price_chunks, sample_chunks
+from pricing import PRODUCTS
+
+# ==========================================
+# 1. 特征
+# ==========================================
+
+# 观察者能看到的画像特征：(名称, 字段, 取值)；每个字段未列出的取值为参照组
+INDICATORS = (
+    ("新用户", "user_type", USER_TYPES.index("new")),
+    ("老用户", "user_type", USER_TYPES.index("loyal")),
+    ("月消费 0-100元", "spending_level_norm", 10),
+    ("月消费 100-500元", "spending_level_norm", 30),
+    ("月消费 1000-3000元", "spending_level_norm", 75),
+    ("月消费 3000元以上", "spending_level_norm", 90),
+    ("苹果/鸿蒙设备", "device", DEVICES.index("ios")),
+    ("低活跃", "activity_score", 20),
+    ("高活跃", "activity_score", 80),
+    ("第一次点开", "frequency", FREQUENCIES.index("rare")),
+    ("反复查看", "frequency", FREQUENCIES.index("often")),
+    ("几乎不退货", "return_rate", RETURN_RATES.index("low")),
+    ("经常退货", "return_rate", RETURN_RATES.index("high")),
+    ("大促期间", "purchase_period", PURCHASE_PERIODS.index("special")),
+    ("购物车有相似商品", "has_similar_in_cart", True),
+    ("无历史购买", "history_empty", True),
+    ("买过同类商品", "category_in_history", True),
+)
+
+# 交互项：(名称1, 名称2)，如 "苹果设备 × 高消费" 的协同效应
+INTERACTIONS = (
+    ("苹果/鸿蒙设备", "月消费 0-100元"),
+    ("苹果/鸿蒙设备", "月消费 100-500元"),
+    ("苹果/鸿蒙设备", "月消费 1000-3000元"),
+    ("苹果/鸿蒙设备", "月消费 3000元以上"),
+    ("大促期间", "几乎不退货"),
+    ("大促期间", "经常退货"),
+)
+
+TERMS = ("截距",) + tuple(name for name, _, _ in INDICATORS) + tuple(f"{a} × {b}" for a, b in INTERACTIONS)
+# 设计矩阵的列：前一半为按基准价百分比的效应，后一半为固定金额效应
+FEATURES = tuple((term, "%") for term in TERMS) + tuple((term, "元") for term in TERMS)
+
+
+def _column(columns, field):
+    if field == "history_empty":
+        return np.asarray(columns["history_mask"]) == 0
+    if field == "category_in_history":
+        category = np.asarray(columns["current_category"], dtype=np.int64)
+        history = np.asarray(columns["history_mask"], dtype=np.int64)
+        return (category >= 0) & (((history >> np.maximum(category, 0)) & 1) == 1)
+    return np.asarray(columns[field])
+
+
+def design_matrix(columns):
+    """一块列数组 -> (n, len(FEATURES)) 设计矩阵"""
+    n = len(columns["base_price"])
+    terms = np.empty((n, len(TERMS)))
+    terms[:, 0] = 1.0
+    index = {}
+    for j, (name, field, value) in enumerate(INDICATORS, start=1):
+        terms[:, j] = _column(columns, field) == value
+        index[name] = j
+    for j, (a, b) in enumerate(INTERACTIONS, start=1 + len(INDICATORS)):
+        terms[:, j] = terms[:, index[a]] * terms[:, index[b]]
+    base = np.asarray(columns["base_price"], dtype=np.float64)[:, None] / 100
+    return np.hstack([terms * base, terms])
+
+
+# ==========================================
+# 2. 增量最小二乘
+# ==========================================
+
+class OnlineOLS:
+    """
+    增量最小二乘：只累加 X'X、X'y、y'y 与样本数，分块更新与合并都是相加，
+    任何时刻都可以求解，不保存设计矩阵。
+    """
+
+    def __init__(self, k):
+        self.n = 0
+        self.xtx = np.zeros((k, k))
+        self.xty = np.zeros(k)
+        self.yty = 0.0
+
+    def update(self, X, y):
+        self.n += len(y)
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.yty += float(y @ y)
+
+    def merge(self, other):
+        self.n += other.n
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.yty += other.yty
+
+    def solve(self):
+        """返回 (系数, 协方差矩阵, 残差方差)；样本中缺失的特征用伪逆处理"""
+        inverse = np.linalg.pinv(self.xtx, hermitian=True)
+        beta = inverse @ self.xty
+        dof = max(self.n - np.linalg.matrix_rank(self.xtx, hermitian=True), 1)
+        # 正规方程成立时 RSS = y'y - β'X'y
+        sigma2 = max(self.yty - beta @ self.xty, 0.0) / dof
+        return beta, inverse * sigma2, sigma2
+
+    def summary(self, level=0.95):
+        """按 FEATURES 顺序的系数表 (大样本下用正态分位数代替 t 分位数)"""
+        beta, cov, sigma2 = self.solve()
+        z = statistics.NormalDist().inv_cdf(0.5 + level / 2)
+        se = np.sqrt(np.maximum(np.diag(cov), 0.0))
+        return [
+            {"特征": term, "单位": unit, "估计值": float(b), "标准误": float(s),
+             "下限": float(b - z * s), "上限": float(b + z * s)}
+            for (term, unit), b, s in zip(FEATURES, beta, se)
+        ]
+
+    def r_squared(self, y_sum):
+        """决定系数；y_sum 为被解释变量之和 (由调用方累加)"""
+        beta, _, _ = self.solve()
+        rss = max(self.yty - beta @ self.xty, 0.0)
+        tss = self.yty - y_sum ** 2 / max(self.n, 1)
+        return 1 - rss / tss if tss > 0 else float("nan")
+
+
+# ==========================================
+# 3. 流式拟合
+# ==========================================
+
+def fit_stream(n_users, products=PRODUCTS, seed=None, marginals=None, history_probs=None,
+               product_weights=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    模拟 n_users 个 (画像, 价格) 观测并逐块拟合，每块之后产出 (OnlineOLS, y 之和)。
+    产出的是同一个不断累加的对象，调用方可在任意一块之后调用 summary() 查看收敛过程。
+    """
+    rng = np.random.default_rng(seed)
+    chunks = sample_chunks(n_users, products, rng, marginals, history_probs, product_weights, chunk_size)
+    ols = OnlineOLS(len(FEATURES))
+    y_sum = 0.0
+    for columns, _, prices, _ in price_chunks(chunks):
+        y = prices - columns["base_price"]
+        ols.update(design_matrix(columns), y)
+        y_sum += float(y.sum())
+        yield ols, y_sum
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用增量最小二乘从模拟价格中还原定价规则")
+    parser.add_argument("--users", type=int, default=2_000_000, help="模拟观测数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--level", type=float, default=0.95, help="置信水平")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    ols = y_sum = None
+    for ols, y_sum in fit_stream(args.users, seed=args.seed, chunk_size=args.chunk_size):
+        rows = ols.summary(args.level)
+        width = max(row["上限"] - row["下限"] for row in rows) / 2
+        print(f"n={ols.n:>12,}  最大置信区间半宽 {width:.4f}", file=sys.stderr)
+    if ols is None:
+        return
+
+    print(f"{'特征':<24}{'单位':<4}{'估计值':>12}{'置信区间':>26}")
+    for row in ols.summary(args.level):
+        if abs(row["估计值"]) < 1e-3 and row["上限"] - row["下限"] < 1e-2:
+            continue  # 省略与 0 无差别的项
+        print(f"{row['特征']:<24}{row['单位']:<4}{row['估计值']:>12.4f}   [{row['下限']:10.4f}, {row['上限']:10.4f}]")
+    print(f"R² = {ols.r_squared(y_sum):.6f}，用时 {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
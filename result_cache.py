@@ -0,0 +1,127 @@
+"""
+进程级共享结果缓存
+
+课堂式访问时，上百个会话同时打开页面，大多停留在相同的默认选项上。
+这里按 "规范化画像 + 商品 + 规则集" 缓存最终价格、因素明细与因素卡片 HTML，
+所有会话 (Streamlit 的各个脚本线程) 共用一份，条目数有上限，按最近最少使用淘汰，
+服务端内存不随并发会话数增长。
+
+模块只在进程内导入一次，缓存对象随进程存活；app.py 每次重跑都会重新执行，因此缓存不能放在 app.py 中。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+DEFAULT_MAXSIZE = int(os.environ.get("PRICE_SIM_RESULT_CACHE_SIZE", "4096"))
+
+# 参与定价的画像字段 (顺序固定，作为键的一部分)
+PROFILE_FIELDS = (
+    "user_type", "spending_level_norm", "device", "activity_score", "frequency",
+    "return_rate", "purchase_period", "current_category", "has_similar_in_cart",
+)
+
+
+def profile_key(profile, product_name, base_price, rules_digest):
+    """
+    规范化的缓存键：历史类别与多选框的勾选顺序无关，按排序后的元组参与；
+    规则集哈希参与键，规则热加载后旧条目不再命中，随后被自然淘汰。
+    """
+    return (
+        tuple(profile.get(field) for field in PROFILE_FIELDS),
+        tuple(sorted(profile["history_categories"])),
+        product_name, base_price, rules_digest,
+    )
+
+
+class PricedResult:
+    """
+    一条缓存结果；html 在第一次揭晓时才生成并回填，价格来自价格表时 factors 也在第一次揭晓时回填
+    (多个线程同时回填结果相同，无需加锁)
+    """
+    __slots__ = ("price", "factors", "html")
+
+    def __init__(self, price, factors):
+        self.price = price
+        self.factors = factors
+        self.html = None
+
+
+class LRUCache:
+    """线程安全的定长 LRU 缓存，带命中 / 未命中 / 淘汰计数"""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入并返回缓存中的值；并发未命中时先写入者胜出，各线程拿到同一个对象"""
+        with self._lock:
+            existing = self._data.get(key)
+            if existing is not None:
+                self._data.move_to_end(key)
+                return existing
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return value
+
+    def get_or_compute(self, key, compute):
+        """命中则返回缓存值，否则在锁外调用 compute() 计算后写入"""
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": hits,
+                "misses": misses,
+                "evictions": self.evictions,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            }
+
+
+RESULTS = LRUCache()
+
+
+def _collect():
+    stats = RESULTS.stats()
+    return [
+        ("price_sim_result_cache_hits_total", "counter", "Shared result cache hits.", stats["hits"]),
+        ("price_sim_result_cache_misses_total", "counter", "Shared result cache misses.", stats["misses"]),
+        ("price_sim_result_cache_evictions_total", "counter", "Entries evicted by LRU.", stats["evictions"]),
+        ("price_sim_result_cache_entries", "gauge", "Entries currently cached.", stats["size"]),
+        ("price_sim_result_cache_hit_ratio", "gauge", "Hit ratio since process start.", stats["hit_rate"]),
+    ]
+
+
+metrics.register_collector(_collect)
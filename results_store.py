@@ -0,0 +1,321 @@
+"""
+模拟结果存储 (列式、内存映射)
+
+大规模模拟产生数千万行定价结果，逐块写入磁盘后，面板可以随时打开查看，无需重新模拟：
+
+    run/
+        run.json              行数、列类型、分片列表与运行元数据 (规则版本与哈希、随机种子、商品库哈希 ...)
+        part-00000/<列>.bin   每个分片每列一个原始二进制文件，按块追加写入
+        part-00001/...
+
+多进程模拟时每个分片由各自的进程写入自己的 part 目录，主进程最后写 run.json 并整体替换到目标路径。
+打开时每列以 np.memmap 只读映射，筛选与分组聚合按块流式进行，不会把整个结果读进内存。
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from batch_pricing import USER_TYPES, SPENDING_LEVELS, DEVICES, HISTORY_CATEGORIES
+
+FORMAT_VERSION = 1
+
+# 每行一个 (用户, 商品) 定价结果；列名与批量定价的列相同，另加商品编号与最终价格
+COLUMNS = {
+    "user_type": "int8",
+    "spending_level_norm": "int8",
+    "device": "int8",
+    "activity_score": "int8",
+    "frequency": "int8",
+    "return_rate": "int8",
+    "purchase_period": "int8",
+    "history_mask": "int16",
+    "current_category": "int8",
+    "has_similar_in_cart": "bool",
+    "product": "int32",
+    "base_price": "float64",
+    "price": "float64",
+}
+
+# 可用于筛选与分组的人群维度：维度 -> (列名, {编码: 取值})；类别编码 -1 表示不在历史类别中的类别
+SEGMENTS = {
+    "device": ("device", dict(enumerate(DEVICES))),
+    "user_type": ("user_type", dict(enumerate(USER_TYPES))),
+    "category": ("current_category", {-1: "", **dict(enumerate(HISTORY_CATEGORIES))}),
+    "spending_level_norm": ("spending_level_norm", {level: level for level in SPENDING_LEVELS}),
+}
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+
+def catalog_hash(products):
+    """商品库 (名称、基准价、类别) 的哈希，写入元数据用于判断结果对应哪个商品库"""
+    text = json.dumps([[name, products[name]["base"], products[name]["category"]] for name in products],
+                      ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def run_metadata(rules, products, seed, **extra):
+    """一次运行的元数据：规则版本与哈希、随机种子、商品库哈希与商品名称 (product 列为其下标)"""
+    return {
+        "rules_version": rules.version,
+        "rules_digest": rules.digest,
+        "seed": seed,
+        "catalog_hash": catalog_hash(products),
+        "products": list(products),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        **extra,
+    }
+
+
+# ==========================================
+# 1. 写入
+# ==========================================
+
+class PartWriter:
+    """写入一个分片：每列一个文件，按块追加；close() 写出分片的行数"""
+
+    def __init__(self, directory, columns=COLUMNS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.columns = dict(columns)
+        self.rows = 0
+        self._files = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name in self.columns}
+
+    def append(self, chunk):
+        """chunk 为列名 -> 等长数组的字典 (多出的列忽略)"""
+        n = None
+        for name, dtype in self.columns.items():
+            values = np.ascontiguousarray(chunk[name], dtype=dtype)
+            if n is None:
+                n = len(values)
+            elif len(values) != n:
+                raise ValueError(f"列 {name} 的长度 {len(values)} 与其他列 ({n}) 不一致")
+            values.tofile(self._files[name])
+        self.rows += n or 0
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        with open(os.path.join(self.directory, "part.json"), "w", encoding="utf-8") as f:
+            json.dump({"rows": self.rows}, f)
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RunWriter:
+    """
+    写入一次运行。分片先写在临时目录中 (part() 返回 PartWriter，也可以由其他进程按 part_path() 自行写入)，
+    close() 汇总分片、写 run.json 后整体替换目标目录，打开中的旧结果不会读到半写文件。
+    """
+
+    def __init__(self, path, metadata, columns=COLUMNS):
+        self.path = path
+        self.metadata = metadata
+        self.columns = dict(columns)
+        self.staging = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+
+    def part_path(self, index):
+        return os.path.join(self.staging, f"part-{index:05d}")
+
+    def part(self, index=0):
+        return PartWriter(self.part_path(index), self.columns)
+
+    def close(self):
+        parts = []
+        for name in sorted(os.listdir(self.staging)):
+            meta_path = os.path.join(self.staging, name, "part.json")
+            if name.startswith("part-") and os.path.exists(meta_path):
+                with open(meta_path, encoding="utf-8") as f:
+                    parts.append({"name": name, "rows": json.load(f)["rows"]})
+        meta = {
+            "format": FORMAT_VERSION,
+            "rows": sum(part["rows"] for part in parts),
+            "columns": self.columns,
+            "parts": parts,
+            "metadata": self.metadata,
+        }
+        with open(os.path.join(self.staging, "run.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        old_path = f"{self.path}.{os.getpid()}.old"
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(self.staging, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return meta
+
+    def abort(self):
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# ==========================================
+# 2. 读取与聚合
+# ==========================================
+
+class Run:
+    """内存映射打开的一次运行；parts[i][列名] 为只读 np.memmap"""
+
+    def __init__(self, meta, parts):
+        self.meta = meta
+        self.metadata = meta["metadata"]
+        self.columns = meta["columns"]
+        self.parts = parts
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, "run.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"不支持的结果格式: {meta.get('format')}")
+        parts = []
+        for part in meta["parts"]:
+            if part["rows"] == 0:
+                continue
+            directory = os.path.join(path, part["name"])
+            parts.append({
+                name: np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype, mode="r",
+                                shape=(part["rows"],))
+                for name, dtype in meta["columns"].items()
+            })
+        return cls(meta, parts)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def chunks(self, columns, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """按块产出 {列名: 视图}，视图直接指向映射的文件，不复制"""
+        for part in self.parts:
+            n = len(next(iter(part.values())))
+            for start in range(0, n, chunk_rows):
+                yield {name: part[name][start:start + chunk_rows] for name in columns}
+
+    def segment_values(self, segment):
+        """某个维度下出现过的取值 (按编码排序)"""
+        column, labels = SEGMENTS[segment]
+        seen = set()
+        for chunk in self.chunks((column,)):
+            seen.update(np.unique(chunk[column]).tolist())
+        return [labels[code] for code in sorted(seen)]
+
+    def filtered_chunks(self, columns, filters=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        按块产出筛选后的 {列名: 数组}。filters 为 维度 -> 允许取值的列表 (取值为 SEGMENTS 中解码后的形式)，
+        为空表示不筛选；不筛选时产出的仍是映射文件上的视图。
+        """
+        filter_codes = {}
+        for segment, values in (filters or {}).items():
+            if values:
+                filter_column, filter_labels = SEGMENTS[segment]
+                filter_codes[filter_column] = np.array([code for code, value in filter_labels.items() if value in values])
+        for chunk in self.chunks(set(columns) | set(filter_codes), chunk_rows):
+            mask = None
+            for filter_column, codes in filter_codes.items():
+                keep = np.isin(chunk[filter_column], codes)
+                mask = keep if mask is None else mask & keep
+            if mask is None:
+                yield {name: chunk[name] for name in columns}
+            elif mask.any():
+                yield {name: chunk[name][mask] for name in columns}
+
+    def aggregate(self, by, filters=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """按维度 by 分组统计价格与差异百分比 (人数、平均价格、平均差异%、差异%标准差、加价占比)"""
+        column, labels = SEGMENTS[by]
+        # 编码先平移到非负再分组 (类别编码可为 -1)
+        groups = 256
+        count = np.zeros(groups, dtype=np.int64)
+        price_sum = np.zeros(groups)
+        pct_sum = np.zeros(groups)
+        pct_sq = np.zeros(groups)
+        up = np.zeros(groups, dtype=np.int64)
+        for chunk in self.filtered_chunks((column, "base_price", "price"), filters, chunk_rows):
+            key = chunk[column].astype(np.int64) + 128
+            price = chunk["price"]
+            diff_pct = (price - chunk["base_price"]) / chunk["base_price"] * 100
+            count += np.bincount(key, minlength=groups)
+            price_sum += np.bincount(key, weights=price, minlength=groups)
+            pct_sum += np.bincount(key, weights=diff_pct, minlength=groups)
+            pct_sq += np.bincount(key, weights=diff_pct ** 2, minlength=groups)
+            up += np.bincount(key[diff_pct > 0], minlength=groups)
+
+        rows = []
+        for key in np.flatnonzero(count):
+            n = int(count[key])
+            mean = pct_sum[key] / n
+            variance = max(pct_sq[key] / n - mean ** 2, 0.0) * n / (n - 1) if n > 1 else float("nan")
+            rows.append({
+                "分组": labels[int(key) - 128],
+                "人数": n,
+                "平均价格": float(price_sum[key] / n),
+                "平均差异%": float(mean),
+                "差异%标准差": float(variance ** 0.5),
+                "加价占比%": float(up[key] / n * 100),
+            })
+        return rows
+
+    def histogram(self, by=None, filters=None, lo=-100.0, hi=100.0, resolution=0.5,
+                  chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        差异百分比的分组直方图，返回 (左边界, {分组取值: 计数})；by 为 None 时只有一组，键为 ""。
+        超出 [lo, hi) 的值并入两端的分箱。
+        """
+        bins = int(round((hi - lo) / resolution))
+        column, labels = SEGMENTS[by] if by else (None, {0: ""})
+        groups = 256
+        counts = np.zeros(groups * bins, dtype=np.int64)
+        columns = ("base_price", "price") + ((column,) if column else ())
+        for chunk in self.filtered_chunks(columns, filters, chunk_rows):
+            diff_pct = (chunk["price"] - chunk["base_price"]) / chunk["base_price"] * 100
+            index = np.clip(np.floor((diff_pct - lo) / resolution).astype(np.int64), 0, bins - 1)
+            key = chunk[column].astype(np.int64) + 128 if column else 128
+            counts += np.bincount(key * bins + index, minlength=groups * bins)
+        counts = counts.reshape(groups, bins)
+        edges = lo + np.arange(bins) * resolution
+        return edges, {labels[key - 128]: counts[key] for key in np.flatnonzero(counts.sum(axis=1))}
+
+    def sample(self, columns, budget, filters=None, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        筛选后的行中均匀抽取至多 budget 行 (一次遍历：每行一个随机优先级，保留优先级最小的 budget 行)，
+        返回 {列名: 数组}，行按原顺序排列。
+        """
+        rng = np.random.default_rng(seed)
+        kept = {name: np.empty(0, dtype=self.columns[name]) for name in columns}
+        priority = np.empty(0)
+        for chunk in self.filtered_chunks(columns, filters, chunk_rows):
+            n = len(chunk[columns[0]])
+            priority = np.concatenate([priority, rng.random(n)])
+            kept = {name: np.concatenate([kept[name], chunk[name]]) for name in columns}
+            if len(priority) > budget:
+                keep = np.sort(np.argpartition(priority, budget)[:budget])
+                priority = priority[keep]
+                kept = {name: values[keep] for name, values in kept.items()}
+        return kept
+
+
+def list_runs(directory):
+    """目录下已完成的运行 (含 run.json 的子目录)，按修改时间从新到旧"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    runs = [os.path.join(directory, name) for name in os.listdir(directory)
+            if os.path.exists(os.path.join(directory, name, "run.json"))]
+    return sorted(runs, key=os.path.getmtime, reverse=True)
@@ -0,0 +1,693 @@
+"""
+声明式定价规则
+
+规则写在 pricing_rules.json 中：每条规则由若干按顺序匹配的 case 组成，
+case 给出条件 (when)、效果 (pct 按基准价百分比 / fixed 固定金额) 以及因素名称和类型。
+规则文件被编译为：
+  - 标量求值器：生成与手写 if/elif 链等价的 Python 函数，供 calculate_price_logic 使用；
+    另有只算价格、不构造因素明细的 price_only 版本
+  - 批量求值器：每条规则编译为一次 np.select，供 batch_pricing.price_batch 使用
+  - 单画像 × 多商品求值器：先代入画像，把规则链化简为 "基准价百分比 + 固定金额" 后一次数组运算
+编译结果按规则内容哈希缓存；文件修改后 get_rules() 会自动热加载，
+正在进行中的求值继续使用旧规则对象，不受影响。
+批量求值器在第一次调用 evaluate_batch 时才编译，只做标量定价的进程不会加载 numpy。
+"""
+
+import hashlib
+import json
+import math
+import operator
+import os
+import re
+import threading
+import time
+import warnings
+
+DEFAULT_RULES_PATH = os.environ.get(
+    "PRICING_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "pricing_rules.json"),
+)
+
+# 热加载时检查文件修改时间的最小间隔 (秒)
+RELOAD_CHECK_INTERVAL = 1.0
+
+# 条件可引用的字段：标量取值方式 与 批量列使用的 batch_pricing 编码表名 (None 表示数值直接比较)
+FIELDS = {
+    "user_type": ('profile["user_type"]', "USER_TYPES"),
+    "spending_level_norm": ('profile["spending_level_norm"]', None),
+    "device": ('profile["device"]', "DEVICES"),
+    "activity_score": ('profile["activity_score"]', None),
+    "frequency": ('profile["frequency"]', "FREQUENCIES"),
+    "return_rate": ('profile["return_rate"]', "RETURN_RATES"),
+    "purchase_period": ('profile["purchase_period"]', "PURCHASE_PERIODS"),
+    "current_category": ('profile["current_category"]', "category"),
+    "has_similar_in_cart": ('profile.get("has_similar_in_cart", False)', None),
+    "base_price": ("base_price", None),
+    # 派生字段
+    "history_empty": ('(not profile["history_categories"])', None),
+    "category_in_history": ('(profile["current_category"] in profile["history_categories"])', None),
+}
+
+# 随商品变化的字段：单画像 × 多商品求值时按列计算，其余字段对一个画像是常量
+ITEM_FIELDS = ("base_price", "current_category", "category_in_history")
+
+OPERATORS = {"eq": "==", "ne": "!=", "gt": ">", "ge": ">=", "lt": "<", "le": "<="}
+FACTOR_TYPES = ("优惠", "加价", "中性")
+# 规则 id 会出现在生成的求值代码中，只允许标识符
+RULE_ID_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class RuleError(ValueError):
+    """规则文件格式错误"""
+
+
+class Factor:
+    """
+    单个价格影响因素。
+    使用 __slots__ 避免每条记录一个 __dict__；name/type 为规则文件中的常量字符串，
+    由所有记录共享，不会重复分配。
+    """
+    __slots__ = ("name", "change", "type")
+
+    def __init__(self, name, change, type):
+        self.name = name
+        self.change = change
+        self.type = type
+
+    def __repr__(self):
+        return f"Factor({self.name!r}, {self.change!r}, {self.type!r})"
+
+    def __eq__(self, other):
+        return (isinstance(other, Factor) and self.name == other.name
+                and self.change == other.change and self.type == other.type)
+
+    def __reduce__(self):
+        return Factor, (self.name, self.change, self.type)
+
+    def as_dict(self):
+        return {"name": self.name, "change": self.change, "type": self.type}
+
+
+class FactorList:
+    """
+    evaluate() 返回的因素明细。
+    求值时只记录 (case 编号, 金额) 元组，Factor 记录在第一次被遍历/下标访问时才构造。
+    """
+    __slots__ = ("_items", "_cases", "_factors")
+
+    def __init__(self, items, cases):
+        self._items = items
+        self._cases = cases
+        self._factors = None
+
+    def _materialize(self):
+        if self._factors is None:
+            cases = self._cases
+            self._factors = [Factor(cases[i][0], change, cases[i][1]) for i, change in self._items]
+        return self._factors
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._materialize()[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"FactorList({self._materialize()!r})"
+
+    def __reduce__(self):
+        return FactorList, (self._items, self._cases)
+
+    @property
+    def changes(self):
+        return [change for _, change in self._items]
+
+
+# ==========================================
+# 1. 校验
+# ==========================================
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_value(field, op, value):
+    if op in ("gt", "ge", "lt", "le"):
+        if not _is_number(value):
+            raise RuleError(f"字段 {field} 的 {op} 需要数值: {value!r}")
+    elif value is not None and not isinstance(value, (str, int, float, bool)):
+        raise RuleError(f"字段 {field} 的取值应为字符串、数值或布尔值: {value!r}")
+
+
+def _tests(field, spec):
+    """把 when 中一个字段的条件展开为 [(op, value), ...]"""
+    if field not in FIELDS:
+        raise RuleError(f"未知字段: {field}")
+    if not isinstance(spec, dict):
+        _check_value(field, "eq", spec)
+        return [("eq", spec)]
+    tests = []
+    for op, value in spec.items():
+        if op not in OPERATORS and op not in ("in", "not_in"):
+            raise RuleError(f"字段 {field} 使用了未知运算符: {op}")
+        if op in ("in", "not_in"):
+            if not isinstance(value, list):
+                raise RuleError(f"字段 {field} 的 {op} 需要列表")
+            for item in value:
+                _check_value(field, op, item)
+        else:
+            _check_value(field, op, value)
+        tests.append((op, value))
+    return tests
+
+
+def _check_rule(rule):
+    if not isinstance(rule, dict) or not isinstance(rule.get("id"), str):
+        raise RuleError("每条规则需要字符串 id")
+    if not RULE_ID_PATTERN.match(rule["id"]):
+        raise RuleError(f"规则 id 只能包含字母、数字和下划线，且不能以数字开头: {rule['id']!r}")
+    cases = rule.get("cases")
+    if not isinstance(cases, list) or not cases:
+        raise RuleError(f"规则 {rule['id']} 缺少 cases")
+    for case in cases:
+        if not isinstance(case, dict):
+            raise RuleError(f"规则 {rule['id']} 的 case 应为对象: {case!r}")
+        if "pct" in case and "fixed" in case:
+            raise RuleError(f"规则 {rule['id']} 的 case 不能同时给出 pct 和 fixed")
+        for key in ("pct", "fixed"):
+            if key in case and not (_is_number(case[key]) and math.isfinite(case[key])):
+                raise RuleError(f"规则 {rule['id']} 的 {key} 应为有限数值: {case[key]!r}")
+        if not isinstance(case.get("name"), str) or case.get("type") not in FACTOR_TYPES:
+            raise RuleError(f"规则 {rule['id']} 的 case 需要 name 和 type ({'/'.join(FACTOR_TYPES)})")
+        when = case.get("when", {})
+        if not isinstance(when, dict):
+            raise RuleError(f"规则 {rule['id']} 的 when 应为对象: {when!r}")
+        for field, spec in when.items():
+            _tests(field, spec)
+
+
+# ==========================================
+# 2. 编译
+# ==========================================
+
+def _scalar_condition(when):
+    parts = []
+    for field, spec in when.items():
+        expr = f"v_{field}"  # 字段值在函数开头统一取出，见 CompiledRules
+        for op, value in _tests(field, spec):
+            if op == "in":
+                parts.append(f"{expr} in {tuple(value)!r}")
+            elif op == "not_in":
+                parts.append(f"{expr} not in {tuple(value)!r}")
+            else:
+                parts.append(f"{expr} {OPERATORS[op]} {value!r}")
+    return " and ".join(parts) or "True"
+
+
+def _scalar_change(case):
+    if "pct" in case:
+        return f"base_price * {float(case['pct'])!r}"
+    if "fixed" in case:
+        return repr(case["fixed"])
+    return "0"
+
+
+def _scalar_source(rule, explain):
+    """一条规则 -> 标量求值代码片段 (与原 if/elif 链结构相同)；explain=False 时不记录因素"""
+    # repr 会转义所有换行类字符，标题不会跳出注释行
+    lines = [f"    # {rule['id']}: {str(rule.get('title', ''))!r}"]
+    for i, case in enumerate(rule["cases"]):
+        when = case.get("when")
+        if when:
+            keyword = "if" if i == 0 else "elif"
+            lines.append(f"    {keyword} {_scalar_condition(when)}:")
+        else:
+            lines.append("    else:" if i else "    if True:")
+        change = _scalar_change(case)
+        if explain:
+            # @CASE 在拼装规则集时替换为该规则第一个 case 的全局编号
+            lines.append(f"        change = {change}")
+            lines.append(f"        factors.append((@CASE+{i}, change))")
+            if change != "0":
+                lines.append("        current_price += change")
+        elif change != "0":
+            lines.append(f"        current_price += {change}")
+        else:
+            lines.append("        pass")
+        if not when:
+            break  # 无条件 case 之后的 case 永远不会命中
+    return "\n".join(lines)
+
+
+def _batch_test(field, op, value):
+    """单个 (字段, 运算符, 取值) -> 作用于列字典的布尔数组函数"""
+    import numpy as np
+
+    import batch_pricing
+
+    codes = FIELDS[field][1]
+
+    def encode(v):
+        if codes == "category":
+            return batch_pricing.category_code(v)
+        if codes is not None:
+            return getattr(batch_pricing, codes).index(v)
+        return v
+
+    if field == "history_empty":
+        column = lambda cols: np.asarray(cols["history_mask"]) == 0
+    elif field == "category_in_history":
+        def column(cols):
+            category = np.asarray(cols["current_category"], dtype=np.int64)
+            history = np.asarray(cols["history_mask"], dtype=np.int64)
+            return (category >= 0) & (((history >> np.maximum(category, 0)) & 1) == 1)
+    else:
+        name = field
+        column = lambda cols: np.asarray(cols[name])
+
+    if op in ("in", "not_in"):
+        encoded = [encode(v) for v in value]
+        negate = op == "not_in"
+        return lambda cols: np.isin(column(cols), encoded) ^ negate
+    encoded = encode(value)
+    compare = {
+        "eq": np.equal, "ne": np.not_equal, "gt": np.greater,
+        "ge": np.greater_equal, "lt": np.less, "le": np.less_equal,
+    }[op]
+    return lambda cols: compare(column(cols), encoded)
+
+
+def _batch_rule(rule):
+    """一条规则 -> [(条件函数列表, pct, fixed), ...]，无条件 case 的条件列表为空"""
+    compiled = []
+    for case in rule["cases"]:
+        tests = [_batch_test(field, op, value)
+                 for field, spec in case.get("when", {}).items()
+                 for op, value in _tests(field, spec)]
+        compiled.append((tests, case.get("pct"), case.get("fixed")))
+        if not tests:
+            break
+    return compiled
+
+
+_SCALAR_OPS = {
+    "eq": operator.eq, "ne": operator.ne, "gt": operator.gt, "ge": operator.ge,
+    "lt": operator.lt, "le": operator.le,
+    "in": lambda a, b: a in b, "not_in": lambda a, b: a not in b,
+}
+
+# 画像字段的取值函数，与标量求值器使用同一表达式
+_PROFILE_GETTERS = {}
+
+
+def _profile_getter(field):
+    getter = _PROFILE_GETTERS.get(field)
+    if getter is None:
+        getter = _PROFILE_GETTERS[field] = eval(f"lambda profile: {FIELDS[field][0]}")
+    return getter
+
+
+def _split_rule(rule):
+    """
+    一条规则 -> [(画像条件列表, 商品条件函数列表, pct, fixed), ...]
+    画像条件为 (取值函数, 比较函数, 取值)，商品条件与批量求值器相同，作用于列字典
+    """
+    compiled = []
+    for case in rule["cases"]:
+        profile_tests, item_tests = [], []
+        for field, spec in case.get("when", {}).items():
+            for op, value in _tests(field, spec):
+                if field in ITEM_FIELDS:
+                    item_tests.append(_batch_test(field, op, value))
+                else:
+                    value = tuple(value) if op in ("in", "not_in") else value
+                    profile_tests.append((_profile_getter(field), _SCALAR_OPS[op], value))
+        compiled.append((profile_tests, item_tests, float(case.get("pct", 0.0)), float(case.get("fixed", 0.0))))
+        if not profile_tests and not item_tests:
+            break
+    return compiled
+
+
+def _rule_fields(rule):
+    return {field for case in rule["cases"] for field in case.get("when", {})}
+
+
+# 单条规则的编译缓存：规则内容不变时，重载只需重新拼装
+_RULE_CACHE = {}
+# 整个规则集的编译缓存 (按文件内容哈希)
+_SET_CACHE = {}
+
+
+def _compile_rule(rule):
+    key = json.dumps(rule, ensure_ascii=False, sort_keys=True)
+    if key not in _RULE_CACHE:
+        _check_rule(rule)
+        _RULE_CACHE[key] = (_scalar_source(rule, True), _scalar_source(rule, False),
+                            _rule_fields(rule))
+    return _RULE_CACHE[key]
+
+
+# 单条规则的批量求值器缓存 (首次批量求值时才编译)
+_BATCH_CACHE = {}
+
+
+def _compile_batch_rule(rule):
+    key = json.dumps(rule, ensure_ascii=False, sort_keys=True)
+    if key not in _BATCH_CACHE:
+        _BATCH_CACHE[key] = _batch_rule(rule)
+    return _BATCH_CACHE[key]
+
+
+_SPLIT_CACHE = {}
+
+
+def _compile_split_rule(rule):
+    key = json.dumps(rule, ensure_ascii=False, sort_keys=True)
+    if key not in _SPLIT_CACHE:
+        _SPLIT_CACHE[key] = _split_rule(rule)
+    return _SPLIT_CACHE[key]
+
+
+class CompiledRules:
+    """编译后的规则集，evaluate / evaluate_batch 分别服务标量与批量路径"""
+
+    def __init__(self, spec, digest):
+        rules = spec.get("rules") if isinstance(spec, dict) else None
+        if not isinstance(rules, list) or not rules:
+            raise RuleError("规则文件需要非空的 rules 列表")
+        ids = [rule.get("id") for rule in rules if isinstance(rule, dict)]
+        if len(set(ids)) != len(ids):
+            raise RuleError("规则 id 不能重复")
+
+        self.digest = digest
+        self.version = spec.get("version")
+        self.rules = rules
+        self.rule_ids = tuple(ids)
+        compiled = [_compile_rule(rule) for rule in rules]
+        used_fields = [field for field in FIELDS if any(field in item[2] for item in compiled)]
+        prologue = [f"    v_{field} = {FIELDS[field][0]}" for field in used_fields]
+
+        # 所有 case 的 (因素名称, 类型) 常量表，FactorList 通过编号引用
+        cases, explain_snippets, case_starts = [], [], []
+        for rule, item in zip(rules, compiled):
+            case_starts.append(len(cases))
+            explain_snippets.append(item[0].replace("@CASE", str(len(cases))))
+            cases.extend((case["name"], case["type"]) for case in rule["cases"])
+        self.cases = tuple(cases)
+        self._case_starts = tuple(case_starts)
+        self._rule_fields = [item[2] for item in compiled]
+
+        source = "\n".join(
+            ["def evaluate(base_price, profile):",
+             "    factors = []",
+             "    current_price = base_price"]
+            + prologue
+            + explain_snippets
+            + ["    return round(current_price, 2), FactorList(factors, CASES)",
+               "",
+               "def price_only(base_price, profile):",
+               "    current_price = base_price"]
+            + prologue
+            + [item[1] for item in compiled]
+            + ["    return round(current_price, 2)"]
+        )
+        namespace = {"FactorList": FactorList, "CASES": self.cases}
+        exec(compile(source, f"<pricing_rules {digest}>", "exec"), namespace)
+        self.source = source
+        # evaluate(base_price, profile) -> (价格, FactorList)
+        self.evaluate = namespace["evaluate"]
+        # price_only(base_price, profile) -> 价格，不构造任何因素记录
+        self.price_only = namespace["price_only"]
+        self._batch_rules = None
+        self._split_rules = None
+        self._incremental = None
+
+    def incremental_evaluator(self):
+        """
+        增量求值器，返回 (各规则的依赖字段, 全部依赖字段, evaluate_incremental)。
+        依赖字段为规则条件读取的字段 (含 history_empty 等派生字段)，有按百分比生效的 case 时另含 base_price。
+
+        evaluate_incremental(base_price, profile, last, items, misses) 与 evaluate 结果相同。
+        先把每个字段与上次取值 last 比较，得到依赖字段发生变化的规则集合 (位掩码)；
+        只有这些规则重新走条件链并把命中的 (case 编号, 金额) 写回 items，同时 misses[j] 加一，
+        其余规则直接复用 items[j]。没有任何字段变化时直接返回上次的结果 (保存在 items 末尾)。
+        """
+        if self._incremental is None:
+            rule_fields = []
+            for rule, fields in zip(self.rules, self._rule_fields):
+                fields = set(fields)
+                if any("pct" in case for case in rule["cases"]):
+                    fields.add("base_price")
+                rule_fields.append(tuple(field for field in FIELDS if field in fields))
+            used_fields = tuple(field for field in FIELDS if any(field in fields for fields in rule_fields))
+
+            lines = ["def evaluate_incremental(base_price, profile, last, items, misses):"]
+            lines += [f"    v_{field} = {FIELDS[field][0]}" for field in used_fields]
+            lines.append("    changed = 0")
+            for k, field in enumerate(used_fields):
+                mask = sum(1 << j for j, fields in enumerate(rule_fields) if field in fields)
+                lines += [f"    if v_{field} != last[{k}]:",
+                          f"        last[{k}] = v_{field}",
+                          f"        changed |= {mask}"]
+            lines += [f"    if not changed:",
+                      f"        return items[{len(self.rules)}]",
+                      "    factors = []",
+                      "    current_price = base_price"]
+
+            start = 0
+            for j, (rule, fields) in enumerate(zip(self.rules, rule_fields)):
+                # 不读取任何字段的规则是常量，直接求值；其余规则只在依赖字段变化时重算
+                indent = "        " if fields else "    "
+                lines.append(f"    # {rule['id']}")
+                if fields:
+                    lines += [f"    if changed & {1 << j}:", f"        misses[{j}] += 1"]
+                for i, case in enumerate(rule["cases"]):
+                    item = f"({start + i}, {_scalar_change(case)})"
+                    when = case.get("when")
+                    if not when:
+                        if i:
+                            lines += [f"{indent}else:", f"{indent}    item = {item}"]
+                        else:
+                            lines.append(f"{indent}item = {item}")
+                        break
+                    lines += [f"{indent}{'elif' if i else 'if'} {_scalar_condition(when)}:",
+                              f"{indent}    item = {item}"]
+                else:
+                    lines += [f"{indent}else:", f"{indent}    item = None"]
+                if fields:
+                    lines += [f"        items[{j}] = item",
+                              "    else:",
+                              f"        item = items[{j}]"]
+                lines += ["    if item is not None:",
+                          "        factors.append(item)",
+                          "        current_price += item[1]"]
+                start += len(rule["cases"])
+
+            lines += ["    result = round(current_price, 2), FactorList(factors, CASES)",
+                      f"    items[{len(self.rules)}] = result",
+                      "    return result"]
+            namespace = {"FactorList": FactorList, "CASES": self.cases}
+            exec(compile("\n".join(lines), f"<pricing_rules incremental {self.digest}>", "exec"), namespace)
+            self._incremental = (tuple(rule_fields), used_fields, namespace["evaluate_incremental"])
+        return self._incremental
+
+    def evaluate_batch(self, columns, with_contributions=True):
+        """
+        按列批量求值，返回 (final_prices, contributions)，contributions 列顺序见 rule_ids。
+        with_contributions=False 时不保留 (n, 规则数) 矩阵，逐条规则直接累加，返回 (final_prices, None)。
+        """
+        import numpy as np
+
+        from batch_pricing import round_price
+
+        if self._batch_rules is None:
+            self._batch_rules = [_compile_batch_rule(rule) for rule in self.rules]
+        base = np.asarray(columns["base_price"], dtype=np.float64)
+        n = max((np.size(v) for v in columns.values()), default=0)
+        base = np.broadcast_to(base, (n,))
+        # 按规则顺序逐列累加，保证浮点误差与标量版一致
+        current = base.copy()
+        contributions = np.zeros((n, len(self._batch_rules))) if with_contributions else None
+
+        for j, cases in enumerate(self._batch_rules):
+            conditions, choices = [], []
+            default = 0.0
+            for tests, pct, fixed in cases:
+                value = base * float(pct) if pct is not None else float(fixed) if fixed is not None else 0.0
+                if not tests:
+                    default = value
+                    break
+                condition = tests[0](columns)
+                for test in tests[1:]:
+                    condition = condition & test(columns)
+                conditions.append(np.broadcast_to(condition, (n,)))
+                choices.append(value)
+            change = np.select(conditions, choices, default) if conditions else default
+            current += change
+            if with_contributions:
+                contributions[:, j] = change
+        return round_price(current), contributions
+
+    def match_cases(self, columns):
+        """
+        按列批量求出每条规则命中的 case 下标，返回 (n, 规则数) 的 int8 矩阵，没有命中任何 case 时为 -1。
+        命中的 case 只取决于画像与商品，与各 case 的效果数值无关 (调参时只需计算一次)。
+        """
+        import numpy as np
+
+        if self._batch_rules is None:
+            self._batch_rules = [_compile_batch_rule(rule) for rule in self.rules]
+        n = max((np.size(v) for v in columns.values()), default=0)
+        matched = np.empty((n, len(self._batch_rules)), dtype=np.int8)
+        for j, cases in enumerate(self._batch_rules):
+            conditions, choices = [], []
+            default = -1
+            for k, (tests, _, _) in enumerate(cases):
+                if not tests:
+                    default = k
+                    break
+                condition = tests[0](columns)
+                for test in tests[1:]:
+                    condition = condition & test(columns)
+                conditions.append(np.broadcast_to(condition, (n,)))
+                choices.append(k)
+            matched[:, j] = np.select(conditions, choices, default) if conditions else default
+        return matched
+
+    def matched_factors(self, base_price, matched):
+        """
+        match_cases 的一行 (各规则命中的 case 下标) -> 因素明细，与 evaluate(base_price, ...) 返回的 FactorList 相同。
+        金额按标量求值器的表达式计算 (百分比为 base_price * pct，固定金额原样)，数值与类型都一致。
+        """
+        items = []
+        for start, rule, k in zip(self._case_starts, self.rules, matched):
+            if k < 0:
+                continue
+            case = rule["cases"][k]
+            if "pct" in case:
+                change = base_price * float(case["pct"])
+            else:
+                change = case.get("fixed", 0)
+            items.append((start + int(k), change))
+        return FactorList(items, self.cases)
+
+    def price_profile(self, profile, base_prices, categories):
+        """
+        单个画像 × 多个商品 (base_prices 与 categories 等长，categories 为 batch_pricing 类别编码)。
+        只涉及画像的条件先逐条求值，每条规则化为 "基准价百分比 + 固定金额"，
+        仍依赖商品字段的规则 (如价格敏感度保护、尝试新品类) 用 np.select 选出每个商品的百分比与金额，
+        全部规则合并后只做一次数组运算：final = base * (1 + Σpct) + Σfixed。
+        返回 (final_prices, pct, fixed)，pct / fixed 在没有规则依赖商品字段时为标量。
+
+        合并后的浮点误差远小于舍入平局的判定宽度，接近平局的元素改用标量路径重算，
+        因此结果与 evaluate 逐元素一致。
+        """
+        import numpy as np
+
+        from batch_pricing import HISTORY_CATEGORIES, history_mask
+
+        if self._split_rules is None:
+            self._split_rules = [_compile_split_rule(rule) for rule in self.rules]
+        base = np.asarray(base_prices, dtype=np.float64)
+        columns = {
+            "base_price": base,
+            "current_category": categories,
+            "history_mask": history_mask(profile["history_categories"]),
+        }
+
+        pct, fixed = 0.0, 0.0
+        for cases in self._split_rules:
+            conditions, pcts, fixeds = [], [], []
+            default_pct, default_fixed = 0.0, 0.0
+            for profile_tests, item_tests, case_pct, case_fixed in cases:
+                if not all(compare(get(profile), value) for get, compare, value in profile_tests):
+                    continue
+                if not item_tests:
+                    default_pct, default_fixed = case_pct, case_fixed
+                    break
+                condition = item_tests[0](columns)
+                for test in item_tests[1:]:
+                    condition = condition & test(columns)
+                conditions.append(condition)
+                pcts.append(case_pct)
+                fixeds.append(case_fixed)
+            if conditions:
+                pct = pct + np.select(conditions, pcts, default_pct)
+                fixed = fixed + np.select(conditions, fixeds, default_fixed)
+            else:
+                pct += default_pct
+                fixed += default_fixed
+
+        final = base * (1.0 + pct) + fixed
+        scaled = final * 100
+        rounded = np.rint(scaled) / 100
+        near_tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+        if len(near_tie):
+            codes = np.broadcast_to(np.asarray(categories), base.shape)
+            item_profile = dict(profile)
+            for i in near_tie:
+                code = int(codes[i])
+                # 未知类别 (-1) 用空字符串代替，与批量路径一样不在任何历史类别中
+                item_profile["current_category"] = HISTORY_CATEGORIES[code] if code >= 0 else ""
+                rounded[i] = self.price_only(float(base[i]), item_profile)
+        return rounded, pct, fixed
+
+
+# ==========================================
+# 3. 加载与热加载
+# ==========================================
+
+def compile_rules(text):
+    """编译规则文件内容 (按内容哈希缓存)"""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    if digest not in _SET_CACHE:
+        try:
+            spec = json.loads(text)
+        except ValueError as e:
+            raise RuleError(f"规则文件不是合法的 JSON: {e}") from e
+        _SET_CACHE[digest] = CompiledRules(spec, digest)
+    return _SET_CACHE[digest]
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return compile_rules(f.read())
+
+
+_lock = threading.Lock()
+_state = {"rules": None, "mtime": None, "checked": 0.0, "path": DEFAULT_RULES_PATH}
+
+
+def get_rules():
+    """
+    返回当前生效的规则集。
+    至多每 RELOAD_CHECK_INTERVAL 秒检查一次文件修改时间，变化时重新编译；
+    新规则文件有误时保留旧规则并发出警告。
+    """
+    now = time.monotonic()
+    rules = _state["rules"]
+    if rules is not None and now - _state["checked"] < RELOAD_CHECK_INTERVAL:
+        return rules
+    with _lock:
+        _state["checked"] = now
+        try:
+            mtime = os.stat(_state["path"]).st_mtime_ns
+        except OSError:
+            if _state["rules"] is None:
+                raise
+            return _state["rules"]
+        if mtime != _state["mtime"]:
+            try:
+                _state["rules"] = load_rules(_state["path"])
+            except (RuleError, OSError, UnicodeError) as e:  # 内容有误，或读取时文件正被替换
+                if _state["rules"] is None:
+                    raise
+                warnings.warn(f"规则文件重载失败，继续使用旧规则: {e}")
+            _state["mtime"] = mtime
+        return _state["rules"]
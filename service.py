@@ -0,0 +1,277 @@
+"""
+无界面定价服务 (asyncio HTTP/1.1，支持 keep-alive)
+
+    python service.py --port 8000
+
+接口：
+    GET  /health          健康检查
+    POST /price           单个画像定价  {"product": "无线耳机", "profile": {...}}
+    POST /price/batch     批量定价      {"items": [{"product": ..., "profile": {...}}, ...]}
+
+profile 与 main() 中构造的字典结构相同；给出 product 时 base_price 与
+current_category 默认取自商品库，也可以直接传 base_price。
+profile 各字段按 batch_pricing 的编码表校验 (validate_profile)，取值无效时返回 400。
+批量接口先校验全部请求项，再用向量化引擎一次定价，并在线程池中执行，不阻塞其他连接。
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+
+from batch_pricing import (
+    USER_TYPES, SPENDING_LEVELS, DEVICES, ACTIVITY_SCORES, FREQUENCIES, RETURN_RATES,
+    PURCHASE_PERIODS, HISTORY_CATEGORIES, encode_profiles,
+)
+from pricing import PRODUCTS, calculate_price_logic
+from rules import get_rules
+
+PROFILE_FIELDS = (
+    "user_type", "spending_level_norm", "device", "activity_score", "frequency",
+    "return_rate", "purchase_period", "history_categories",
+)
+
+# 类别型字段的合法取值 (与 batch_pricing 的编码表一致)
+FIELD_VALUES = {
+    "user_type": USER_TYPES,
+    "spending_level_norm": SPENDING_LEVELS,
+    "device": DEVICES,
+    "activity_score": ACTIVITY_SCORES,
+    "frequency": FREQUENCIES,
+    "return_rate": RETURN_RATES,
+    "purchase_period": PURCHASE_PERIODS,
+}
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+# ==========================================
+# 1. 校验与定价逻辑
+# ==========================================
+
+def validate_value(field, value):
+    """校验一个类别型字段，返回编码表中的取值；数值字段接受 30 或 30.0"""
+    allowed = FIELD_VALUES[field]
+    numeric = isinstance(allowed[0], int)
+    if numeric and isinstance(value, (int, float)) and not isinstance(value, bool) and value in allowed:
+        return allowed[allowed.index(value)]
+    if not numeric and isinstance(value, str) and value in allowed:
+        return value
+    raise BadRequest(f"{field} 的取值无效: {value!r}，可选: {', '.join(map(str, allowed))}")
+
+
+def validate_profile(profile):
+    """校验 main() 结构的 profile 字典 (需已包含 current_category)，返回规范化后的副本"""
+    missing = [field for field in PROFILE_FIELDS if field not in profile]
+    if missing:
+        raise BadRequest(f"profile 缺少字段: {', '.join(missing)}")
+    validated = {field: validate_value(field, profile[field]) for field in FIELD_VALUES}
+
+    history = profile["history_categories"]
+    if not isinstance(history, list):
+        raise BadRequest("history_categories 应为数组")
+    for category in history:
+        if not isinstance(category, str) or category not in HISTORY_CATEGORIES:
+            raise BadRequest(f"history_categories 的取值无效: {category!r}，可选: {', '.join(HISTORY_CATEGORIES)}")
+    validated["history_categories"] = list(history)
+
+    if not isinstance(profile["current_category"], str):
+        raise BadRequest("current_category 应为字符串")
+    validated["current_category"] = profile["current_category"]
+    cart = profile.get("has_similar_in_cart", False)
+    if not isinstance(cart, bool):
+        raise BadRequest("has_similar_in_cart 应为 true / false")
+    validated["has_similar_in_cart"] = cart
+    return validated
+
+
+def resolve_item(item):
+    """校验一个 {"product"/"base_price", "profile"} 请求项，返回 (商品名, 基准价, 校验后的 profile)"""
+    if not isinstance(item, dict) or not isinstance(item.get("profile"), dict):
+        raise BadRequest("缺少 profile 对象")
+    profile = dict(item["profile"])
+    product_name = item.get("product")
+    if product_name is not None:
+        if product_name not in PRODUCTS:
+            raise BadRequest(f"未知商品: {product_name}")
+        product = PRODUCTS[product_name]
+        base_price = item.get("base_price", product["base"])
+        profile.setdefault("current_category", product["category"])
+    elif "base_price" in item:
+        base_price = item["base_price"]
+        if "current_category" not in profile:
+            raise BadRequest("未给出 product 时 profile 需包含 current_category")
+    else:
+        raise BadRequest("需要 product 或 base_price")
+    if (not isinstance(base_price, (int, float)) or isinstance(base_price, bool)
+            or not (math.isfinite(base_price) and base_price > 0)):
+        raise BadRequest("base_price 必须为有限正数")
+    return product_name, base_price, validate_profile(profile)
+
+
+def _result(product_name, base_price, final_price, factors):
+    diff = final_price - base_price
+    return {
+        "product": product_name,
+        "base_price": base_price,
+        "final_price": final_price,
+        "diff": round(diff, 2),
+        "diff_pct": round(diff / base_price * 100, 2),
+        "factors": [factor.as_dict() for factor in factors],
+    }
+
+
+def price_item(item):
+    """对一个请求项定价"""
+    product_name, base_price, profile = resolve_item(item)
+    final_price, factors = calculate_price_logic(base_price, profile)
+    return _result(product_name, base_price, final_price, factors)
+
+
+def price_items(items):
+    """
+    批量定价，结果与逐项调用 price_item 相同。
+    先校验全部请求项 (任一项无效时整批失败)，再一次 encode_profiles + 向量化求值；
+    因素明细由 match_cases 命中的 case 还原，价格与因素使用同一个规则对象，求值期间热加载也不会错配。
+    """
+    resolved = [resolve_item(item) for item in items]
+    if not resolved:
+        return []
+    bases = [base_price for _, base_price, _ in resolved]
+    columns = encode_profiles([profile for _, _, profile in resolved], bases)
+    rules = get_rules()
+    prices, _ = rules.evaluate_batch(columns, with_contributions=False)
+    matched = rules.match_cases(columns)
+    return [_result(product_name, base_price, float(price), rules.matched_factors(base_price, row))
+            for (product_name, base_price, _), price, row in zip(resolved, prices, matched)]
+
+
+def handle(method, path, body):
+    """路由，返回 (状态码, 响应对象)"""
+    if path == "/health":
+        return 200, {"status": "ok"}
+    if path not in ("/price", "/price/batch"):
+        return 404, {"error": f"未知路径: {path}"}
+    if method != "POST":
+        return 405, {"error": "请使用 POST"}
+
+    try:
+        payload = json.loads(body or b"null")
+    except ValueError:
+        return 400, {"error": "请求体不是合法的 JSON"}
+
+    try:
+        if path == "/price":
+            return 200, price_item(payload)
+        items = payload.get("items") if isinstance(payload, dict) else None
+        if not isinstance(items, list):
+            raise BadRequest("批量接口需要 items 数组")
+        return 200, {"results": price_items(items)}
+    except BadRequest as e:
+        return 400, {"error": str(e)}
+
+
+# ==========================================
+# 2. HTTP 协议层
+# ==========================================
+
+async def read_request(reader):
+    """读取一个请求，连接关闭时返回 None"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise PayloadTooLarge("请求体过大")
+    body = await reader.readexactly(length) if length else b""
+
+    keep_alive = headers.get("connection", "").lower() != "close" if version == "HTTP/1.1" \
+        else headers.get("connection", "").lower() == "keep-alive"
+    return method, target.split("?", 1)[0], body, keep_alive
+
+
+def write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+
+async def serve_connection(reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except PayloadTooLarge as e:
+                write_response(writer, 413, {"error": str(e)}, False)
+                break
+            except (ValueError, asyncio.LimitOverrunError):
+                write_response(writer, 400, {"error": "请求格式错误"}, False)
+                break
+            if request is None:
+                break
+            method, path, body, keep_alive = request
+            try:
+                if path == "/price/batch":
+                    # 大批量的校验与求值放到线程池，事件循环继续服务其他连接
+                    status, payload = await loop.run_in_executor(None, handle, method, path, body)
+                else:
+                    status, payload = handle(method, path, body)
+            except Exception as e:  # 单个请求出错不影响连接上的其他请求
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run_server(host, port):
+    server = await asyncio.start_server(serve_connection, host, port, backlog=1024)
+    print(f"定价服务已启动: http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="个性化定价 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(run_server(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from batch_pricing import (  # noqa: E402
+    USER_TYPES, SPENDING_LEVELS, DEVICES, ACTIVITY_SCORES, FREQUENCIES, RETURN_RATES,
+    PURCHASE_PERIODS, HISTORY_CATEGORIES,
+)
+from pricing import PRODUCTS  # noqa: E402
+
+
+def random_profile(rng, category):
+    """随机生成 main() 结构的画像 (取值覆盖全部编码表)"""
+    return {
+        "user_type": rng.choice(USER_TYPES),
+        "spending_level_norm": rng.choice(SPENDING_LEVELS),
+        "device": rng.choice(DEVICES),
+        "activity_score": rng.choice(ACTIVITY_SCORES),
+        "frequency": rng.choice(FREQUENCIES),
+        "return_rate": rng.choice(RETURN_RATES),
+        "purchase_period": rng.choice(PURCHASE_PERIODS),
+        "history_categories": [c for c in HISTORY_CATEGORIES if rng.random() < 0.4],
+        "current_category": category,
+        "has_similar_in_cart": rng.random() < 0.3,
+    }
+
+
+@pytest.fixture(scope="session")
+def corpus():
+    """固定种子的 (商品名, 画像) 语料"""
+    rng = random.Random(0)
+    items = []
+    for _ in range(2000):
+        name = rng.choice(list(PRODUCTS))
+        items.append((name, random_profile(rng, PRODUCTS[name]["category"])))
+    return items
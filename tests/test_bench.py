@@ -0,0 +1,36 @@
+"""基准脚本：定价基准不导入 app.py；退步判定需要最小值与中位数同时变慢"""
+
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import bench  # noqa: E402
+
+
+def _results(min_us, median_us):
+    return {"benchmarks": {"x": {"min_us": min_us, "median_us": median_us}}}
+
+
+def test_compare_requires_min_and_median():
+    baseline = _results(1.0, 1.0)
+    assert bench.compare(_results(1.05, 1.05), baseline, 0.10) == []
+    assert bench.compare(_results(1.0, 1.5), baseline, 0.10) == []  # 只有中位数变慢：抖动
+    assert bench.compare(_results(1.5, 1.0), baseline, 0.10) == []
+    assert bench.compare(_results(1.2, 1.3), baseline, 0.10) == ["x"]
+    assert bench.compare(_results(1.2, 1.3), {"benchmarks": {}}, 0.10) == []
+
+
+def test_measure_batches_short_calls():
+    result = bench.measure(lambda: None, 1, 3)
+    assert result["repeat"] == 3 and result["loops"] > 1
+
+
+def test_pricing_benchmarks_do_not_import_app():
+    code = ("import sys; sys.path.insert(0, 'benchmarks'); import bench; "
+            "bench.run_groups(['pricing', 'helpers'], 200, 0, 1); "
+            "assert 'app' not in sys.modules and 'streamlit' not in sys.modules")
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
@@ -0,0 +1,122 @@
+"""bulk_price 的输入解析：中文选项与取值结果一致，非法取值返回 BadRequest，坏行不会中断整个文件"""
+
+import io
+import json
+import sys
+
+import pytest
+
+from bulk_price import OUTPUT_FIELDS, main, parse_record, price_chunk, price_record, read_records
+from pricing import PRODUCTS, calculate_price_logic
+from service import BadRequest
+
+LABELS = {
+    "product": "无线耳机",
+    "user_type": "我是老用户☝🏼",
+    "spending": "3000元以上",
+    "device": "苹果(iPhone)/鸿蒙",
+    "activity": "每天都会看看价格",
+    "frequency": "反复查看(急需)",
+    "return_rate": "没有/几乎不退货",
+    "purchase_period": "平时购买",
+    "history_categories": ["电子产品（电脑、手机、耳机等）"],
+    "has_similar_in_cart": "否",
+}
+
+PROFILE = {
+    "user_type": "loyal",
+    "spending_level_norm": 90,
+    "device": "ios",
+    "activity_score": 80,
+    "frequency": "often",
+    "return_rate": "low",
+    "purchase_period": "normal",
+    "history_categories": ["数码"],
+    "has_similar_in_cart": False,
+}
+
+
+def _expected():
+    return calculate_price_logic(PRODUCTS["无线耳机"]["base"], {**PROFILE, "current_category": "数码"})[0]
+
+
+# ---------- bulk_price ----------
+
+@pytest.mark.parametrize("record", [
+    LABELS,
+    {**PROFILE, "product": "无线耳机"},
+    {**LABELS, "spending": 5000},
+    {**LABELS, "spending": None, "spending_level_norm": 90},
+    {**LABELS, "spending": None, "spending_level_norm": "90"},
+    {**LABELS, "activity": None, "activity_score": "80"},
+])
+def test_bulk_labels_and_codes_agree(record):
+    assert price_record(record)["final_price"] == _expected()
+
+
+def test_bulk_spending_code_is_not_renormalized():
+    profile = parse_record({**LABELS, "spending": None, "spending_level_norm": 50})["profile"]
+    assert profile["spending_level_norm"] == 50
+
+
+@pytest.mark.parametrize("patch", [
+    {"spending": None, "spending_level_norm": 40},
+    {"spending": None, "spending_level_norm": "x"},
+    {"activity": "偶尔"},
+    {"activity": None, "activity_score": 65},
+    {"history_categories": 5},
+    {"history_categories": [["数码"]]},
+    {"history_categories": ["玩具"]},
+    {"user_type": "bogus"},
+    {"user_type": 1},
+    {"has_similar_in_cart": "maybe"},
+    {"current_category": ["数码"], "product": None, "base_price": 100},
+])
+def test_bulk_rejects_invalid_values(patch):
+    with pytest.raises(BadRequest):
+        price_record({**LABELS, **patch})
+
+
+def test_bulk_chunk_reports_and_skips_bad_rows():
+    chunk = [
+        (1, LABELS),
+        (2, {**LABELS, "history_categories": 5}),
+        (3, {"_invalid": "not json"}),
+        (4, {**LABELS, "activity": "bogus"}),
+        (5, {**PROFILE, "product": "运动鞋"}),
+    ]
+    text, errors, count = price_chunk((chunk, "jsonl"))
+    assert count == 2
+    assert [json.loads(line)["line"] for line in text.splitlines()] == [1, 5]
+    assert [e.split(" ")[1] for e in errors] == ["2", "3", "4"]
+
+
+def test_bulk_csv_history_uses_pipe():
+    header = ",".join(k for k in LABELS)
+    row = ",".join(v if not isinstance(v, list) else "服装服饰类|电子产品（电脑、手机、耳机等）" for v in LABELS.values())
+    (_, record), = read_records(io.StringIO(f"{header}\n{row}\n"), "csv")
+    assert parse_record(record)["profile"]["history_categories"] == ["服饰", "数码"]
+
+
+def test_main_reads_stdin_without_closing_it(monkeypatch, tmp_path, capsys):
+    lines = [json.dumps(LABELS, ensure_ascii=False), json.dumps({**LABELS, "activity": "bogus"}, ensure_ascii=False)]
+    stdin = io.TextIOWrapper(io.BytesIO(("\n".join(lines) + "\n").encode("utf-8")), encoding="utf-8")
+    monkeypatch.setattr(sys, "stdin", stdin)
+    output = tmp_path / "out.jsonl"
+    assert main(["-", "--input-format", "jsonl", "--output", str(output), "--quiet"]) == 0
+    assert not sys.stdin.buffer.closed
+    rows = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [row["final_price"] for row in rows] == [_expected()]
+    assert "第 2 行" in capsys.readouterr().err
+
+
+def test_main_csv_file_to_csv(tmp_path):
+    source = tmp_path / "in.csv"
+    header = ",".join(k for k in LABELS)
+    row = ",".join(v if not isinstance(v, list) else v[0] for v in LABELS.values())
+    source.write_text(f"{header}\n{row}\n{row}\n", encoding="utf-8-sig")
+    output = tmp_path / "out.csv"
+    assert main([str(source), "--output", str(output), "--quiet", "--chunk-size", "1", "--workers", "2"]) == 0
+    text = output.read_text(encoding="utf-8").splitlines()
+    assert text[0] == ",".join(OUTPUT_FIELDS)
+    assert [line.split(",")[0] for line in text[1:]] == ["1", "2"]
@@ -0,0 +1,92 @@
+"""列式商品目录：写入后内存映射读回一致，前缀 / 类别 / 关键词查询与逐个扫描的结果相同"""
+
+import numpy as np
+import pytest
+
+from catalog import Catalog, build_arrays, generate_synthetic, write_catalog
+from pricing import PRODUCTS
+
+
+@pytest.fixture(scope="module")
+def columns():
+    names, bases, descs, categories = generate_synthetic(3000, seed=1)
+    # 加入不在历史类别中的类别与多字节字符，覆盖类别词表扩展与 UTF-8 排序
+    names += ["玩具车 🚗", "玩具熊", "Zebra 贴纸"]
+    bases += [59.0, 99.5, 5.0]
+    descs += ["遥控 玩具", "毛绒", "Sticker"]
+    categories += ["玩具", "玩具", "文具"]
+    return names, bases, descs, categories
+
+
+@pytest.fixture(scope="module")
+def catalog(columns, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("catalog") / "catalog")
+    write_catalog(path, *columns)
+    return Catalog.open(path)
+
+
+def _brute_search(columns, query, category=None):
+    names, _, descs, categories = columns
+    terms = query.lower().split()
+    return [i for i, (name, desc, cat) in enumerate(zip(names, descs, categories))
+            if all(term in f"{name} {desc}".lower() for term in terms)
+            and (category is None or cat == category)]
+
+
+def test_roundtrip(catalog, columns):
+    names, bases, descs, categories = columns
+    assert len(catalog) == len(names)
+    assert isinstance(catalog.base, np.memmap)
+    for i in (0, 1, 1234, len(names) - 3, len(names) - 1):
+        assert catalog.name(i) == names[i]
+        assert catalog.desc(i) == descs[i]
+        assert catalog.category_of(i) == categories[i]
+        assert catalog.base_price(i) == bases[i]
+
+
+def test_from_products_matches_dict():
+    catalog = Catalog.from_products(PRODUCTS)
+    assert [catalog.name(i) for i in range(len(catalog))] == list(PRODUCTS)
+    assert [catalog.item(i) for i in range(len(catalog))] == list(PRODUCTS.values())
+
+
+@pytest.mark.parametrize("query", [
+    "", "星河", "耳机 pro", "Pro", "max 星河 #0001", "#00", "咖", "玩具", "🚗", "zebra", "不存在的商品", "经典款无线",
+])
+@pytest.mark.parametrize("category", [None, "数码", "玩具", "未知类别"])
+def test_search_matches_scan(catalog, columns, query, category):
+    assert list(catalog.search(query, category)) == _brute_search(columns, query, category)
+
+
+def test_search_long_term_over_verify_limit(catalog, columns):
+    # 候选数超过 _VERIFY_LIMIT 时走整段扫描分支
+    query = "款 #0"
+    assert len(_brute_search(columns, "#0")) > 512
+    assert list(catalog.search(query)) == _brute_search(columns, query)
+
+
+def test_category_index(catalog, columns):
+    categories = columns[3]
+    for category in set(categories):
+        assert list(catalog.in_category(category)) == [i for i, c in enumerate(categories) if c == category]
+    assert len(catalog.in_category("未知类别")) == 0
+    rule = np.asarray(catalog.rule_categories)
+    assert rule[len(categories) - 3] == -1 and rule[0] >= 0
+
+
+@pytest.mark.parametrize("prefix", ["星河", "星河无线耳机", "玩具", "Z", "不存在", ""])
+def test_prefix_and_find(catalog, columns, prefix):
+    names = columns[0]
+    expected = sorted((i for i, name in enumerate(names) if name.startswith(prefix)),
+                      key=lambda i: names[i].encode("utf-8"))
+    assert list(catalog.with_prefix(prefix)) == expected
+    for i in (0, 2999, len(names) - 1):
+        assert catalog.find(names[i]) == i
+    assert catalog.find("不存在的商品") is None
+
+
+def test_rejects_bad_columns():
+    with pytest.raises(ValueError):
+        build_arrays(["a"], [0.0], [""], ["数码"])
+    with pytest.raises(ValueError):
+        write_catalog("/nonexistent-unused", ["a", "b"], [1.0], ["", ""], ["数码", "数码"])
@@ -0,0 +1,83 @@
+"""反事实探索：每个变体的价格与对改动后的画像逐个标量定价一致"""
+
+import itertools
+import random
+
+import pytest
+
+import counterfactual
+from batch_pricing import (
+    USER_TYPES, DEVICES, FREQUENCIES, RETURN_RATES, PURCHASE_PERIODS, HISTORY_CATEGORIES,
+)
+from conftest import random_profile
+from pricing import PRODUCTS, calculate_price_logic
+
+# 列中存下标的输入 -> 编码表
+_CODE_TABLES = {"user_type": USER_TYPES, "device": DEVICES, "frequency": FREQUENCIES,
+                "return_rate": RETURN_RATES, "purchase_period": PURCHASE_PERIODS}
+
+
+def _apply(profile, variant):
+    """把一组 (输入, 取值) 变化作用到 main() 结构的画像上"""
+    profile = {**profile, "history_categories": list(profile["history_categories"])}
+    for attribute, value in variant:
+        column = counterfactual.ATTRIBUTES[attribute][1]
+        if attribute == "history":
+            category = HISTORY_CATEGORIES[value]
+            history = profile["history_categories"]
+            if category in history:
+                history.remove(category)
+            else:
+                history.append(category)
+        elif column in _CODE_TABLES:
+            profile[column] = _CODE_TABLES[column][value]
+        else:
+            profile[column] = value
+    return profile
+
+
+@pytest.fixture(scope="module")
+def explorations():
+    rng = random.Random(11)
+    result = []
+    for _ in range(8):
+        name = rng.choice(list(PRODUCTS))
+        base, profile = PRODUCTS[name]["base"], random_profile(rng, PRODUCTS[name]["category"])
+        result.append((base, profile, counterfactual.explore(base, profile)))
+    return result
+
+
+def test_variant_prices_match_scalar(explorations):
+    for base, profile, cf in explorations:
+        assert cf.variants[0] == ()
+        for variant, price in zip(cf.variants, cf.prices):
+            assert price == calculate_price_logic(base, _apply(profile, variant))[0]
+
+
+def test_variants_cover_all_single_and_pair_changes(explorations):
+    for _, _, cf in explorations:
+        singles = [v[0] for v in cf.variants if len(v) == 1]
+        pairs = {v for v in cf.variants if len(v) == 2}
+        expected_pairs = {counterfactual._variant((a, b)) for a, b in itertools.combinations(singles, 2)
+                          if a[0] != b[0]}
+        assert pairs == expected_pairs
+        assert len(cf.variants) == 1 + len(singles) + len(pairs)
+        assert len(set(cf.variants)) == len(cf.variants)
+
+
+def test_rows_sorted_by_price(explorations):
+    _, _, cf = explorations[0]
+    rows = cf.rows()
+    assert len(rows) == len(cf.variants) - 1
+    assert [row["新价格"] for row in rows] == sorted(row["新价格"] for row in rows)
+    assert all(row["差价"] == round(row["新价格"] - float(cf.prices[0]), 2) for row in rows)
+
+
+def test_grid_matches_variants(explorations):
+    base, profile, cf = explorations[1]
+    row_labels, column_labels, matrix = cf.grid("user_type", "spending")
+    assert matrix.shape == (len(row_labels), len(column_labels)) == (3, 5)
+    for i, user_type in enumerate(USER_TYPES):
+        for j, spending in enumerate(counterfactual.ATTRIBUTES["spending"][2]):
+            changed = {**profile, "user_type": user_type, "spending_level_norm": spending}
+            assert matrix[i, j] == calculate_price_logic(base, changed)[0]
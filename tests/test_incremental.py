@@ -0,0 +1,89 @@
+"""增量定价：只重算依赖字段变化的规则，扫描与换规则集后结果仍与完整求值一致"""
+
+import copy
+import json
+
+import incremental
+from batch_pricing import SPENDING_LEVELS
+from incremental import IncrementalPricer
+from pricing import calculate_price_logic
+from rules import DEFAULT_RULES_PATH, compile_rules, get_rules
+
+PROFILE = {
+    "user_type": "regular",
+    "spending_level_norm": 50,
+    "device": "android",
+    "activity_score": 50,
+    "frequency": "sometimes",
+    "return_rate": "medium",
+    "purchase_period": "normal",
+    "history_categories": ["服饰"],
+    "current_category": "数码",
+    "has_similar_in_cart": False,
+}
+
+
+def _rules_reading(pricer, field):
+    return {rule_id for rule_id, fields in zip(get_rules().rule_ids, pricer.rule_fields) if field in fields}
+
+
+def test_only_dependent_rules_recompute():
+    pricer = IncrementalPricer()
+    pricer.evaluate(599, PROFILE)
+    first = pricer.stats()
+    assert first["misses"] == sum(1 for fields in pricer.rule_fields if fields)
+
+    pricer.evaluate(599, {**PROFILE, "device": "ios"})
+    stats = pricer.stats()["rules"]
+    recomputed = {rule_id for rule_id, s in stats.items() if s["misses"] == 2}
+    assert recomputed == _rules_reading(pricer, "device")
+
+    # 取值不变时所有规则都命中
+    before = pricer.stats()["misses"]
+    price, factors = pricer.evaluate(599, {**PROFILE, "device": "ios"})
+    assert pricer.stats()["misses"] == before
+    assert (price, factors) == calculate_price_logic(599, {**PROFILE, "device": "ios"})
+
+
+def test_in_place_mutation_is_detected():
+    pricer = IncrementalPricer()
+    profile = dict(PROFILE)
+    pricer.evaluate(599, profile)
+    profile["history_categories"] = []
+    assert pricer.evaluate(599, profile) == calculate_price_logic(599, profile)
+    profile["frequency"] = "rare"
+    assert pricer.evaluate(599, profile) == calculate_price_logic(599, profile)
+
+
+def test_sweep_matches_full_evaluation():
+    pricer = IncrementalPricer()
+    assert pricer.sweep(599, PROFILE, "spending_level_norm", SPENDING_LEVELS) == [
+        calculate_price_logic(599, {**PROFILE, "spending_level_norm": v})[0] for v in SPENDING_LEVELS]
+    bases = [9.9, 299, 599, 1234.5]
+    assert pricer.sweep(None, PROFILE, "base_price", bases) == [
+        calculate_price_logic(b, PROFILE)[0] for b in bases]
+    # 扫描不改动传入的画像
+    assert PROFILE["spending_level_norm"] == 50
+
+
+def test_pinned_rules_and_hot_reload(monkeypatch):
+    with open(DEFAULT_RULES_PATH, encoding="utf-8") as f:
+        spec = json.load(f)
+    changed = copy.deepcopy(spec)
+    changed["rules"][0]["cases"][0]["pct"] = -0.5
+    other = compile_rules(json.dumps(changed, ensure_ascii=False))
+    profile = {**PROFILE, "user_type": "new"}
+
+    pinned = IncrementalPricer(rules=other)
+    assert pinned.evaluate(599, profile) == other.evaluate(599, profile)
+    assert pinned.evaluate(599, profile) != calculate_price_logic(599, profile)
+
+    # 跟随 get_rules() 的定价器在规则集热加载后清空缓存
+    pricer = IncrementalPricer()
+    current = get_rules()
+    assert pricer.evaluate(599, profile) == current.evaluate(599, profile)
+    monkeypatch.setattr(incremental, "get_rules", lambda: other)
+    assert pricer.evaluate(599, profile) == other.evaluate(599, profile)
+    assert pricer.evaluations == 1
+    monkeypatch.setattr(incremental, "get_rules", lambda: current)
+    assert pricer.evaluate(599, profile) == current.evaluate(599, profile)
@@ -0,0 +1,83 @@
+"""用户旅程：报价与标量定价一致；每个用户同时只有一笔待退款，退款金额为对应下单日的成交价"""
+
+import numpy as np
+
+import journey
+from pricing import calculate_price
+
+# 每天全部来访、全部下单、全部在 3 天后退货
+EVERYONE_BUYS = {
+    "visit": {20: 1.0, 50: 1.0, 80: 1.0},
+    "cart": 0.0,
+    "buy": 1.0,
+    "elasticity": 0.0,
+    "return": {"low": 1.0, "medium": 1.0, "high": 1.0},
+    "return_delay": 3,
+}
+
+
+def _cohort(n, behavior=None, seed=0):
+    rng = np.random.default_rng(seed)
+    return journey.new_cohort(n, rng=rng, behavior=behavior), rng
+
+
+def test_quotes_match_scalar_pricing():
+    cohort, rng = _cohort(3000, seed=1)
+    calendar = journey.Calendar(200)
+    for day in range(200):
+        special = bool(calendar.special[day])
+        prices = cohort.quote(special)
+        if day % 50 == 0 or day == 155:
+            for i in range(0, cohort.n, 7):
+                assert prices[i] == calculate_price(cohort.columns["base_price"][i].item(), cohort.profile(i))
+        cohort.step(day, special, prices, rng)
+
+
+def test_pending_refund_is_not_overwritten():
+    cohort, rng = _cohort(500, EVERYONE_BUYS)
+    paid = {}
+    refunded = 0.0
+    for day in range(10):
+        prices = cohort.quote(False)
+        due_before = cohort.return_due.copy()
+        amount_before = cohort.return_amount.copy()
+        events = cohort.step(day, False, prices, rng)
+        paid[day] = prices.copy()
+
+        returning = due_before == day
+        assert events["returns"] == int(returning.sum())
+        # 当天退款的是退货到期用户的原成交价
+        refund = float(amount_before[returning].sum())
+        refunded += refund
+        assert events["revenue"] == float(prices.sum()) - refund
+        # 仍在等待退款的用户：到期日与金额都没有被当天的新订单覆盖
+        pending = due_before > day
+        np.testing.assert_array_equal(cohort.return_due[pending], due_before[pending])
+        np.testing.assert_array_equal(cohort.return_amount[pending], amount_before[pending])
+
+    # 第 0、3、6 天下单的订单分别在第 3、6、9 天退款，其余日期的订单因已有待退款而不会退货
+    np.testing.assert_array_equal(cohort.returns, 3)
+    assert refunded == float(paid[0].sum()) + float(paid[3].sum()) + float(paid[6].sum())
+    np.testing.assert_array_equal(cohort.purchases, 10)
+
+
+def test_profile_evolves_with_purchases():
+    cohort, rng = _cohort(200, EVERYONE_BUYS)
+    assert set(cohort.columns["user_type"]) == {journey.USER_TYPES.index("new")}
+    cohort.step(0, False, cohort.quote(False), rng)
+    assert set(cohort.columns["user_type"]) == {journey.USER_TYPES.index("regular")}
+    for day in range(1, 5):
+        cohort.step(day, False, cohort.quote(False), rng)
+    assert set(cohort.columns["user_type"]) == {journey.USER_TYPES.index("loyal")}
+    assert all(cohort.profile(i)["history_categories"] for i in range(cohort.n))
+
+
+def test_simulation_reproducible(tmp_path):
+    path = tmp_path / "traj.npy"
+    a = journey.simulate_journey(2000, days=40, seed=3, trajectories_path=str(path))
+    b = journey.simulate_journey(2000, days=40, seed=3)
+    assert a.days == b.days
+    np.testing.assert_array_equal(a.trajectories, b.trajectories)
+    written = np.load(path)
+    assert written.shape == (40, 2000)
+    np.testing.assert_array_equal(written[:, :a.trajectories.shape[1]], a.trajectories.astype(np.float32))
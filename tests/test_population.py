@@ -0,0 +1,76 @@
+"""分片模拟：同一分片划分下结果与进程数无关、可复现；默认分片大小按进程数均分。按画像去重计数的加权统计与逐行统计一致"""
+
+import numpy as np
+import pytest
+
+import population
+from batch_pricing import price_columns
+from pricing import PRODUCTS
+
+
+def _assert_same(a, b):
+    assert a.count == b.count
+    np.testing.assert_array_equal(a.sketch.counts, b.sketch.counts)
+    np.testing.assert_array_equal(a.price.count, b.price.count)
+    np.testing.assert_array_equal(a.price.mean, b.price.mean)
+    np.testing.assert_array_equal(a.rule_totals, b.rule_totals)
+
+
+def test_sharded_result_independent_of_workers():
+    serial = population.simulate_sharded(30_000, PRODUCTS, seed=7, workers=1, shard_size=8_000, chunk_size=5_000)
+    parallel = population.simulate_sharded(30_000, PRODUCTS, seed=7, workers=3, shard_size=8_000, chunk_size=5_000)
+    assert serial.count == 30_000
+    _assert_same(serial, parallel)
+
+
+def test_sharded_reproducible_and_seed_dependent():
+    a = population.simulate_sharded(20_000, PRODUCTS, seed=1, workers=1, shard_size=5_000)
+    b = population.simulate_sharded(20_000, PRODUCTS, seed=1, workers=1, shard_size=5_000)
+    c = population.simulate_sharded(20_000, PRODUCTS, seed=2, workers=1, shard_size=5_000)
+    _assert_same(a, b)
+    assert not np.array_equal(a.sketch.counts, c.sketch.counts)
+
+
+def test_shard_sizes():
+    assert population.shard_sizes(10, 4) == [4, 4, 2]
+    assert population.shard_sizes(8, 4) == [4, 4]
+    assert population.shard_sizes(3, 4) == [3]
+
+
+def test_default_shard_size_splits_across_workers():
+    assert population.default_shard_size(1_000_000, 4) == 250_000
+    assert population.default_shard_size(1_000_001, 4) == 250_001
+    assert population.default_shard_size(100_000_000, 32) == population.DEFAULT_SHARD_SIZE
+    assert population.default_shard_size(3, 8) == 1
+    assert len(population.shard_sizes(1_000_000, population.default_shard_size(1_000_000, 4))) == 4
+
+
+def test_zero_product_weights_rejected():
+    with pytest.raises(ValueError):
+        population.simulate_population(100, PRODUCTS, seed=0, product_weights={name: 0 for name in PRODUCTS})
+
+
+def test_weighted_population_matches_rows():
+    rows = population.PopulationStats(PRODUCTS)
+    codes = population.CodePopulation(PRODUCTS)
+    for columns, product in population.sample_chunks(50_000, PRODUCTS, np.random.default_rng(3), chunk_size=20_000):
+        prices, contributions = price_columns({k: columns[k] for k in population._PRICE_ARGS})
+        rows.update(columns, product, prices, contributions)
+        codes.add(columns, product)
+    weighted = codes.stats()
+
+    assert codes.total == rows.count == weighted.count
+    np.testing.assert_array_equal(weighted.sketch.counts, rows.sketch.counts)
+    np.testing.assert_array_equal(weighted.product_sketch.counts, rows.product_sketch.counts)
+    np.testing.assert_array_equal(weighted.price.count, rows.price.count)
+    np.testing.assert_allclose(weighted.price.mean, rows.price.mean, rtol=1e-12)
+    np.testing.assert_allclose(weighted.diff_pct.std, rows.diff_pct.std, rtol=1e-9)
+    np.testing.assert_allclose(weighted.rule_totals, rows.rule_totals, rtol=1e-9)
+
+
+@pytest.mark.parametrize("max_cells", [None, 1])
+def test_sample_population_counts(max_cells):
+    options = {} if max_cells is None else {"max_cells": max_cells}
+    sampled = population.sample_population(20_000, PRODUCTS, np.random.default_rng(0), **options)
+    assert sampled.total == 20_000
+    assert np.all(np.diff(sampled.keys) > 0)
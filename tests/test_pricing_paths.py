@@ -0,0 +1,98 @@
+"""各条定价路径 (标量规则链、批量、价格表、增量、单画像 × 多商品、画像编码) 在抽样画像上结果一致"""
+
+import random
+
+import numpy as np
+
+from batch_pricing import (
+    category_code, decode_profile_code, encode_profile_code, encode_profiles, pack_columns,
+    price_columns, unpack_columns,
+)
+from conftest import random_profile
+from incremental import IncrementalPricer
+from price_table import PriceTable, build_table
+from pricing import PRODUCTS, calculate_price, calculate_price_logic
+from rules import get_rules
+
+
+def _factors(factors):
+    return [factor.as_dict() for factor in factors]
+
+
+def test_price_only_matches_scalar(corpus):
+    for name, profile in corpus:
+        base = PRODUCTS[name]["base"]
+        assert calculate_price(base, profile) == calculate_price_logic(base, profile)[0]
+
+
+def test_batch_matches_scalar(corpus):
+    bases = [PRODUCTS[name]["base"] for name, _ in corpus]
+    prices, contributions = price_columns(encode_profiles([p for _, p in corpus], bases))
+    expected = [calculate_price_logic(base, p)[0] for base, (_, p) in zip(bases, corpus)]
+    assert prices.tolist() == expected
+    assert contributions.shape == (len(corpus), len(get_rules().rule_ids))
+
+
+def test_batch_matches_scalar_for_unknown_category():
+    rng = random.Random(1)
+    profiles = [random_profile(rng, "玩具") for _ in range(300)]
+    bases = [rng.choice([9.9, 59, 1234.5]) for _ in profiles]
+    prices, _ = price_columns(encode_profiles(profiles, bases))
+    assert prices.tolist() == [calculate_price_logic(b, p)[0] for b, p in zip(bases, profiles)]
+
+
+def test_price_table_matches_scalar(corpus):
+    table = PriceTable(build_table(PRODUCTS), list(PRODUCTS))
+    for name, profile in corpus:
+        assert table.lookup(profile, name) == calculate_price_logic(PRODUCTS[name]["base"], profile)[0]
+
+
+def test_price_table_misses_outside_grid(corpus):
+    table = PriceTable(build_table(PRODUCTS), list(PRODUCTS))
+    name, profile = corpus[0]
+    assert table.lookup({**profile, "spending_level_norm": 40}, name) is None
+    assert table.lookup(profile, "不存在的商品") is None
+
+
+def test_incremental_matches_scalar(corpus):
+    pricer = IncrementalPricer()
+    rng = random.Random(2)
+    name, profile = corpus[0]
+    for other_name, other in corpus[:500]:
+        # 大多数步骤只改一个字段 (与界面上的操作一致)，偶尔整份换掉
+        if rng.random() < 0.2:
+            name, profile = other_name, dict(other)
+        else:
+            field = rng.choice([f for f in other if f != "current_category"])
+            profile = {**profile, field: other[field]}
+        base = PRODUCTS[name]["base"]
+        price, factors = pricer.evaluate(base, profile)
+        expected_price, expected_factors = calculate_price_logic(base, profile)
+        assert price == expected_price
+        assert _factors(factors) == _factors(expected_factors)
+
+
+def test_price_profile_matches_scalar(corpus):
+    names = list(PRODUCTS)
+    bases = np.array([PRODUCTS[n]["base"] for n in names], dtype=np.float64)
+    categories = np.array([category_code(PRODUCTS[n]["category"]) for n in names])
+    for _, profile in corpus[:300]:
+        final, _, _ = get_rules().price_profile(profile, bases, categories)
+        expected = [calculate_price_logic(PRODUCTS[n]["base"], {**profile, "current_category": PRODUCTS[n]["category"]})[0]
+                    for n in names]
+        assert final.tolist() == expected
+
+
+def test_profile_code_roundtrip(corpus):
+    for _, profile in corpus:
+        assert decode_profile_code(encode_profile_code(profile)) == profile
+
+
+def test_packed_columns_roundtrip_and_price(corpus):
+    bases = [PRODUCTS[name]["base"] for name, _ in corpus]
+    columns = encode_profiles([p for _, p in corpus], bases)
+    unpacked = unpack_columns(pack_columns(columns), columns["base_price"])
+    for field, values in columns.items():
+        np.testing.assert_array_equal(unpacked[field], values)
+        assert unpacked[field].dtype == values.dtype
+    np.testing.assert_array_equal(price_columns(unpacked)[0], price_columns(columns)[0])
@@ -0,0 +1,70 @@
+"""增量最小二乘：分块累加与一次性求解一致，并能从模拟价格中还原定价规则的系数"""
+
+import numpy as np
+import pytest
+
+import regression
+from regression import FEATURES, OnlineOLS
+
+
+def test_chunked_update_matches_lstsq():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, 6))
+    beta = np.array([1.5, -2.0, 0.0, 3.25, 0.5, -0.75])
+    y = X @ beta + rng.normal(scale=0.1, size=5000)
+
+    whole = OnlineOLS(6)
+    whole.update(X, y)
+    left, right = OnlineOLS(6), OnlineOLS(6)
+    for start in range(0, 3000, 700):
+        left.update(X[start:min(start + 700, 3000)], y[start:min(start + 700, 3000)])
+    right.update(X[3000:], y[3000:])
+    left.merge(right)
+
+    expected = np.linalg.lstsq(X, y, rcond=None)[0]
+    for ols in (whole, left):
+        assert ols.n == 5000
+        estimate, cov, sigma2 = ols.solve()
+        np.testing.assert_allclose(estimate, expected, rtol=1e-9, atol=1e-12)
+        assert sigma2 == pytest.approx(0.01, rel=0.1)
+        assert np.all(np.abs(estimate - beta) < 4 * np.sqrt(np.diag(cov)))
+
+
+def test_missing_feature_uses_pseudo_inverse():
+    rng = np.random.default_rng(1)
+    X = np.column_stack([np.ones(100), rng.normal(size=100), np.zeros(100)])
+    ols = OnlineOLS(3)
+    ols.update(X, 2 + 3 * X[:, 1])
+    estimate, _, _ = ols.solve()
+    np.testing.assert_allclose(estimate, [2, 3, 0], atol=1e-9)
+    assert ols.r_squared(float((2 + 3 * X[:, 1]).sum())) == pytest.approx(1.0)
+
+
+# (特征, 单位) -> pricing_rules.json 中的真实效应
+TRUE_EFFECTS = {
+    ("新用户", "%"): -15.0,
+    ("老用户", "%"): 5.0,
+    ("苹果/鸿蒙设备", "%"): 5.0,
+    ("苹果/鸿蒙设备 × 月消费 3000元以上", "%"): 7.0,
+    ("低活跃", "%"): -3.0,
+    ("高活跃", "%"): 2.0,
+    ("反复查看", "%"): 8.0,
+    ("大促期间", "%"): -10.0,
+    ("第一次点开", "元"): -30.0,
+    ("几乎不退货", "元"): -5.0,
+    ("大促期间 × 几乎不退货", "元"): 5.0,
+    ("购物车有相似商品", "元"): 5.0,
+}
+
+
+def test_recovers_rule_coefficients():
+    ols = y_sum = None
+    for ols, y_sum in regression.fit_stream(150_000, seed=0, chunk_size=50_000):
+        pass
+    assert ols.n == 150_000
+    rows = {(row["特征"], row["单位"]): row for row in ols.summary()}
+    assert len(rows) == len(FEATURES)
+    for key, truth in TRUE_EFFECTS.items():
+        tolerance = 0.05 if key[1] == "%" else 0.5
+        assert rows[key]["估计值"] == pytest.approx(truth, abs=tolerance), key
+    assert ols.r_squared(y_sum) > 0.999
@@ -0,0 +1,83 @@
+"""共享结果缓存：LRU 淘汰顺序、计数器、并发写入先到者胜出，缓存键与历史类别顺序无关"""
+
+import threading
+
+import metrics
+import result_cache
+from result_cache import LRUCache, PricedResult, profile_key
+
+PROFILE = {
+    "user_type": "regular", "spending_level_norm": 50, "device": "ios", "activity_score": 50,
+    "frequency": "often", "return_rate": "low", "purchase_period": "normal",
+    "history_categories": ["数码", "服饰"], "current_category": "数码", "has_similar_in_cart": False,
+}
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    assert cache.get("a") == "A"  # a 变为最近使用
+    cache.put("d", "D")
+    assert cache.get("b") is None
+    assert [cache.get(k) for k in "acd"] == ["A", "C", "D"]
+    assert len(cache) == 3
+    assert cache.stats() == {"size": 3, "maxsize": 3, "hits": 4, "misses": 1, "evictions": 1, "hit_rate": 0.8}
+
+
+def test_put_keeps_first_value_and_refreshes_order():
+    cache = LRUCache(maxsize=2)
+    first = cache.put("a", object())
+    assert cache.put("a", object()) is first
+    cache.put("b", 1)
+    cache.put("a", 2)  # 已存在：不覆盖，但变为最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") is first
+
+
+def test_get_or_compute_counts_and_clear():
+    cache = LRUCache(maxsize=8)
+    calls = []
+    assert cache.get_or_compute("k", lambda: calls.append(1) or "v") == "v"
+    assert cache.get_or_compute("k", lambda: calls.append(1) or "w") == "v"
+    assert calls == [1]
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.clear()
+    assert len(cache) == 0 and cache.get("k") is None
+
+
+def test_concurrent_misses_share_one_object():
+    cache = LRUCache(maxsize=64)
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def worker():
+        barrier.wait()
+        seen.append(cache.get_or_compute("key", lambda: PricedResult(1.0, None)))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(value) for value in seen}) == 1
+    assert cache.hits + cache.misses == 8 and len(cache) == 1
+
+
+def test_profile_key_normalizes_history_order():
+    reordered = {**PROFILE, "history_categories": ["服饰", "数码"]}
+    assert profile_key(PROFILE, "无线耳机", 599, "d1") == profile_key(reordered, "无线耳机", 599, "d1")
+    assert profile_key(PROFILE, "无线耳机", 599, "d1") != profile_key(PROFILE, "无线耳机", 599, "d2")
+    assert profile_key(PROFILE, "无线耳机", 599, "d1") != profile_key({**PROFILE, "device": "android"},
+                                                                       "无线耳机", 599, "d1")
+
+
+def test_counters_exported_to_prometheus(monkeypatch):
+    cache = LRUCache(maxsize=1)
+    monkeypatch.setattr(result_cache, "RESULTS", cache)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("b")
+    text = metrics.render_prometheus()
+    assert "price_sim_result_cache_evictions_total 1" in text
+    assert "price_sim_result_cache_hits_total 1" in text
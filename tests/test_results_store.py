@@ -0,0 +1,178 @@
+"""结果存储：写入后内存映射读回与写入一致，筛选 / 分组聚合 / 直方图 / 抽样与逐行计算一致"""
+
+import os
+
+import numpy as np
+import pytest
+
+import population
+from batch_pricing import price_batch
+from pricing import PRODUCTS
+from results_store import COLUMNS, SEGMENTS, PartWriter, Run, RunWriter, list_runs, run_metadata
+from rules import get_rules
+
+
+def _random_chunk(rng, n):
+    """按各维度的编码表随机生成一块行 (其余列取小整数即可)"""
+    chunk = {name: rng.integers(0, 3, n).astype(dtype) for name, dtype in COLUMNS.items()}
+    for column, labels in SEGMENTS.values():
+        chunk[column] = rng.choice(list(labels), n).astype(COLUMNS[column])
+    chunk["has_similar_in_cart"] = rng.random(n) < 0.3
+    chunk["base_price"] = rng.choice([99.0, 599.0, 1299.0], n)
+    chunk["price"] = chunk["base_price"] * rng.uniform(0.7, 1.3, n)
+    return chunk
+
+
+def _concat(chunks):
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
+
+
+@pytest.fixture
+def written(tmp_path):
+    """两个分片 (第二个分片分两块追加) 写入一次运行，返回 (路径, 写入的全部行)"""
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / "run")
+    chunks = [_random_chunk(rng, n) for n in (500, 300, 200)]
+    with RunWriter(path, run_metadata(get_rules(), PRODUCTS, 0, kind="test")) as store:
+        with store.part(0) as part:
+            part.append(chunks[0])
+        with store.part(1) as part:
+            part.append(chunks[1])
+            part.append(chunks[2])
+    return path, _concat(chunks)
+
+
+def _pct(rows):
+    return (rows["price"] - rows["base_price"]) / rows["base_price"] * 100
+
+
+def test_round_trip(written):
+    path, rows = written
+    run = Run.open(path)
+    assert len(run) == 1000
+    assert [part["rows"] for part in run.meta["parts"]] == [500, 500]
+    assert run.metadata["kind"] == "test"
+    assert run.metadata["rules_digest"] == get_rules().digest
+    assert run.metadata["products"] == list(PRODUCTS)
+    assert isinstance(run.parts[0]["price"], np.memmap)
+
+    read = {name: [] for name in COLUMNS}
+    for chunk in run.chunks(list(COLUMNS), chunk_rows=128):
+        for name in COLUMNS:
+            read[name].append(np.asarray(chunk[name]))
+    for name, dtype in COLUMNS.items():
+        values = np.concatenate(read[name])
+        assert values.dtype == np.dtype(dtype)
+        np.testing.assert_array_equal(values, rows[name])
+
+
+def test_aggregate_matches_rows(written):
+    path, rows = written
+    run = Run.open(path)
+    column, labels = SEGMENTS["category"]
+    pct = _pct(rows)
+    result = {row["分组"]: row for row in run.aggregate("category", chunk_rows=128)}
+    assert set(result) == {labels[code] for code in np.unique(rows[column])}
+    for code in np.unique(rows[column]):
+        mask = rows[column] == code
+        row = result[labels[code]]
+        assert row["人数"] == mask.sum()
+        assert row["平均价格"] == pytest.approx(rows["price"][mask].mean())
+        assert row["平均差异%"] == pytest.approx(pct[mask].mean())
+        assert row["差异%标准差"] == pytest.approx(pct[mask].std(ddof=1))
+        assert row["加价占比%"] == pytest.approx((pct[mask] > 0).mean() * 100)
+
+
+def test_filters(written):
+    path, rows = written
+    run = Run.open(path)
+    devices = SEGMENTS["device"][1]
+    keep = [devices[1]]
+    mask = (rows["device"] == 1) & (rows["user_type"] == 1)
+    filters = {"device": keep, "user_type": [SEGMENTS["user_type"][1][1]], "category": []}
+
+    chunks = list(run.filtered_chunks(("price",), filters, chunk_rows=128))
+    np.testing.assert_array_equal(np.concatenate([c["price"] for c in chunks]), rows["price"][mask])
+    assert sum(row["人数"] for row in run.aggregate("device", filters)) == mask.sum()
+    assert run.segment_values("device") == [devices[code] for code in sorted(np.unique(rows["device"]))]
+
+
+def test_histogram(written):
+    path, rows = written
+    run = Run.open(path)
+    edges, counts = run.histogram(lo=-50.0, hi=50.0, resolution=5.0, chunk_rows=128)
+    assert len(edges) == 20 and edges[0] == -50.0
+    expected = np.clip(np.floor((_pct(rows) + 50) / 5).astype(int), 0, 19)
+    np.testing.assert_array_equal(counts[""], np.bincount(expected, minlength=20))
+
+    _, by_device = run.histogram(by="device", lo=-50.0, hi=50.0, resolution=5.0)
+    labels = SEGMENTS["device"][1]
+    for code in np.unique(rows["device"]):
+        assert by_device[labels[code]].sum() == (rows["device"] == code).sum()
+
+
+def test_sample(written):
+    path, rows = written
+    run = Run.open(path)
+    sample = run.sample(["price", "device"], 100, seed=3, chunk_rows=64)
+    assert len(sample["price"]) == 100
+    # 抽样保持原顺序，且每一行都来自原结果
+    positions = np.searchsorted(rows["price"], sample["price"], sorter=np.argsort(rows["price"]))
+    order = np.argsort(rows["price"])[positions]
+    assert np.all(np.diff(order) > 0)
+    np.testing.assert_array_equal(rows["device"][order], sample["device"])
+    np.testing.assert_array_equal(run.sample(["price"], 100, seed=3, chunk_rows=64)["price"], sample["price"])
+
+    everything = run.sample(["price"], 5000)
+    np.testing.assert_array_equal(everything["price"], rows["price"])
+
+
+def test_abort_and_failed_run_leave_no_result(tmp_path):
+    path = str(tmp_path / "run")
+    store = RunWriter(path, {})
+    with store.part(0) as part:
+        part.append(_random_chunk(np.random.default_rng(0), 10))
+    store.abort()
+    assert not os.path.exists(path) and not os.path.exists(store.staging)
+
+    with pytest.raises(RuntimeError):
+        with RunWriter(path, {}) as store:
+            raise RuntimeError
+    assert not os.path.exists(path) and list_runs(str(tmp_path)) == []
+
+
+def test_rewrite_replaces_run_and_list_runs(written, tmp_path):
+    path, _ = written
+    with RunWriter(path, {"kind": "second"}) as store:
+        with store.part(0) as part:
+            part.append(_random_chunk(np.random.default_rng(1), 7))
+    run = Run.open(path)
+    assert len(run) == 7 and run.metadata == {"kind": "second"}
+    assert list_runs(str(tmp_path)) == [path]
+    assert list_runs(str(tmp_path / "missing")) == []
+
+
+def test_part_writer_rejects_ragged_columns(tmp_path):
+    chunk = _random_chunk(np.random.default_rng(0), 5)
+    chunk["price"] = chunk["price"][:3]
+    with PartWriter(str(tmp_path / "part")) as part:
+        with pytest.raises(ValueError):
+            part.append(chunk)
+
+
+def test_population_store_matches_stats(tmp_path):
+    """分片模拟写入的逐行结果：行数与统计量一致，读回的画像列重新定价得到写入的价格"""
+    path = str(tmp_path / "run")
+    with RunWriter(path, run_metadata(get_rules(), PRODUCTS, 5)) as store:
+        stats = population.simulate_sharded(12_000, PRODUCTS, seed=5, workers=1, shard_size=5_000,
+                                            chunk_size=2_000, store=store)
+    run = Run.open(path)
+    assert len(run) == stats.count == 12_000
+    assert len(run.meta["parts"]) == 3
+
+    bases = np.array([PRODUCTS[name]["base"] for name in PRODUCTS], dtype=float)
+    args = [name for name in COLUMNS if name not in ("product", "price")]
+    for chunk in run.chunks(list(COLUMNS), chunk_rows=4_000):
+        np.testing.assert_array_equal(chunk["base_price"], bases[chunk["product"]])
+        prices, _ = price_batch(**{name: np.asarray(chunk[name]) for name in args}, with_contributions=False)
+        np.testing.assert_array_equal(prices, chunk["price"])
@@ -0,0 +1,93 @@
+"""规则文件：格式错误一律报 RuleError，热加载遇到错误文件时保留旧规则"""
+
+import copy
+import json
+import os
+
+import pytest
+
+import rules
+from rules import RuleError, compile_rules
+
+with open(rules.DEFAULT_RULES_PATH, encoding="utf-8") as f:
+    SPEC = json.load(f)
+
+
+def _with_case(patch, rule_patch=None):
+    spec = copy.deepcopy(SPEC)
+    spec["rules"][0]["cases"][0].update(patch)
+    spec["rules"][0].update(rule_patch or {})
+    return json.dumps(spec, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("patch", [
+    {"pct": "abc"},
+    {"pct": True},
+    {"pct": float("nan")},
+    {"fixed": [1]},
+    {"name": 5},
+    {"type": "打折"},
+    {"when": ["user_type"]},
+    {"when": {"user_type": {"like": "new"}}},
+    {"when": {"user_type": {"in": "new"}}},
+    {"when": {"spending_level_norm": {"gt": "80"}}},
+    {"when": {"user_type": {"a": 1}}},
+    {"when": {"vip": True}},
+])
+def test_bad_case_raises_rule_error(patch):
+    with pytest.raises(RuleError):
+        compile_rules(_with_case(patch))
+
+
+@pytest.mark.parametrize("rule_id", ["1st", "user type", "a\nb", "x; import os", ""])
+def test_bad_rule_id_raises_rule_error(rule_id):
+    with pytest.raises(RuleError):
+        compile_rules(_with_case({}, {"id": rule_id}))
+
+
+@pytest.mark.parametrize("text", [
+    "not json",
+    json.dumps({"rules": []}),
+    json.dumps({"rules": [{"id": "a", "cases": ["x"]}]}),
+    json.dumps({"rules": [{"id": "a", "cases": [{"name": "n", "type": "中性"}]}] * 2}),
+])
+def test_bad_file_raises_rule_error(text):
+    with pytest.raises(RuleError):
+        compile_rules(text)
+
+
+def test_title_cannot_escape_comment():
+    title = "标题\r    current_price += 1000 x"
+    compiled = compile_rules(_with_case({}, {"title": title}))
+    reference = compile_rules(json.dumps(SPEC, ensure_ascii=False))
+    profile = {"user_type": "new", "spending_level_norm": 50, "device": "ios", "activity_score": 50,
+               "frequency": "often", "return_rate": "low", "purchase_period": "normal",
+               "history_categories": [], "current_category": "数码"}
+    assert compiled.evaluate(100, profile) == reference.evaluate(100, profile)
+    assert compiled.price_only(100, profile) == reference.price_only(100, profile)
+
+
+def test_hot_reload_keeps_old_rules_on_bad_file(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(SPEC, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(rules, "RELOAD_CHECK_INTERVAL", 0.0)
+    monkeypatch.setitem(rules._state, "path", str(path))
+    monkeypatch.setitem(rules._state, "rules", None)
+    monkeypatch.setitem(rules._state, "mtime", None)
+    good = rules.get_rules()
+
+    for bad in (_with_case({"pct": "abc"}), _with_case({}, {"cases": [1]}), "{"):
+        path.write_text(bad, encoding="utf-8")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+        with pytest.warns(UserWarning):
+            assert rules.get_rules() is good
+
+
+def test_first_load_of_bad_file_raises(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    path.write_text(_with_case({"pct": "abc"}), encoding="utf-8")
+    monkeypatch.setitem(rules._state, "path", str(path))
+    monkeypatch.setitem(rules._state, "rules", None)
+    monkeypatch.setitem(rules._state, "mtime", None)
+    with pytest.raises(RuleError):
+        rules.get_rules()
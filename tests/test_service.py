@@ -0,0 +1,121 @@
+"""定价服务：输入校验返回 400，批量接口与逐项定价结果相同 (含因素明细)"""
+
+import asyncio
+import json
+import random
+
+import pytest
+
+from conftest import random_profile
+from pricing import PRODUCTS, calculate_price_logic
+from service import handle, price_item, price_items, serve_connection
+
+PROFILE = {
+    "user_type": "loyal",
+    "spending_level_norm": 90,
+    "device": "ios",
+    "activity_score": 80,
+    "frequency": "often",
+    "return_rate": "low",
+    "purchase_period": "normal",
+    "history_categories": ["数码"],
+    "has_similar_in_cart": False,
+}
+
+
+def _expected():
+    return calculate_price_logic(PRODUCTS["无线耳机"]["base"], {**PROFILE, "current_category": "数码"})[0]
+
+
+def _post(path, payload):
+    return handle("POST", path, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def test_prices_valid_profile():
+    status, body = _post("/price", {"product": "无线耳机", "profile": PROFILE})
+    assert status == 200
+    assert body["final_price"] == _expected()
+
+
+@pytest.mark.parametrize("patch", [
+    {"spending_level_norm": "x"},
+    {"spending_level_norm": 40},
+    {"spending_level_norm": True},
+    {"user_type": "bogus"},
+    {"device": None},
+    {"activity_score": 65},
+    {"history_categories": 5},
+    {"history_categories": ["玩具"]},
+    {"has_similar_in_cart": "yes"},
+])
+def test_rejects_invalid_values(patch):
+    status, body = _post("/price", {"product": "无线耳机", "profile": {**PROFILE, **patch}})
+    assert status == 400
+    assert "error" in body
+
+
+@pytest.mark.parametrize("base_price", [0, -5, True, "100", float("nan"), float("inf")])
+def test_rejects_invalid_base_price(base_price):
+    body = json.dumps({"product": "无线耳机", "base_price": base_price, "profile": PROFILE}).encode()
+    assert handle("POST", "/price", body)[0] == 400
+
+
+def test_requires_fields_and_product():
+    profile = dict(PROFILE)
+    del profile["device"]
+    assert _post("/price", {"product": "无线耳机", "profile": profile})[0] == 400
+    assert _post("/price", {"product": "不存在", "profile": PROFILE})[0] == 400
+    assert _post("/price", {"base_price": 100, "profile": PROFILE})[0] == 400
+    assert _post("/price", {"base_price": 100, "profile": {**PROFILE, "current_category": "玩具"}})[0] == 200
+
+
+def test_price_item_normalizes_numeric_codes():
+    result = price_item({"product": "无线耳机", "profile": {**PROFILE, "spending_level_norm": 90.0}})
+    assert result["final_price"] == _expected()
+
+
+def test_batch_matches_single_items():
+    rng = random.Random(4)
+    items = []
+    for _ in range(500):
+        name = rng.choice(list(PRODUCTS))
+        item = {"product": name, "profile": random_profile(rng, PRODUCTS[name]["category"])}
+        if rng.random() < 0.2:
+            item["base_price"] = rng.choice([1, 9.9, 499.5, 12_345])
+        items.append(item)
+    batch = price_items(items)
+    single = [price_item(item) for item in items]
+    # 序列化后逐字节相同 (因素金额的 int / float 类型也一致)
+    assert json.dumps(batch, ensure_ascii=False) == json.dumps(single, ensure_ascii=False)
+
+
+def test_batch_fails_whole_request_on_bad_item():
+    good = {"product": "无线耳机", "profile": PROFILE}
+    bad = {"product": "无线耳机", "profile": {**PROFILE, "user_type": "bogus"}}
+    status, body = _post("/price/batch", {"items": [good, good]})
+    assert status == 200 and len(body["results"]) == 2
+    assert _post("/price/batch", {"items": [good, bad]})[0] == 400
+    assert _post("/price/batch", {"items": []}) == (200, {"results": []})
+
+
+def test_keep_alive_connection_serves_batch_and_single():
+    async def run():
+        server = await asyncio.start_server(serve_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+        for path, payload in (("/price/batch", {"items": [{"product": "无线耳机", "profile": PROFILE}] * 50}),
+                              ("/price", {"product": "无线耳机", "profile": PROFILE})):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+            responses.append((head.split(b" ")[1], json.loads(await reader.readexactly(length))))
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    (batch_status, batch), (single_status, single) = asyncio.run(run())
+    assert batch_status == single_status == b"200"
+    assert batch["results"][0] == single
@@ -0,0 +1,88 @@
+"""规则调优：合并后的市场与逐组合定价一致；展示与写回的规则文件都来自构建市场时的规则集"""
+
+import json
+
+import numpy as np
+import pytest
+
+import rules
+import tuning
+from population import sample_population
+from pricing import PRODUCTS
+from rules import compile_rules, get_rules
+
+
+@pytest.fixture(scope="module")
+def custom_rules():
+    """与默认规则不同的规则集：标题加前缀，第一个 pct 参数翻倍"""
+    with open(rules.DEFAULT_RULES_PATH, encoding="utf-8") as f:
+        spec = json.load(f)
+    spec["version"] = "test-custom"
+    for rule in spec["rules"]:
+        rule["title"] = "自定义·" + rule.get("title", rule["id"])
+    case = next(case for rule in spec["rules"] for case in rule["cases"] if "pct" in case)
+    case["pct"] *= 2
+    return compile_rules(json.dumps(spec, ensure_ascii=False))
+
+
+@pytest.fixture(scope="module")
+def market(custom_rules):
+    return tuning.build_market(20_000, PRODUCTS, seed=3, rules=custom_rules)
+
+
+def test_market_keeps_its_rules(market, custom_rules):
+    assert market.rules is custom_rules
+    assert market.rules.digest != get_rules().digest
+    assert [p.value for p in market.params] == [p.value for p in tuning.parameters(custom_rules)]
+
+
+def test_market_prices_match_rules(market, custom_rules):
+    """θ 取当前规则时，各组价格之和与逐组合按规则定价的结果一致"""
+    rng = np.random.default_rng(3)
+    population = sample_population(20_000, PRODUCTS, rng)
+    columns, _, counts = next(population.chunks(chunk_size=len(population)))
+    prices, _ = custom_rules.evaluate_batch(columns, with_contributions=False)
+
+    assert market.users == counts.sum() == 20_000
+    assert len(market) <= len(population)
+    current = np.array([p.value for p in market.params])
+    grouped = market.base + market.design @ current
+    assert market.weights @ np.round(grouped, 2) == pytest.approx(counts @ prices, rel=1e-9)
+
+    revenue = market.evaluate(current)["revenue"][0]
+    assert 0 < revenue < counts @ prices
+
+
+def test_rows_and_spec_use_market_rules(market, custom_rules):
+    result = tuning.optimize(market, "profit", samples=64, rounds=1, seed=0)
+    titles = {rule["title"] for rule in custom_rules.rules}
+    rows = result.rows()
+    assert len(rows) == len(market.params)
+    assert all(row["规则"] in titles for row in rows)
+    assert rows[0]["当前值"] == pytest.approx(market.params[0].value * (100 if market.params[0].kind == "pct" else 1))
+
+    assert result.metrics["best"]["profit"] >= result.metrics["current"]["profit"]
+    spec = tuning.tuned_spec(market.rules, market.params, result.best)
+    assert spec["version"] == "test-custom"
+    assert [rule["title"] for rule in spec["rules"]] == [rule["title"] for rule in custom_rules.rules]
+    # 写回的规则文件能重新编译，参数取值为最优值
+    tuned = compile_rules(json.dumps(spec, ensure_ascii=False))
+    for param, value in zip(tuning.parameters(tuned), result.best):
+        assert param.value == pytest.approx(value, abs=0.01)
+
+
+def test_main_writes_spec_from_market_rules(tmp_path, monkeypatch, custom_rules):
+    """命令行 --output 写出的规则文件与构建市场时的规则集对应，而不是重新读取全局规则"""
+    build_market = tuning.build_market
+
+    def build(*args, **kwargs):
+        return build_market(*args, rules=custom_rules, **kwargs)
+
+    monkeypatch.setattr(tuning, "build_market", build)
+    monkeypatch.setattr(tuning, "get_rules", lambda: pytest.fail("不应再读取全局规则"))
+    output = tmp_path / "tuned.json"
+    tuning.main(["--users", "5000", "--samples", "16", "--rounds", "1", "--output", str(output)])
+    with open(output, encoding="utf-8") as f:
+        spec = json.load(f)
+    assert spec["version"] == "test-custom"
+    assert spec["rules"][0]["title"] == custom_rules.rules[0]["title"]
@@ -0,0 +1,346 @@
+"""
+商家视角：在模拟的需求模型下寻找营收 / 利润最优的规则参数
+
+    python tuning.py --users 1000000 --objective profit --output tuned_rules.json
+
+pricing_rules.json 中的加价 / 优惠幅度 (新客 -15%、老客 +5%、iOS +5% / +12%、高频 +8%、大促 -10% ...) 是手工设定的。
+这里给每个用户一个支付意愿 (WTP，相对基准价的对数正态分布，中位数随人群而变)，
+在规则参数空间中搜索使期望营收或利润最大的取值，并报告相应的消费者剩余损失。
+
+目标函数是向量化的：规则命中哪个 case 与效果数值无关，只需对模拟人群求一次；
+模拟人群先按 (商品, 画像) 去重计数，再把 (命中的 case, 商品, 支付意愿分组) 相同的组合合并成带权重的组，
+无论模拟多少用户通常只剩三四万组。每个候选参数下的价格是组上的一次矩阵乘法，
+一批候选并行求值，每个候选耗时在毫秒级。搜索为批量随机搜索 + 逐参数网格细化 (坐标上升)。
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+from batch_pricing import (
+    USER_TYPES, SPENDING_LEVELS, DEVICES, FREQUENCIES, PURCHASE_PERIODS,
+)
+from population import _weight, sample_population
+from pricing import PRODUCTS
+from rules import get_rules
+
+# ==========================================
+# 1. 需求模型与参数空间
+# ==========================================
+
+# 支付意愿中位数 = 基准价 × 各字段系数之积；个体在中位数附近按对数正态分布，sigma 为对数标准差
+DEFAULT_DEMAND = {
+    "sigma": 0.25,
+    "spending_level_norm": {10: 0.8, 30: 0.92, 50: 1.0, 75: 1.1, 90: 1.25},
+    "device": {"android": 1.0, "ios": 1.08},
+    "user_type": {"new": 0.95, "regular": 1.0, "loyal": 1.05},
+    "frequency": {"rare": 0.95, "sometimes": 1.0, "often": 1.12},
+    "purchase_period": {"normal": 1.0, "special": 0.95},
+}
+
+# 影响支付意愿的字段及其取值 (与列数组中的编码顺序一致)
+DEMAND_FIELDS = {
+    "spending_level_norm": SPENDING_LEVELS,
+    "device": DEVICES,
+    "user_type": USER_TYPES,
+    "frequency": FREQUENCIES,
+    "purchase_period": PURCHASE_PERIODS,
+}
+
+# 成本占基准价的比例 (用于利润目标)
+DEFAULT_COST_RATIO = 0.6
+
+# 参数的搜索范围：按基准价百分比 / 固定金额 (元)
+DEFAULT_BOUNDS = {"pct": (-0.3, 0.3), "fixed": (-50.0, 50.0)}
+
+OBJECTIVES = {"revenue": "营收", "profit": "利润"}
+
+
+class Parameter:
+    """一个可调参数：某条规则的某个 case 的 pct 或 fixed"""
+    __slots__ = ("rule", "case", "kind", "name", "value", "lo", "hi")
+
+    def __init__(self, rule, case, kind, name, value, lo, hi):
+        self.rule = rule
+        self.case = case
+        self.kind = kind
+        self.name = name
+        self.value = value
+        self.lo = lo
+        self.hi = hi
+
+
+def parameters(rules, bounds=None):
+    """规则集中全部带 pct / fixed 效果的 case (中性 case 不调)"""
+    bounds = {**DEFAULT_BOUNDS, **(bounds or {})}
+    params = []
+    for j, rule in enumerate(rules.rules):
+        for k, case in enumerate(rule["cases"]):
+            for kind in ("pct", "fixed"):
+                if kind in case:
+                    params.append(Parameter(j, k, kind, case["name"], float(case[kind]), *bounds[kind]))
+    return params
+
+
+def tuned_spec(rules, params, values):
+    """把一组参数取值写回规则定义，返回可保存为 pricing_rules.json 的字典"""
+    spec = {"version": rules.version, "rules": json.loads(json.dumps(rules.rules))}
+    for param, value in zip(params, values):
+        digits = 4 if param.kind == "pct" else 2
+        spec["rules"][param.rule]["cases"][param.case][param.kind] = round(float(value), digits)
+    return spec
+
+
+def _normal_cdf(x):
+    """标准正态分布函数 (Abramowitz & Stegun 7.1.26，误差 < 1.5e-7)"""
+    z = np.abs(x) * (1 / math.sqrt(2))
+    t = 1 / (1 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    np.square(z, out=z)
+    np.negative(z, out=z)
+    np.exp(z, out=z)
+    poly *= z
+    # Φ(x) = 1 - poly/2 (x ≥ 0)，Φ(x) = poly/2 (x < 0)
+    poly *= 0.5
+    return np.where(x >= 0, 1 - poly, poly)
+
+
+# ==========================================
+# 2. 压缩后的市场
+# ==========================================
+
+class Market:
+    """
+    按 (命中的 case, 商品, 支付意愿分组) 合并后的人群。
+    price(θ) = base + X @ θ，X 的每列对应一个参数：pct 参数为 命中 × 基准价，fixed 参数为 命中 × 1。
+    rules 为构建时使用的规则集，参数下标指向其中的规则与 case；展示与写回规则文件都以它为准，不受热加载影响。
+    """
+
+    def __init__(self, base, wtp, weights, design, params, sigma, cost_ratio, rules):
+        self.base = base
+        self.wtp = wtp
+        self.weights = weights
+        self.design = design
+        self.params = params
+        self.sigma = sigma
+        self.cost = base * cost_ratio
+        self.users = int(weights.sum())
+        self.rules = rules
+
+    def __len__(self):
+        return len(self.weights)
+
+    def evaluate(self, thetas, max_cells=4_000_000):
+        """
+        一批候选参数 (K, P) -> 每个候选的 {"revenue", "profit", "buyers", "surplus"} (各为长度 K 的数组)。
+        候选按块求值，每块的 组数 × 候选数 不超过 max_cells。
+        """
+        thetas = np.atleast_2d(np.asarray(thetas, dtype=np.float64))
+        step = max(1, max_cells // max(len(self), 1))
+        results = {key: np.empty(len(thetas)) for key in ("revenue", "profit", "buyers", "surplus")}
+        sigma = self.sigma
+        base, cost, weights = self.base[:, None], self.cost[:, None], self.weights
+        log_wtp = np.log(self.wtp)[:, None] / sigma
+        wtp_mean = (self.wtp * math.exp(sigma ** 2 / 2))[:, None]
+        for start in range(0, len(thetas), step):
+            stop = start + step
+            prices = self.design @ thetas[start:stop].T
+            prices += base
+            np.round(prices, 2, out=prices)
+            np.maximum(prices, 0.01, out=prices)
+            # P(WTP ≥ p) 与 E[(WTP - p)+]，WTP 为中位数 wtp、对数标准差 sigma 的对数正态
+            z = log_wtp - np.log(prices) / sigma
+            buy = _normal_cdf(z)
+            z += sigma
+            expected = _normal_cdf(z)
+            expected *= wtp_mean
+            sold = prices * buy
+            results["revenue"][start:stop] = weights @ sold
+            results["buyers"][start:stop] = weights @ buy
+            results["profit"][start:stop] = results["revenue"][start:stop] - weights @ (cost * buy)
+            results["surplus"][start:stop] = weights @ (expected - sold)
+        return results
+
+
+def build_market(n_users=1_000_000, products=PRODUCTS, seed=0, rules=None, demand=None, bounds=None,
+                 cost_ratio=DEFAULT_COST_RATIO, marginals=None, history_probs=None, product_weights=None):
+    """模拟 n_users 个用户 (按画像去重计数)，求出每个组合命中的 case 与支付意愿，合并成 Market"""
+    rules = rules or get_rules()
+    demand = {**DEFAULT_DEMAND, **(demand or {})}
+    params = parameters(rules, bounds)
+    rng = np.random.default_rng(seed)
+    # 先按 (商品, 画像) 去重计数，之后的匹配与分组都只在不同组合上进行
+    population = sample_population(n_users, products, rng, marginals, history_probs, product_weights)
+    columns, product, weights = next(population.chunks(chunk_size=max(len(population), 1)))
+    matched = rules.match_cases(columns).astype(np.int64)
+
+    # 支付意愿分组：各字段编码的混合进制
+    segment = np.zeros(len(product), dtype=np.int64)
+    multiplier = np.ones(len(product))
+    for field, values in DEMAND_FIELDS.items():
+        factors = np.array([_weight(demand[field], v) if field in demand else 1.0 for v in values])
+        code = np.searchsorted(values, columns[field]) if field == "spending_level_norm" else columns[field]
+        segment = segment * len(values) + code
+        multiplier *= factors[code]
+
+    # 合并键：支付意愿分组、商品编号，再拼上每条规则的 case 下标 (+1，位宽按该规则的 case 数确定)
+    key = segment * len(products) + product
+    widths = [len(rule["cases"]).bit_length() for rule in rules.rules]
+    used = int(np.prod([len(v) for v in DEMAND_FIELDS.values()]) * len(products) - 1).bit_length()
+    if used + sum(widths) > 63:
+        raise ValueError(f"合并键需要 {used + sum(widths)} 位，超出 int64")
+    for j, width in enumerate(widths):
+        key = (key << width) | (matched[:, j] + 1)
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    counts = np.bincount(inverse, weights=weights, minlength=len(first))
+
+    base = columns["base_price"][first].astype(np.float64)
+    wtp = base * multiplier[first]
+    group_cases = matched[first]
+    design = np.zeros((len(first), len(params)))
+    for p, param in enumerate(params):
+        hit = group_cases[:, param.rule] == param.case
+        design[:, p] = np.where(hit, base if param.kind == "pct" else 1.0, 0.0)
+    return Market(base, wtp, counts, design, params, float(demand["sigma"]), cost_ratio, rules)
+
+
+# ==========================================
+# 3. 搜索
+# ==========================================
+
+class TuningResult:
+    """一次搜索的结果：参数、当前 / 最优 / 统一定价三种情形的指标"""
+
+    def __init__(self, market, objective, current, best, evaluations, elapsed):
+        self.market = market
+        self.objective = objective
+        self.current = current
+        self.best = best
+        self.uniform = np.zeros_like(current)
+        self.evaluations = evaluations
+        self.elapsed = elapsed
+        metrics = market.evaluate(np.vstack([current, best, self.uniform]))
+        self.metrics = {
+            name: {key: float(values[i]) for key, values in metrics.items()}
+            for i, name in enumerate(("current", "best", "uniform"))
+        }
+
+    def surplus_loss(self, reference="uniform"):
+        """最优规则相对参照情形 (默认为不做个性化的统一定价，也可为 "current") 的消费者剩余减少量 (元)"""
+        return self.metrics[reference]["surplus"] - self.metrics["best"]["surplus"]
+
+    def rows(self):
+        """每个参数的当前值与最优值，pct 以百分数展示"""
+        rules = self.market.rules
+        rows = []
+        for param, now, best in zip(self.market.params, self.current, self.best):
+            scale, unit = (100, "%") if param.kind == "pct" else (1, "元")
+            rows.append({
+                "规则": rules.rules[param.rule].get("title", rules.rule_ids[param.rule]),
+                "因素": param.name,
+                "单位": unit,
+                "当前值": now * scale,
+                "最优值": best * scale,
+                "下限": param.lo * scale,
+                "上限": param.hi * scale,
+            })
+        return rows
+
+    def summary_rows(self):
+        labels = {"current": "当前规则", "best": "最优规则", "uniform": "统一定价 (不做个性化)"}
+        users = self.market.users
+        return [{
+            "情形": labels[name],
+            "期望营收": m["revenue"],
+            "期望利润": m["profit"],
+            "购买率%": m["buyers"] / users * 100,
+            "消费者剩余": m["surplus"],
+            "人均消费者剩余": m["surplus"] / users,
+        } for name, m in self.metrics.items()]
+
+
+def optimize(market, objective="profit", samples=2048, rounds=4, grid=21, seed=0):
+    """
+    批量随机搜索 + 逐参数网格细化。
+    随机阶段在参数范围内均匀抽取 samples 个候选 (含当前规则与统一定价) 一批求值；
+    之后每轮对每个参数在当前最优值附近取 grid 个取值，其余参数固定，一批求值后取最好的，
+    每轮网格范围减半。
+    """
+    start = time.perf_counter()
+    params = market.params
+    lo = np.array([p.lo for p in params])
+    hi = np.array([p.hi for p in params])
+    current = np.array([p.value for p in params])
+    rng = np.random.default_rng(seed)
+
+    candidates = np.vstack([current, np.zeros_like(current), lo + rng.random((samples, len(params))) * (hi - lo)])
+    scores = market.evaluate(candidates)[objective]
+    evaluations = len(candidates)
+    best = candidates[int(np.argmax(scores))]
+    best_score = float(scores.max())
+
+    span = hi - lo
+    for _ in range(rounds):
+        for p in range(len(params)):
+            values = np.clip(np.linspace(best[p] - span[p] / 2, best[p] + span[p] / 2, grid), lo[p], hi[p])
+            candidates = np.repeat(best[None, :], grid, axis=0)
+            candidates[:, p] = values
+            scores = market.evaluate(candidates)[objective]
+            evaluations += grid
+            i = int(np.argmax(scores))
+            if scores[i] > best_score:
+                best, best_score = candidates[i], float(scores[i])
+        span = span / 2
+    return TuningResult(market, objective, current, best.copy(), evaluations, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在模拟需求模型下搜索营收 / 利润最优的定价规则参数")
+    parser.add_argument("--users", type=int, default=1_000_000, help="模拟用户数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--objective", choices=tuple(OBJECTIVES), default="profit")
+    parser.add_argument("--cost-ratio", type=float, default=DEFAULT_COST_RATIO, help="成本占基准价的比例")
+    parser.add_argument("--sigma", type=float, default=DEFAULT_DEMAND["sigma"], help="支付意愿的对数标准差")
+    parser.add_argument("--samples", type=int, default=2048, help="随机搜索的候选数")
+    parser.add_argument("--rounds", type=int, default=4, help="网格细化轮数")
+    parser.add_argument("--config", help="JSON 配置，可含 demand / bounds / marginals / history_probs / product_weights")
+    parser.add_argument("--output", help="把最优参数写成规则文件 (与 pricing_rules.json 格式相同)")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = json.load(f)
+
+    start = time.perf_counter()
+    market = build_market(
+        args.users, seed=args.seed, demand={**config.get("demand", {}), "sigma": args.sigma},
+        bounds=config.get("bounds"), cost_ratio=args.cost_ratio, marginals=config.get("marginals"),
+        history_probs=config.get("history_probs"), product_weights=config.get("product_weights"),
+    )
+    built = time.perf_counter() - start
+    result = optimize(market, args.objective, samples=args.samples, rounds=args.rounds, seed=args.seed)
+
+    print(f"{'因素':<20}{'单位':<4}{'当前值':>10}{'最优值':>10}")
+    for row in result.rows():
+        print(f"{row['因素']:<20}{row['单位']:<4}{row['当前值']:>10.2f}{row['最优值']:>10.2f}")
+    print()
+    for row in result.summary_rows():
+        print(f"{row['情形']:<16} 营收 {row['期望营收']:>16,.0f}  利润 {row['期望利润']:>16,.0f}  "
+              f"购买率 {row['购买率%']:6.2f}%  消费者剩余 {row['消费者剩余']:>16,.0f}")
+    print(f"消费者剩余损失：相对统一定价 {result.surplus_loss():,.0f} 元，相对当前规则 {result.surplus_loss('current'):,.0f} 元")
+    print(f"{args.users:,} 用户合并为 {len(market):,} 组 ({built:.2f}s)；"
+          f"求值 {result.evaluations:,} 个候选，用时 {result.elapsed:.2f}s "
+          f"({result.elapsed / result.evaluations * 1000:.2f} ms/候选)", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(tuned_spec(market.rules, market.params, result.best), f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()